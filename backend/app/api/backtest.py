@@ -2,22 +2,40 @@
 回测API路由
 集成crypto_cta模块功能
 """
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Tuple
 import asyncio
 import sys
 import os
 import uuid
+import json
+import base64
+import hashlib
+import time
 import logging
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 import pandas as pd
 import numpy as np
 
+from ..core.config import settings
+from ..database import SessionLocal
+from ..services.backtest_executor import backtest_executor
+from ..services.database_service import db_service
+from ..services.result_cache import backtest_result_cache, make_cache_generation, make_cache_key
+from ..services.result_table import ResultTable
+from ..services.task_events import task_events
+from ..services.task_queue import task_queue
+
+logger = logging.getLogger(__name__)
+
 # 导入现有的crypto_cta模块
 def setup_crypto_cta_imports():
     """设置crypto_cta模块导入路径并验证可用性 - 增强版本"""
-    global CTA_AVAILABLE, fast_calculate_signal_by_one_loop, strategy_evaluate, transfer_equity_curve_to_trade, cal_equity_curve
+    global CTA_AVAILABLE, fast_calculate_signal_by_one_loop, strategy_evaluate, transfer_equity_curve_to_trade, cal_equity_curve, drawdown_analysis, period_return
 
     import logging
     logger = logging.getLogger(__name__)
@@ -109,7 +127,7 @@ def setup_crypto_cta_imports():
             logger.error(f"❌ 导入 cta_core 失败: {e}")
 
         try:
-            from cta_api.statistics import strategy_evaluate, transfer_equity_curve_to_trade
+            from cta_api.statistics import strategy_evaluate, transfer_equity_curve_to_trade, drawdown_analysis, period_return
             logger.info("✅ 成功导入统计模块")
             core_modules_imported += 1
         except Exception as e:
@@ -189,6 +207,8 @@ fast_calculate_signal_by_one_loop = None
 strategy_evaluate = None
 transfer_equity_curve_to_trade = None
 cal_equity_curve = None
+drawdown_analysis = None
+period_return = None
 
 # 执行导入设置
 setup_crypto_cta_imports()
@@ -296,7 +316,14 @@ class MonthlyReturn(BaseModel):
     month: int
     return_value: float
 
+class EquityCurveColumns(BaseModel):
+    """列式资金曲线，timestamp为毫秒时间戳，value为资金（初始资金10000），drawdown为回撤的绝对值"""
+    timestamp: List[int] = []
+    value: List[float] = []
+    drawdown: List[float] = []
+
 class BacktestResult(BaseModel):
+    result_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     task_id: str
     symbol: str
     strategy: str
@@ -321,7 +348,9 @@ class BacktestResult(BaseModel):
     kurtosis: float = 0.0
     var_95: float = 0.0  # Value at Risk 95%
     cvar_95: float = 0.0  # Conditional Value at Risk 95%
-    equity_curve: List[Dict[str, Any]]
+    sequence: Optional[int] = None  # 任务内按完成顺序的序号，即推送的结果摘要的序号(SSE事件id)
+    equity_curve: List[Dict[str, Any]] = []  # 逐行格式的资金曲线，只在接口返回时由equity_curve_columns生成
+    equity_curve_columns: Optional[EquityCurveColumns] = None
     drawdown_periods: List[DrawdownPeriod] = []
     monthly_returns: List[MonthlyReturn] = []
     trade_records: List[TradeRecord] = []
@@ -338,7 +367,7 @@ class BacktestResult(BaseModel):
 
 class BacktestStatus(BaseModel):
     task_id: str
-    status: str  # "pending", "running", "completed", "failed"
+    status: str  # "pending", "running", "completed", "failed", "cancelled"
     progress: float = 0.0
     message: str = ""
     symbols_total: int = 0
@@ -352,12 +381,50 @@ class OptimizationRequest(BaseModel):
     date_start: str = "2021-01-01"
     date_end: str = "2025-01-01"
     rule_type: str = "1H"
+    leverage_rate: float = 1.0
+    c_rate: float = 0.0008  # 手续费
+    slippage: float = 0.001  # 滑点
+
+class BacktestContext(BaseModel):
+    """
+    单次回测（一个交易对）的上下文
+    在数据加载、信号计算、资金曲线和统计之间传递，每次调用各自创建，多个交易对或任务并发回测时互不影响
+    """
+    symbol: str
+    data_source: str = ""
+    time_range_info: Dict[str, Any] = {}  # smart_time_range_filter返回的时间范围信息
+    timings: Dict[str, float] = {}  # 各阶段耗时(秒)
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
 
 # 全局任务管理
 backtest_tasks: Dict[str, BacktestStatus] = {}
+# 重启后恢复的已结束任务，结果在第一次访问时才从数据库载入，{task_id: 任务类型}
+unloaded_results: Dict[str, str] = {}
+_result_loads: Dict[str, asyncio.Task] = {}  # 正在载入结果的任务，同一个任务同时只载入一次
+
+LOCAL_DATA_SOURCE = "本地真实数据文件"
 
-# 全局时间范围信息存储
-_current_time_range_info: Dict[str, Any] = {}
+# 任务结束的状态
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# 每完成一个交易对/参数组合推送的结果摘要字段，资金曲线和交易记录等大字段通过结果接口按需获取
+RESULT_SUMMARY_FIELDS = {"result_id", "symbol", "strategy", "parameters", "final_return", "annual_return", "max_drawdown",
+                         "sharpe_ratio", "win_rate", "total_trades"}
+
+def publish_task_progress(task_id: str, result: Optional["BacktestResult"] = None):
+    """通知推送连接任务进度有变化，有结果时同时推送结果摘要"""
+    if result:
+        result.sequence = task_events.publish(task_id, result.model_dump(mode="json", include=RESULT_SUMMARY_FIELDS))
+    else:
+        task_events.notify(task_id)
 
 def smart_time_range_filter(df: pd.DataFrame, request: BacktestRequest, symbol: str) -> tuple:
     """
@@ -459,8 +526,8 @@ def smart_time_range_filter(df: pd.DataFrame, request: BacktestRequest, symbol:
     return df_filtered, time_range_info
 
 
-async def load_existing_data(symbol: str, request: BacktestRequest) -> Optional[pd.DataFrame]:
-    """从本地数据加载数据 - 使用新的数据适配器"""
+async def load_existing_data(symbol: str, request: BacktestRequest, context: Optional[BacktestContext] = None) -> Optional[pd.DataFrame]:
+    """从本地数据加载数据 - 使用新的数据适配器，时间范围信息记录在context中"""
     try:
         import pandas as pd
         from ..services.data_adapter import data_adapter
@@ -491,9 +558,9 @@ async def load_existing_data(symbol: str, request: BacktestRequest) -> Optional[
         # 使用智能时间范围处理
         df_filtered, time_range_info = smart_time_range_filter(df, request, symbol)
 
-        # 将时间范围信息存储为全局变量，供后续使用
-        global _current_time_range_info
-        _current_time_range_info = time_range_info
+        # 将时间范围信息记录在本次回测的上下文中，供后续使用
+        if context is not None:
+            context.time_range_info = time_range_info
 
         return df_filtered
 
@@ -729,47 +796,52 @@ def validate_real_data(df: Optional[pd.DataFrame], symbol: str, request: Backtes
         # 在宽松模式下，即使验证出错也尝试继续
         return True
 
-async def run_real_backtest(symbol: str, request: BacktestRequest) -> Optional[BacktestResult]:
-    """运行真实的回测逻辑 - 优先使用Binance API，失败时使用本地真实数据"""
-    import pandas as pd
-    import numpy as np
-    from datetime import timedelta
-    import logging
-
-    # 设置日志记录
-    logging.basicConfig(level=logging.INFO)
+async def load_backtest_data(symbol: str, request: BacktestRequest, context: BacktestContext) -> Optional[pd.DataFrame]:
+    """
+    加载并验证一个交易对的回测数据 - 优先使用本地真实数据，失败时使用Binance API
+    数据来源和时间范围信息记录在context中
+    """
     logger = logging.getLogger(__name__)
 
-    logger.info(f"🔍 开始为 {symbol} 获取真实数据进行回测")
-
-    try:
+    with context.stage('load'):
         # 优先使用本地数据文件（更可靠）
         logger.info(f"🔍 {symbol}: 优先尝试使用本地真实数据文件")
-        df = await load_existing_data(symbol, request)
-        data_source = "本地真实数据文件"
+        df = await load_existing_data(symbol, request, context)
+        context.data_source = LOCAL_DATA_SOURCE
 
         # 如果本地数据不可用，再尝试API
         if df is None or df.empty:
             logger.info(f"⚠️ {symbol}: 本地数据不可用，尝试从Binance API获取")
+            context.time_range_info = {}
             df = await fetch_real_binance_data(symbol, request)
-            data_source = "Binance API (实时数据)"
+            context.data_source = "Binance API (实时数据)"
 
-        # 验证数据质量和完整性
-        if df is None or df.empty:
-            logger.error(f"❌ {symbol}: 无法获取任何数据")
-            return None
+    # 验证数据质量和完整性
+    if df is None or df.empty:
+        logger.error(f"❌ {symbol}: 无法获取任何数据")
+        return None
 
-        # 使用宽松的验证模式
-        if not validate_real_data(df, symbol, request):
-            logger.warning(f"⚠️ {symbol}: 数据验证未完全通过，但继续回测")
-            # 不直接返回None，而是继续处理
+    # 使用宽松的验证模式
+    if not validate_real_data(df, symbol, request):
+        logger.warning(f"⚠️ {symbol}: 数据验证未完全通过，但继续回测")
+        # 不直接返回None，而是继续处理
 
-        logger.info(f"✅ {symbol}: 数据验证通过")
-        logger.info(f"   数据来源: {data_source}")
-        logger.info(f"   数据量: {len(df)} 条记录")
-        logger.info(f"   时间范围: {df['candle_begin_time'].min()} 到 {df['candle_begin_time'].max()}")
-        logger.info(f"   价格范围: ${df['close'].min():.2f} - ${df['close'].max():.2f}")
+    logger.info(f"✅ {symbol}: 数据验证通过")
+    logger.info(f"   数据来源: {context.data_source}")
+    logger.info(f"   数据量: {len(df)} 条记录")
+    logger.info(f"   时间范围: {df['candle_begin_time'].min()} 到 {df['candle_begin_time'].max()}")
+    logger.info(f"   价格范围: ${df['close'].min():.2f} - ${df['close'].max():.2f}")
+
+    return df
+
+def run_backtest_on_data(df: pd.DataFrame, symbol: str, request: BacktestRequest, context: BacktestContext) -> Optional[BacktestResult]:
+    """
+    在已加载的数据上计算交易信号、资金曲线和统计指标
+    同步执行，可以在回测进程中运行；同一份数据可以用不同的参数反复调用
+    """
+    logger = logging.getLogger(__name__)
 
+    try:
         # 3. 调用策略计算
         strategy_name = request.strategy.lower()
 
@@ -788,28 +860,31 @@ async def run_real_backtest(symbol: str, request: BacktestRequest) -> Optional[B
         params.update(request.parameters)
 
         # 4. 计算交易信号
-        df_result = calculate_strategy_signals(df, strategy_name, params)
+        with context.stage('signals'):
+            df_result = calculate_strategy_signals(df, strategy_name, params)
         if df_result is None or df_result.empty:
             logger.error(f"❌ {symbol}: 策略信号计算失败")
             return None
 
         # 5. 计算资金曲线
-        df_result = calculate_equity_curve_simple(df_result, request.leverage_rate, request.c_rate, request.slippage)
+        with context.stage('equity'):
+            df_result = calculate_equity_curve_simple(df_result, request.leverage_rate, request.c_rate, request.slippage)
 
         # 6. 计算统计指标
-        result = calculate_backtest_statistics(df_result, symbol, request)
+        with context.stage('statistics'):
+            result = calculate_backtest_statistics(df_result, symbol, request)
         result.task_id = ""  # 将在外部设置
 
         # 添加时间范围信息到结果中
-        global _current_time_range_info
-        if _current_time_range_info:
-            result.requested_date_start = _current_time_range_info.get('requested_start', request.date_start)
-            result.requested_date_end = _current_time_range_info.get('requested_end', request.date_end)
-            result.actual_date_start = _current_time_range_info.get('actual_start', '')
-            result.actual_date_end = _current_time_range_info.get('actual_end', '')
-            result.data_records_count = _current_time_range_info.get('records_count', len(df_result))
-            result.time_range_match_status = _current_time_range_info.get('match_status', 'unknown')
-            result.time_range_adjustment_reason = _current_time_range_info.get('adjustment_reason', '')
+        time_range_info = context.time_range_info
+        if time_range_info:
+            result.requested_date_start = time_range_info.get('requested_start', request.date_start)
+            result.requested_date_end = time_range_info.get('requested_end', request.date_end)
+            result.actual_date_start = time_range_info.get('actual_start', '')
+            result.actual_date_end = time_range_info.get('actual_end', '')
+            result.data_records_count = time_range_info.get('records_count', len(df_result))
+            result.time_range_match_status = time_range_info.get('match_status', 'unknown')
+            result.time_range_adjustment_reason = time_range_info.get('adjustment_reason', '')
 
             logger.info(f"✅ {symbol}: 回测完成，使用100%真实数据")
             logger.info(f"   请求时间范围: {result.requested_date_start} 到 {result.requested_date_end}")
@@ -837,12 +912,129 @@ async def run_real_backtest(symbol: str, request: BacktestRequest) -> Optional[B
             else:
                 logger.info(f"✅ {symbol}: 回测完成，使用100%真实数据")
 
+        logger.info(f"   各阶段耗时: " + ", ".join(f"{k} {v:.3f}s" for k, v in context.timings.items()))
         return result
 
     except Exception as e:
         logger.error(f"❌ {symbol}: 回测失败 - {str(e)}")
         return None
 
+async def run_real_backtest(symbol: str, request: BacktestRequest, context: Optional[BacktestContext] = None) -> Optional[BacktestResult]:
+    """
+    运行真实的回测逻辑 - 优先使用本地真实数据，失败时使用Binance API
+    context: 本次回测的上下文，不传时新建；调用方可以传入以便回测结束后读取数据来源和各阶段耗时
+    """
+    # 设置日志记录
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    logger.info(f"🔍 开始为 {symbol} 获取真实数据进行回测")
+    if context is None:
+        context = BacktestContext(symbol=symbol)
+
+    try:
+        df = await load_backtest_data(symbol, request, context)
+        if df is None:
+            return None
+        return run_backtest_on_data(df, symbol, request, context)
+
+    except Exception as e:
+        logger.error(f"❌ {symbol}: 回测失败 - {str(e)}")
+        return None
+
+def run_real_backtest_sync(symbol: str, request: BacktestRequest) -> Tuple[Optional[BacktestResult], BacktestContext]:
+    """在回测进程中运行单个交易对的回测，同时返回本次回测的上下文"""
+    context = BacktestContext(symbol=symbol)
+    return asyncio.run(run_real_backtest(symbol, request, context)), context
+
+def backtest_cache_key(symbol: str, request: BacktestRequest) -> Optional[Tuple[str, str]]:
+    """
+    回测结果缓存键：请求中决定单个交易对结果的全部字段加本地数据文件指纹
+    返回 (缓存键, 数据指纹对应的一代)，数据文件更新后旧一代的磁盘缓存在下次写入时删除
+    结果缓存关闭或数据管理器不可用时返回None
+    """
+    if not settings.result_cache_enabled:
+        return None
+    try:
+        from ..services.data_adapter import data_adapter
+        fingerprint = data_adapter.data_manager.data_fingerprint()
+    except Exception:
+        return None
+    key = make_cache_key({**request.model_dump(exclude={'symbols'}), 'symbol': symbol, 'data': fingerprint})
+    return key, make_cache_generation(fingerprint)
+
+def get_cached_backtest_result(cache_key: Optional[Tuple[str, str]]) -> Optional[BacktestResult]:
+    """读取缓存的回测结果，缓存内容无法解析时视为未命中。包含磁盘读取和反序列化，在线程中调用"""
+    if not cache_key:
+        return None
+    cached = backtest_result_cache.get(*cache_key)
+    if not cached:
+        return None
+    try:
+        return BacktestResult.model_validate_json(cached)
+    except ValueError:
+        return None
+
+def store_backtest_result(cache_key: Tuple[str, str], result: BacktestResult):
+    """序列化并写入回测结果缓存，包含完整的资金曲线和磁盘写入，在线程中调用"""
+    key, generation = cache_key
+    backtest_result_cache.put(key, result.model_dump_json(), generation)
+
+async def run_symbol_backtests(task_id: str, symbols: List[str], request: BacktestRequest) -> List[BacktestResult]:
+    """
+    并发回测多个交易对
+    每个交易对的回测提交到回测进程池中执行，同时执行的数量不超过settings.backtest_symbol_concurrency，
+    每完成一个交易对更新一次任务状态。进程池未启动时（例如脚本中直接调用）在事件循环中执行
+    命中结果缓存的交易对不再计算，全部命中时任务立即完成
+    返回: 成功的回测结果，顺序与symbols一致
+    """
+    task_status = backtest_tasks[task_id]
+    semaphore = asyncio.Semaphore(max(1, settings.backtest_symbol_concurrency))
+    completed = 0
+
+    async def run_one(symbol: str) -> Optional[BacktestResult]:
+        nonlocal completed
+        cache_key = backtest_cache_key(symbol, request)
+        result = await asyncio.to_thread(get_cached_backtest_result, cache_key)
+        if result:
+            result.task_id = task_id
+            result.result_id = str(uuid.uuid4())
+            print(f"⚡ {symbol}: 命中回测结果缓存")
+        else:
+            async with semaphore:
+                task_status.message = f"Processing {symbol} with real data..."
+                try:
+                    if backtest_executor.started:
+                        result, context = await backtest_executor.run(run_real_backtest_sync, symbol, request)
+                    else:
+                        context = BacktestContext(symbol=symbol)
+                        result = await run_real_backtest(symbol, request, context)
+                    if result:
+                        # 只缓存使用本地数据文件的结果，Binance API的数据不在数据文件指纹的范围内
+                        if cache_key and context.data_source == LOCAL_DATA_SOURCE:
+                            await asyncio.to_thread(store_backtest_result, cache_key, result)
+                        result.task_id = task_id
+                        print(f"✅ {symbol}: 使用真实数据完成回测")
+                    else:
+                        # 如果无法获取真实数据，记录错误并跳过
+                        error_msg = f"❌ {symbol}: 无法获取真实数据，跳过此交易对"
+                        print(error_msg)
+                        task_status.message = f"Warning: {error_msg}"
+                except Exception as e:
+                    result = None
+                    error_msg = f"❌ {symbol}: 回测失败 - {str(e)}"
+                    print(error_msg)
+                    task_status.message = f"Error: {error_msg}"
+
+        completed += 1
+        task_status.symbols_completed = completed
+        task_status.progress = completed / len(symbols) * 100
+        publish_task_progress(task_id, result)
+        return result
+
+    results = await asyncio.gather(*(run_one(symbol) for symbol in symbols))
+    return [result for result in results if result]
+
 def calculate_strategy_signals(df: pd.DataFrame, strategy: str, params: dict) -> Optional[pd.DataFrame]:
     """计算策略信号 - 强制使用crypto_cta真实因子"""
     import logging
@@ -1605,48 +1797,38 @@ def calculate_equity_curve_simple(df: pd.DataFrame, leverage_rate: float, c_rate
         # 计算交易价值（绝对持仓变化 * 当期收盘价）
         df['trade_value'] = abs(df['pos_change']) * df['close']
 
-        # 初始化资金曲线用于计算交易成本百分比
         initial_capital = 10000.0  # 初始资金
-        df['equity_curve_temp'] = float(initial_capital)
-        df['net_return'] = 0.0  # 初始化净收益率列
-        df['trade_cost'] = 0.0  # 初始化交易成本列
-
-        # 逐行计算资金曲线和交易成本
-        for i in range(1, len(df)):
-            # 前一期的资金
-            prev_equity = df.iloc[i-1]['equity_curve_temp']
-
-            # 当期策略收益（基于前一期资金）
-            strategy_pnl = df.iloc[i]['strategy_return'] * prev_equity
-
-            # 修正的交易成本计算：只对实际交易收取成本，且基于资金而非交易价值
-            if df.iloc[i]['pos_change'] != 0:
-                # 交易成本基于当期资金的百分比，而不是交易价值
-                trade_cost_absolute = prev_equity * abs(df.iloc[i]['pos_change']) * (c_rate + slippage)
-            else:
-                trade_cost_absolute = 0
-
-            # 存储交易成本
-            df.iloc[i, df.columns.get_loc('trade_cost')] = trade_cost_absolute
-
-            # 净收益
-            net_pnl = strategy_pnl - trade_cost_absolute
-
-            # 更新资金曲线
-            df.iloc[i, df.columns.get_loc('equity_curve_temp')] = prev_equity + net_pnl
 
-            # 计算净收益率（相对于前一期资金）
-            df.iloc[i, df.columns.get_loc('net_return')] = net_pnl / prev_equity if prev_equity > 0 else 0
+        # 策略收益和交易成本都与前一期资金成正比：
+        #   资金[i] = 资金[i-1] * (1 + 策略收益率[i] - |持仓变化[i]| * (手续费 + 滑点))
+        # 因此资金曲线就是单期净收益率的累乘，不需要逐行计算
+        strategy_return = df['strategy_return'].to_numpy(dtype=float)
+        pos_change = df['pos_change'].to_numpy(dtype=float)
+        # 只对实际交易收取成本，且基于资金而非交易价值
+        cost_rate = np.where(pos_change != 0, np.abs(pos_change) * (c_rate + slippage), 0.0)
+        step_return = strategy_return - cost_rate
+        if len(df) > 0:
+            step_return[0] = 0.0  # 第一期没有收益和成本
+        equity = initial_capital * np.cumprod(1 + step_return)
+        prev_equity = np.concatenate(([initial_capital], equity[:-1]))
+
+        # 净收益率（相对于前一期资金）
+        df['net_return'] = np.where(prev_equity > 0, step_return, 0.0)
+        # 交易成本（绝对金额，基于前一期资金）
+        trade_cost = np.where(pos_change != 0, prev_equity * cost_rate, 0.0)
+        if len(df) > 0:
+            trade_cost[0] = 0.0
+        df['trade_cost'] = trade_cost
 
         # 标准化资金曲线（以初始资金为1）
-        df['equity_curve'] = df['equity_curve_temp'] / initial_capital
+        df['equity_curve'] = equity / initial_capital
 
         # 计算回撤
         df['peak'] = df['equity_curve'].expanding().max()
         df['drawdown'] = (df['equity_curve'] - df['peak']) / df['peak']
 
         # 清理临时列
-        df.drop(['equity_curve_temp', 'trade_value'], axis=1, inplace=True, errors='ignore')
+        df.drop(['trade_value'], axis=1, inplace=True, errors='ignore')
 
         return df
 
@@ -1690,10 +1872,20 @@ def calculate_backtest_statistics(df: pd.DataFrame, symbol: str, request: Backte
         else:
             annual_return = 0
 
-        # 计算最大回撤
-        df['peak'] = df['equity_curve'].expanding().max()
-        df['drawdown'] = (df['equity_curve'] - df['peak']) / df['peak']
-        max_drawdown = abs(df['drawdown'].min())
+        # 计算最大回撤，以及每一段回撤的开始、最低点和修复时间
+        dd = drawdown_analysis(df['equity_curve'], df['candle_begin_time'])
+        df['drawdown'] = dd['drawdown']
+        max_drawdown = abs(dd['max_drawdown'])
+        drawdown_periods = [
+            DrawdownPeriod(
+                start_date=episode.start.strftime("%Y-%m-%d %H:%M:%S"),
+                end_date=episode.trough.strftime("%Y-%m-%d %H:%M:%S"),
+                duration_days=int(episode.duration.days),
+                max_drawdown=float(abs(episode.drawdown)),
+                recovery_date=episode.end.strftime("%Y-%m-%d %H:%M:%S") if episode.recovered else None
+            )
+            for episode in dd['episodes'].itertuples(index=False)
+        ]
 
         # 修正的风险指标计算
         returns = df['net_return'].dropna()
@@ -1741,14 +1933,12 @@ def calculate_backtest_statistics(df: pd.DataFrame, symbol: str, request: Backte
             avg_loss = 0
             profit_factor = 0
 
-        # 生成资金曲线数据
-        equity_curve = []
-        for _, row in df.iterrows():
-            equity_curve.append({
-                "date": row['candle_begin_time'].strftime("%Y-%m-%d %H:%M:%S"),
-                "value": float(row['equity_curve'] * 10000),  # 假设初始资金10000
-                "drawdown": float(abs(row['drawdown']))
-            })
+        # 生成资金曲线数据（列式）
+        equity_curve_columns = EquityCurveColumns(
+            timestamp=df['candle_begin_time'].to_numpy().astype('datetime64[ms]').astype(np.int64).tolist(),
+            value=(df['equity_curve'].to_numpy(dtype=float) * 10000).tolist(),  # 假设初始资金10000
+            drawdown=np.abs(df['drawdown'].to_numpy(dtype=float)).tolist()
+        )
 
         # 生成交易记录
         trade_records = []
@@ -1766,10 +1956,9 @@ def calculate_backtest_statistics(df: pd.DataFrame, symbol: str, request: Backte
                     slippage=float(row['trade_cost'] * 10000 * 0.5)
                 ))
 
-        # 生成月度收益
+        # 生成月度收益 - 按月复利计算
         monthly_returns = []
-        df_monthly = df.set_index('candle_begin_time')
-        monthly_data = df_monthly['net_return'].resample('ME').sum()
+        monthly_data = period_return(df['candle_begin_time'], df['net_return'], 'M')
 
         for date, return_val in monthly_data.items():
             monthly_returns.append(MonthlyReturn(
@@ -1809,8 +1998,8 @@ def calculate_backtest_statistics(df: pd.DataFrame, symbol: str, request: Backte
             kurtosis=float(returns.kurtosis()) if len(returns) > 2 else 0,
             var_95=var_95,
             cvar_95=cvar_95,
-            equity_curve=equity_curve,
-            drawdown_periods=[],  # 需要更复杂的计算
+            equity_curve_columns=equity_curve_columns,
+            drawdown_periods=drawdown_periods,
             monthly_returns=monthly_returns,
             trade_records=trade_records,
             created_at=datetime.now()
@@ -1840,10 +2029,7 @@ def calculate_backtest_statistics(df: pd.DataFrame, symbol: str, request: Backte
         )
 
 @router.post("/run")
-async def start_backtest(
-    request: BacktestRequest,
-    background_tasks: BackgroundTasks
-):
+async def start_backtest(request: BacktestRequest):
     """启动回测任务 - 仅使用真实数据"""
     import logging
 
@@ -1870,8 +2056,8 @@ async def start_backtest(
     )
     backtest_tasks[task_id] = task_status
 
-    # 在后台运行回测
-    background_tasks.add_task(run_backtest_task, task_id, request)
+    # 提交到任务队列
+    await submit_task(task_id, "backtest", request)
 
     return {
         "task_id": task_id,
@@ -1888,33 +2074,8 @@ async def run_backtest_task(task_id: str, request: BacktestRequest):
         task_status.status = "running"
         task_status.message = "Starting backtest with real data only..."
 
-        results = []
-
-        for i, symbol in enumerate(request.symbols):
-            task_status.message = f"Processing {symbol} with real data..."
-            task_status.progress = (i / len(request.symbols)) * 100
-
-            try:
-                # 强制使用真实数据进行回测
-                real_result = await run_real_backtest(symbol, request)
-                if real_result:
-                    real_result.task_id = task_id
-                    results.append(real_result)
-                    print(f"✅ {symbol}: 使用真实数据完成回测")
-                else:
-                    # 如果无法获取真实数据，记录错误并跳过
-                    error_msg = f"❌ {symbol}: 无法获取真实数据，跳过此交易对"
-                    print(error_msg)
-                    task_status.message = f"Warning: {error_msg}"
-                    continue
-
-            except Exception as e:
-                error_msg = f"❌ {symbol}: 回测失败 - {str(e)}"
-                print(error_msg)
-                task_status.message = f"Error: {error_msg}"
-                continue
-
-            task_status.symbols_completed = i + 1
+        # 强制使用真实数据进行回测
+        results = await run_symbol_backtests(task_id, request.symbols, request)
 
         if not results:
             task_status.status = "failed"
@@ -1929,14 +2090,163 @@ async def run_backtest_task(task_id: str, request: BacktestRequest):
         task_status.status = "failed"
         task_status.message = f"Backtest failed: {str(e)}"
 
-@router.get("/status/{task_id}", response_model=BacktestStatus)
-async def get_backtest_status(task_id: str):
+# 结果接口的资金曲线格式：rows为逐行的{date, value, drawdown}，columns为列式的{timestamp, value, drawdown}
+EQUITY_FORMATS = ("rows", "columns")
+
+def downsample_equity_curve(columns: EquityCurveColumns, max_points: Optional[int] = None) -> EquityCurveColumns:
+    """
+    资金曲线LTTB抽样，保留首尾点、最高最低点和最大回撤起止点，返回的点数可能比max_points多几个
+    max_points为空或不超过数据量时原样返回
+    """
+    if not max_points or len(columns.timestamp) <= max_points:
+        return columns
+    from cta_api.downsample import downsample_index
+
+    timestamp = np.asarray(columns.timestamp, dtype=np.int64)
+    index = downsample_index([np.asarray(columns.value, dtype=float)], max_points, x=timestamp)
+    return EquityCurveColumns(
+        timestamp=timestamp[index].tolist(),
+        value=np.asarray(columns.value, dtype=float)[index].tolist(),
+        drawdown=np.asarray(columns.drawdown, dtype=float)[index].tolist()
+    )
+
+def equity_curve_rows(columns: EquityCurveColumns) -> List[Dict[str, Any]]:
+    """列式资金曲线转为逐行格式"""
+    dates = pd.to_datetime(np.asarray(columns.timestamp, dtype=np.int64), unit='ms').strftime("%Y-%m-%d %H:%M:%S")
+    return [{"date": date, "value": value, "drawdown": drawdown}
+            for date, value, drawdown in zip(dates, columns.value, columns.drawdown)]
+
+def parse_result_fields(fields: Optional[str]) -> Optional[set]:
+    """解析逗号分隔的结果字段，为空时返回None表示全部字段"""
+    if not fields:
+        return None
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected - set(BacktestResult.model_fields) - {"equity_curve"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的结果字段: {', '.join(sorted(unknown))}")
+    return selected
+
+def result_payload(result: BacktestResult, fields: Optional[set] = None, max_points: Optional[int] = None,
+                   equity_format: str = "rows") -> Dict[str, Any]:
+    """
+    单个回测结果的接口返回内容
+    fields: 返回的字段，None表示全部字段；资金曲线统一以equity_curve返回
+    max_points: 资金曲线的最大点数，为空时返回全部数据
+    equity_format: 资金曲线格式，见EQUITY_FORMATS
+    """
+    if equity_format not in EQUITY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"equity_format只支持: {', '.join(EQUITY_FORMATS)}")
+    payload = result.model_dump(mode="json", include=fields, exclude={"equity_curve", "equity_curve_columns"})
+    if fields is not None and "equity_curve" not in fields:
+        return payload
+
+    if result.equity_curve_columns is None:
+        # 没有列式数据的旧结果
+        payload["equity_curve"] = result.equity_curve
+        return payload
+    columns = downsample_equity_curve(result.equity_curve_columns, max_points)
+    payload["equity_curve"] = columns.model_dump() if equity_format == "columns" else equity_curve_rows(columns)
+    return payload
+
+@router.get("/status/{task_id}")
+async def get_backtest_status(
+    task_id: str,
+    fields: Optional[str] = Query(None, description="逗号分隔的结果字段，默认全部"),
+    max_points: Optional[int] = Query(None, ge=3, description="资金曲线最大点数，默认全部"),
+    equity_format: str = Query("rows", description="资金曲线格式: rows 或 columns")
+):
     """获取回测任务状态"""
-    if task_id not in backtest_tasks:
-        raise HTTPException(status_code=404, detail="Task not found")
+    task_status = await get_task(task_id)
+    selected = parse_result_fields(fields)
+    return {
+        **task_status.model_dump(mode="json", exclude={"results"}),
+        "results": [result_payload(r, selected, max_points, equity_format) for r in task_status.results]
+    }
 
-    return backtest_tasks[task_id]
 
+# 推送连接在没有通知时检查任务状态的间隔，以及发送心跳的间隔(秒)
+SSE_POLL_SECONDS = 1.0
+SSE_HEARTBEAT_SECONDS = 15.0
+
+def sse_event(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """格式化一条Server-Sent Events消息"""
+    message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+def task_result_summaries(task_id: str, task_status: BacktestStatus, since: int) -> List[Dict[str, Any]]:
+    """
+    序号不小于since的结果摘要：任务运行中或摘要仍保留时取事件记录，任务结束且摘要已释放时由任务结果生成。
+    任务结果按交易对或夏普比率排列，与完成顺序不同，生成摘要时使用推送时记录在结果上的序号，
+    断线重连的客户端在两种来源之间切换时不会重复或遗漏结果（没有序号的旧结果按位置编号）
+    """
+    if task_status.status not in FINISHED_STATUSES or task_events.retained(task_id):
+        return task_events.summaries(task_id, since)
+    summaries = [{"index": position if result.sequence is None else result.sequence,
+                  **result.model_dump(mode="json", include=RESULT_SUMMARY_FIELDS)}
+                 for position, result in enumerate(task_status.results)]
+    return sorted((s for s in summaries if s["index"] >= since), key=lambda s: s["index"])
+
+@router.get("/stream/{task_id}")
+async def stream_backtest_task(
+    task_id: str,
+    request: Request,
+    since: int = Query(0, ge=0, description="从第几个结果摘要开始推送，断线重连时使用")
+):
+    """
+    以Server-Sent Events推送任务进度和结果摘要，代替轮询 /status/{task_id}
+    事件: progress（状态、进度或消息变化时）、result（每完成一个交易对/参数组合，id为结果序号）、
+    done（任务结束后发送并关闭连接）。资金曲线等大字段不推送，任务完成后通过 /results/{task_id} 按需获取
+    """
+    # 已结束任务的结果摘要由任务结果生成，先确保结果已载入
+    await get_task(task_id)
+
+    # 浏览器EventSource断线重连时带上最后收到的事件id
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = max(since, int(last_event_id) + 1)
+    results_url = request.url_for("get_backtest_results", task_id=task_id).path
+
+    async def event_stream():
+        next_index = since
+        last_progress = None
+        last_sent = time.monotonic()
+        task_events.attach(task_id)
+        try:
+            while True:
+                task_status = backtest_tasks.get(task_id)
+                if task_status is None:
+                    yield sse_event("done", {"task_id": task_id, "status": "deleted"})
+                    return
+
+                messages = []
+                for summary in task_result_summaries(task_id, task_status, next_index):
+                    messages.append(sse_event("result", summary, summary["index"]))
+                    next_index = summary["index"] + 1
+                progress = task_status.model_dump(mode="json", exclude={"results"})
+                if progress != last_progress:
+                    messages.append(sse_event("progress", progress))
+                    last_progress = progress
+                if task_status.status in FINISHED_STATUSES:
+                    messages.append(sse_event("done", {"task_id": task_id, "status": task_status.status, "results_url": results_url}))
+
+                if messages:
+                    yield "".join(messages)
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+
+                if task_status.status in FINISHED_STATUSES or await request.is_disconnected():
+                    return
+                await task_events.wait(task_id, SSE_POLL_SECONDS)
+        finally:
+            task_events.detach(task_id)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/data-source-verification")
 async def verify_data_sources():
@@ -2066,20 +2376,26 @@ async def verify_data_sources():
         }
 
 @router.get("/results/{task_id}")
-async def get_backtest_results(task_id: str):
-    """获取回测结果"""
-    if task_id not in backtest_tasks:
-        raise HTTPException(status_code=404, detail="Task not found")
-
-    task_status = backtest_tasks[task_id]
+async def get_backtest_results(
+    task_id: str,
+    fields: Optional[str] = Query(None, description="逗号分隔的结果字段，默认全部"),
+    max_points: Optional[int] = Query(None, ge=3, description="资金曲线最大点数，默认全部"),
+    equity_format: str = Query("rows", description="资金曲线格式: rows 或 columns")
+):
+    """
+    获取回测结果
+    资金曲线可以用max_points抽样、用equity_format=columns返回列式数据，例如先取2000个点预览，缩放时再取全部数据
+    """
+    task_status = await get_task(task_id)
 
     if task_status.status != "completed":
         raise HTTPException(status_code=400, detail="Backtest not completed yet")
 
+    selected = parse_result_fields(fields)
     return {
         "task_id": task_id,
         "status": task_status.status,
-        "results": task_status.results,
+        "results": [result_payload(r, selected, max_points, equity_format) for r in task_status.results],
         "summary": {
             "total_symbols": len(task_status.results),
             "avg_return": sum(r.final_return for r in task_status.results) / len(task_status.results) if task_status.results else 0,
@@ -2088,8 +2404,14 @@ async def get_backtest_results(task_id: str):
     }
 
 @router.get("/tasks")
-async def list_backtest_tasks():
+async def list_backtest_tasks(
+    fields: Optional[str] = Query(None, description="逗号分隔的结果字段，默认全部"),
+    max_points: Optional[int] = Query(None, ge=3, description="资金曲线最大点数，默认全部"),
+    equity_format: str = Query("rows", description="资金曲线格式: rows 或 columns")
+):
     """获取所有回测任务列表"""
+    selected = parse_result_fields(fields)
+    await asyncio.gather(*(ensure_task_results(task_id) for task_id in list(unloaded_results)))
     return [
         {
             "task_id": task_id,
@@ -2098,16 +2420,13 @@ async def list_backtest_tasks():
             "symbols_completed": task.symbols_completed,
             "progress": task.progress,
             "message": task.message,
-            "results": task.results or []
+            "results": [result_payload(r, selected, max_points, equity_format) for r in task.results or []]
         }
         for task_id, task in backtest_tasks.items()
     ]
 
 @router.post("/optimize")
-async def start_optimization(
-    request: OptimizationRequest,
-    background_tasks: BackgroundTasks
-):
+async def start_optimization(request: OptimizationRequest):
     """启动参数优化任务"""
     task_id = str(uuid.uuid4())
 
@@ -2120,8 +2439,8 @@ async def start_optimization(
     )
     backtest_tasks[task_id] = task_status
 
-    # 在后台运行优化
-    background_tasks.add_task(run_optimization_task, task_id, request)
+    # 提交到任务队列，优先级低于交互式回测
+    await submit_task(task_id, "optimization", request)
 
     return {
         "task_id": task_id,
@@ -2152,53 +2471,101 @@ async def run_optimization_task(task_id: str, request: OptimizationRequest):
         task_status.status = "failed"
         task_status.message = f"Optimization failed: {str(e)}"
 
-async def run_grid_search_optimization(task_id: str, request: OptimizationRequest) -> List[BacktestResult]:
-    """运行网格搜索参数优化"""
-    import itertools
+# 参数优化时每个进程缓存已加载的数据，{(task_id, symbol): (df, context)}，同一个优化任务的参数组合不再重复加载和验证数据
+_OPTIMIZATION_DATA_CACHE_SIZE = 4
+_optimization_data_cache: "OrderedDict[Tuple[str, str], Tuple[Optional[pd.DataFrame], BacktestContext]]" = OrderedDict()
+
+async def load_optimization_data(task_id: str, symbol: str, request: BacktestRequest) -> Tuple[Optional[pd.DataFrame], BacktestContext]:
+    """加载参数优化用的数据，同一个任务同一个交易对在每个进程中只加载一次（加载失败也会缓存）"""
+    key = (task_id, symbol)
+    if key in _optimization_data_cache:
+        _optimization_data_cache.move_to_end(key)
+        return _optimization_data_cache[key]
+
+    context = BacktestContext(symbol=symbol)
+    df = await load_backtest_data(symbol, request, context)
+    _optimization_data_cache[key] = (df, context)
+    while len(_optimization_data_cache) > _OPTIMIZATION_DATA_CACHE_SIZE:
+        _optimization_data_cache.popitem(last=False)
+    return df, context
+
+async def run_optimization_backtest(task_id: str, symbol: str, request: BacktestRequest) -> Optional[BacktestResult]:
+    """用缓存的数据回测一个参数组合"""
+    df, data_context = await load_optimization_data(task_id, symbol, request)
+    if df is None:
+        return None
+    context = data_context.model_copy(update={'timings': {}})
+    return run_backtest_on_data(df, symbol, request, context)
 
+def run_optimization_backtest_sync(task_id: str, symbol: str, request: BacktestRequest) -> Optional[BacktestResult]:
+    """在回测进程中回测一个参数组合"""
+    return asyncio.run(run_optimization_backtest(task_id, symbol, request))
+
+async def run_grid_search_optimization(task_id: str, request: OptimizationRequest) -> List[BacktestResult]:
+    """
+    运行网格搜索参数优化
+    参数组合×交易对分发到回测进程池中并发计算，每个进程中每个交易对的数据只加载和验证一次，
+    每完成一个参数组合更新一次任务进度
+    """
     # 生成参数组合
     param_combinations = generate_parameter_combinations(request.parameter_ranges)
+    # 按交易对分组分发：同一个交易对的参数组合连续执行，每个进程处理完一个交易对后不会再回到该交易对，
+    # 数据缓存只需容纳正在执行的少数几个交易对，交易对数量超过缓存大小时也不会被反复淘汰和重新加载
+    jobs = [(params, symbol) for symbol in request.symbols for params in param_combinations]
 
     print(f"🔍 开始参数优化，共 {len(param_combinations)} 个参数组合")
 
-    results = []
     task_status = backtest_tasks[task_id]
+    semaphore = asyncio.Semaphore(backtest_executor.max_workers if backtest_executor.started else 1)
+    completed = 0
+
+    async def run_one(params: Dict[str, float], symbol: str) -> Optional[BacktestResult]:
+        nonlocal completed
+        # 创建回测请求，杠杆、手续费和滑点沿用优化请求中的设置
+        backtest_request = BacktestRequest(
+            symbols=[symbol],
+            strategy=request.strategy,
+            parameters=params,
+            date_start=request.date_start,
+            date_end=request.date_end,
+            rule_type=request.rule_type,
+            leverage_rate=request.leverage_rate,
+            c_rate=request.c_rate,
+            slippage=request.slippage
+        )
 
-    for i, params in enumerate(param_combinations):
-        try:
-            # 更新进度
-            progress = (i / len(param_combinations)) * 100
-            task_status.progress = progress
-            task_status.message = f"Testing parameters {i+1}/{len(param_combinations)}: {params}"
-
-            print(f"📊 测试参数组合 {i+1}/{len(param_combinations)}: {params}")
-
-            # 为每个交易对运行回测
-            for symbol in request.symbols:
-                # 创建回测请求
-                backtest_request = BacktestRequest(
-                    symbols=[symbol],
-                    strategy=request.strategy,
-                    parameters=params,
-                    date_start=request.date_start,
-                    date_end=request.date_end,
-                    rule_type=request.rule_type
-                )
-
-                # 运行回测
-                result = await run_real_backtest(symbol, backtest_request)
-                if result:
-                    result.task_id = task_id
-                    result.parameters = params  # 确保参数被正确设置
-                    results.append(result)
-                    print(f"✅ {symbol}: 参数 {params} - 夏普比率: {result.sharpe_ratio:.3f}, 收益率: {result.final_return:.3f}")
+        async with semaphore:
+            try:
+                if backtest_executor.started:
+                    result = await backtest_executor.run(run_optimization_backtest_sync, task_id, symbol, backtest_request)
                 else:
-                    print(f"❌ {symbol}: 参数 {params} - 回测失败")
+                    result = await run_optimization_backtest(task_id, symbol, backtest_request)
+            except Exception as e:
+                print(f"❌ 参数组合 {params} 测试失败: {e}")
+                result = None
 
-        except Exception as e:
-            print(f"❌ 参数组合 {params} 测试失败: {e}")
-            continue
+        if result:
+            result.task_id = task_id
+            result.parameters = params  # 确保参数被正确设置
+            print(f"✅ {symbol}: 参数 {params} - 夏普比率: {result.sharpe_ratio:.3f}, 收益率: {result.final_return:.3f}")
+        else:
+            print(f"❌ {symbol}: 参数 {params} - 回测失败")
 
+        # 更新进度
+        completed += 1
+        task_status.progress = completed / len(jobs) * 100
+        task_status.message = f"Tested {completed}/{len(jobs)}: {symbol} {params}"
+        publish_task_progress(task_id, result)
+        return result
+
+    try:
+        results = await asyncio.gather(*(run_one(params, symbol) for params, symbol in jobs))
+    finally:
+        # 进程池未启动时数据缓存在当前进程中，任务结束后释放
+        for key in [key for key in _optimization_data_cache if key[0] == task_id]:
+            del _optimization_data_cache[key]
+
+    results = [result for result in results if result]
     print(f"🎯 参数优化完成，共生成 {len(results)} 个有效结果")
     return results
 
@@ -2224,8 +2591,32 @@ def generate_parameter_combinations(parameter_ranges: Dict[str, List[float]]) ->
 
     return combinations
 
-def analyze_parameter_space(results: List[BacktestResult], metric: str = "sharpe_ratio") -> Dict:
-    """分析参数空间，生成参数平原或热力图数据"""
+# 参数分析中对切片以外的参数（以及同一组参数的多个交易对）的聚合方式
+PARAMETER_AGGREGATIONS = {
+    "max": max,
+    "mean": lambda values: sum(values) / len(values),
+}
+
+def parameter_value_matches(value: Any, target: Any) -> bool:
+    """参数取值比较，接口传入的字符串和数值参数按数值比较"""
+    if value == target or str(value) == str(target):
+        return True
+    try:
+        return float(value) == float(target)
+    except (TypeError, ValueError):
+        return False
+
+def analyze_parameter_space(results: List[BacktestResult], metric: str = "sharpe_ratio",
+                            x_param: Optional[str] = None, y_param: Optional[str] = None,
+                            fixed: Optional[Dict[str, Any]] = None, aggregate: str = "max") -> Dict:
+    """
+    分析参数空间，生成参数平原或热力图数据
+
+    结果按参数取值建立索引，每个点只返回指标值、结果数量和其中指标最好的result_id，完整结果通过结果接口按需获取。
+    可以指定热力图的坐标轴（x_param、y_param，只指定x_param时生成参数平原），其余参数可以用fixed固定取值，
+    未固定的参数按aggregate聚合；同一组参数有多个交易对的结果时同样按aggregate聚合。
+    参数超过两个且没有指定坐标轴时返回最好的20组参数和每个参数的边际分布
+    """
     if not results:
         return {"parameter_count": 0, "visualization_type": "none", "data": []}
 
@@ -2236,6 +2627,19 @@ def analyze_parameter_space(results: List[BacktestResult], metric: str = "sharpe
 
     param_names = list(first_result.parameters.keys())
     param_count = len(param_names)
+    positions = {name: i for i, name in enumerate(param_names)}
+    fixed = fixed or {}
+
+    if aggregate not in PARAMETER_AGGREGATIONS:
+        raise HTTPException(status_code=400, detail=f"aggregate只支持: {', '.join(PARAMETER_AGGREGATIONS)}")
+    aggregate_values = PARAMETER_AGGREGATIONS[aggregate]
+    unknown = [name for name in (x_param, y_param, *fixed) if name is not None and name not in positions]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知参数: {', '.join(unknown)}，可选: {', '.join(param_names)}")
+    if y_param is not None and x_param is None:
+        raise HTTPException(status_code=400, detail="指定y_param时需要同时指定x_param")
+    if x_param is not None and (x_param == y_param or x_param in fixed or y_param in fixed):
+        raise HTTPException(status_code=400, detail="坐标轴参数不能重复，也不能同时固定取值")
 
     # 获取指标值的函数
     def get_metric_value(result: BacktestResult) -> float:
@@ -2252,164 +2656,202 @@ def analyze_parameter_space(results: List[BacktestResult], metric: str = "sharpe
         else:
             return result.sharpe_ratio or 0
 
-    if param_count == 1:
-        # 单参数：生成参数平原数据
-        param_name = param_names[0]
-        data_points = []
-
-        for result in results:
-            param_value = result.parameters[param_name]
-            metric_value = get_metric_value(result)
-            data_points.append({
-                "parameter": param_value,
-                "value": metric_value,
-                "result": result
-            })
+    # 按参数取值建立索引：参数元组 -> [(指标值, result_id)]，只保留符合固定参数的结果
+    index: Dict[tuple, List[Tuple[float, str]]] = {}
+    for result in results:
+        key = tuple(result.parameters.get(name) for name in param_names)
+        if all(parameter_value_matches(key[positions[name]], value) for name, value in fixed.items()):
+            index.setdefault(key, []).append((get_metric_value(result), result.result_id))
+    if not index:
+        return {"parameter_count": param_count, "visualization_type": "none", "data": [], "fixed": fixed}
+
+    def group_by(axes: List[str]) -> Dict[tuple, Dict[str, Any]]:
+        """按坐标轴参数分组聚合，其余参数和交易对的结果合并到同一个点"""
+        groups: Dict[tuple, List[Tuple[float, str]]] = {}
+        for key, entries in index.items():
+            groups.setdefault(tuple(key[positions[name]] for name in axes), []).extend(entries)
+        return {
+            axis_key: {"value": aggregate_values([value for value, _ in entries]),
+                       "count": len(entries),
+                       "result_id": max(entries)[1]}
+            for axis_key, entries in groups.items()
+        }
+
+    def line_points(param_name: str) -> List[Dict[str, Any]]:
+        points = [{"parameter": axis_key[0], **cell} for axis_key, cell in group_by([param_name]).items()]
+        points.sort(key=lambda x: x["parameter"])  # 按参数值排序
+        return points
 
-        # 按参数值排序
-        data_points.sort(key=lambda x: x["parameter"])
+    free_params = [name for name in param_names if name not in fixed]
+    if x_param is None and len(free_params) <= 2:
+        x_param = free_params[0] if free_params else None
+        y_param = free_params[1] if len(free_params) == 2 else None
+    common = {"parameter_count": param_count, "fixed": fixed, "aggregate": aggregate}
 
+    if x_param is not None and y_param is None:
+        # 单参数：生成参数平原数据
+        data_points = line_points(x_param)
+        best_point = max(data_points, key=lambda x: x["value"])
         return {
-            "parameter_count": 1,
+            **common,
             "visualization_type": "line_chart",
-            "parameter_name": param_name,
+            "parameter_name": x_param,
             "data": data_points,
-            "best_parameter": max(data_points, key=lambda x: x["value"])["parameter"],
-            "best_value": max(data_points, key=lambda x: x["value"])["value"]
+            "best_parameter": best_point["parameter"],
+            "best_value": best_point["value"]
         }
 
-    elif param_count == 2:
+    elif x_param is not None:
         # 双参数：生成热力图数据
-        param1_name, param2_name = param_names[0], param_names[1]
+        cells = group_by([x_param, y_param])
+        param1_values = sorted({axis_key[0] for axis_key in cells})
+        param2_values = sorted({axis_key[1] for axis_key in cells})
 
-        # 收集所有参数值
-        param1_values = sorted(set(result.parameters[param1_name] for result in results))
-        param2_values = sorted(set(result.parameters[param2_name] for result in results))
-
-        # 创建热力图矩阵
         heatmap_data = []
-        best_value = float('-inf')
-        best_params = None
-
         for p1_val in param1_values:
             row = []
             for p2_val in param2_values:
-                # 查找对应的结果
-                matching_result = None
-                for result in results:
-                    if (result.parameters[param1_name] == p1_val and
-                        result.parameters[param2_name] == p2_val):
-                        matching_result = result
-                        break
-
-                if matching_result:
-                    metric_value = get_metric_value(matching_result)
-                    row.append({
-                        "value": metric_value,
-                        "parameters": {param1_name: p1_val, param2_name: p2_val},
-                        "result": matching_result
-                    })
-
-                    if metric_value > best_value:
-                        best_value = metric_value
-                        best_params = {param1_name: p1_val, param2_name: p2_val}
-                else:
-                    row.append({"value": None, "parameters": {param1_name: p1_val, param2_name: p2_val}})
-
+                cell = cells.get((p1_val, p2_val), {"value": None, "count": 0, "result_id": None})
+                row.append({**cell, "parameters": {x_param: p1_val, y_param: p2_val}})
             heatmap_data.append(row)
 
+        best_key = max(cells, key=lambda axis_key: cells[axis_key]["value"])
         return {
-            "parameter_count": 2,
+            **common,
             "visualization_type": "heatmap",
-            "parameter_names": [param1_name, param2_name],
+            "parameter_names": [x_param, y_param],
             "parameter1_values": param1_values,
             "parameter2_values": param2_values,
             "heatmap_data": heatmap_data,
-            "best_parameters": best_params,
-            "best_value": best_value
+            "best_parameters": {x_param: best_key[0], y_param: best_key[1]},
+            "best_value": cells[best_key]["value"]
         }
 
     else:
-        # 多参数：返回表格数据
-        data_points = []
-        for result in results:
-            metric_value = get_metric_value(result)
-            data_points.append({
-                "parameters": result.parameters,
-                "value": metric_value,
-                "result": result
-            })
-
-        # 按指标值排序
+        # 多参数：返回最好的参数组合和每个参数的边际分布
+        data_points = [{"parameters": dict(zip(param_names, key)), **cell} for key, cell in group_by(param_names).items()]
         data_points.sort(key=lambda x: x["value"], reverse=True)
 
         return {
-            "parameter_count": param_count,
+            **common,
             "visualization_type": "table",
             "parameter_names": param_names,
             "data": data_points[:20],  # 只返回前20个结果
-            "best_parameters": data_points[0]["parameters"] if data_points else None,
-            "best_value": data_points[0]["value"] if data_points else None
+            "marginals": {name: line_points(name) for name in free_params},
+            "best_parameters": data_points[0]["parameters"],
+            "best_value": data_points[0]["value"]
         }
 
+# 优化结果可以排序和数值过滤的列，以及只能做相等过滤的列
+RESULT_TABLE_NUMERIC_FIELDS = [name for name, field in BacktestResult.model_fields.items() if field.annotation in (int, float)]
+RESULT_TABLE_TEXT_FIELDS = ["symbol", "strategy"]
+
+# 各任务优化结果的列式表，结果数量变化（任务仍在运行）时重建
+result_tables: Dict[str, ResultTable] = {}
+
+def optimization_result_table(task_id: str, results: List[BacktestResult]) -> ResultTable:
+    """获取任务的结果列式表，排序下标随表缓存，之后的请求不再排序"""
+    table = result_tables.get(task_id)
+    if table is None or table.size != len(results):
+        table = ResultTable(results, RESULT_TABLE_NUMERIC_FIELDS, RESULT_TABLE_TEXT_FIELDS)
+        result_tables[task_id] = table
+    return table
+
+def results_cursor_signature(*parts: Any) -> str:
+    """分页游标绑定的查询条件，条件或结果数量变化后旧游标失效"""
+    return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()[:12]
+
+def encode_results_cursor(offset: int, signature: str) -> str:
+    return base64.urlsafe_b64encode(f"{offset}:{signature}".encode("utf-8")).decode("ascii")
+
+def decode_results_cursor(cursor: Optional[str], signature: str) -> int:
+    """解析分页游标，返回起始位置"""
+    if not cursor:
+        return 0
+    try:
+        offset, cursor_signature = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split(":")
+        offset = int(offset)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    if cursor_signature != signature or offset < 0:
+        raise HTTPException(status_code=400, detail="分页游标与当前查询不匹配，请从第一页重新查询")
+    return offset
+
 @router.get("/tasks/{task_id}/optimization-results")
 async def get_optimization_results(
     task_id: str,
     sort_by: str = "sharpe_ratio",
     order: str = "desc",
-    limit: int = 10
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    filter_expression: Optional[str] = Query(None, alias="filter", description="过滤条件，如 max_drawdown < 0.3, sharpe_ratio >= 1"),
+    fields: Optional[str] = Query(None, description="逗号分隔的结果字段，默认全部"),
+    max_points: Optional[int] = Query(None, ge=3, description="资金曲线最大点数，默认全部"),
+    equity_format: str = Query("rows", description="资金曲线格式: rows 或 columns")
 ):
-    """获取参数优化结果，支持排序和限制数量"""
-    if task_id not in backtest_tasks:
-        raise HTTPException(status_code=404, detail="Task not found")
-
-    task = backtest_tasks[task_id]
+    """获取参数优化结果，支持排序、过滤、游标分页和字段选择"""
+    task = await get_task(task_id)
     if not task.results:
         return {"message": "No optimization results available", "results": []}
 
-    # 复制结果列表以避免修改原始数据
-    results = task.results.copy()
-
-    # 排序
-    reverse = (order.lower() == "desc")
-    if sort_by == "sharpe_ratio":
-        results.sort(key=lambda x: x.sharpe_ratio or 0, reverse=reverse)
-    elif sort_by == "final_return":
-        results.sort(key=lambda x: x.final_return or 0, reverse=reverse)
-    elif sort_by == "max_drawdown":
-        results.sort(key=lambda x: x.max_drawdown or 0, reverse=not reverse)  # 回撤越小越好
-    elif sort_by == "win_rate":
-        results.sort(key=lambda x: x.win_rate or 0, reverse=reverse)
-    elif sort_by == "total_trades":
-        results.sort(key=lambda x: x.total_trades or 0, reverse=reverse)
-
-    # 限制数量
-    limited_results = results[:limit]
+    if sort_by not in RESULT_TABLE_NUMERIC_FIELDS:
+        raise HTTPException(status_code=400, detail=f"不支持排序的字段: {sort_by}")
+    if order.lower() not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order只支持: asc, desc")
+    selected = parse_result_fields(fields)
 
+    results = task.results
+    table = optimization_result_table(task_id, results)
+    try:
+        filters = table.parse_filters(filter_expression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 回撤越小越好，desc表示回撤从小到大
+    descending = (order.lower() == "desc") != (sort_by == "max_drawdown")
+    signature = results_cursor_signature(sort_by, order.lower(), filters, table.size)
+    offset = decode_results_cursor(cursor, signature)
+    rows, total_matched = table.query(sort_by, descending, filters, offset, limit)
+
+    next_offset = offset + len(rows)
     return {
         "task_id": task_id,
-        "total_combinations": len(task.results),
-        "showing": len(limited_results),
+        "total_combinations": len(results),
+        "total_matched": total_matched,
+        "showing": len(rows),
         "sort_by": sort_by,
         "order": order,
-        "results": limited_results
+        "filter": filter_expression,
+        "next_cursor": encode_results_cursor(next_offset, signature) if next_offset < total_matched else None,
+        "results": [result_payload(results[row], selected, max_points, equity_format) for row in rows]
     }
 
 @router.get("/tasks/{task_id}/parameter-analysis")
 async def get_parameter_analysis(
     task_id: str,
-    metric: str = "sharpe_ratio"
+    metric: str = "sharpe_ratio",
+    x_param: Optional[str] = Query(None, description="热力图横轴参数，只指定横轴时生成参数平原"),
+    y_param: Optional[str] = Query(None, description="热力图纵轴参数"),
+    fixed: Optional[str] = Query(None, description="固定取值的参数，格式 name:value,name:value"),
+    aggregate: str = Query("max", description="其余参数的聚合方式: max 或 mean"),
+    symbol: Optional[str] = Query(None, description="只分析指定交易对的结果")
 ):
-    """获取参数分析数据，支持参数平原和热力图"""
-    if task_id not in backtest_tasks:
-        raise HTTPException(status_code=404, detail="Task not found")
-
-    task = backtest_tasks[task_id]
+    """获取参数分析数据，支持参数平原、热力图、多参数的二维切片和边际分布"""
+    task = await get_task(task_id)
     if not task.results:
         return {"message": "No optimization results available", "analysis": None}
 
+    fixed_params = {}
+    for item in filter(None, (part.strip() for part in (fixed or "").split(","))):
+        name, sep, value = item.partition(":")
+        if not sep:
+            raise HTTPException(status_code=400, detail=f"fixed格式错误: {item}，应为 name:value")
+        fixed_params[name.strip()] = value.strip()
+
+    results = [r for r in task.results if r.symbol == symbol] if symbol else task.results
+
     # 分析参数维度
-    analysis = analyze_parameter_space(task.results, metric)
+    analysis = analyze_parameter_space(results, metric, x_param, y_param, fixed_params, aggregate)
 
     return {
         "task_id": task_id,
@@ -2419,13 +2861,47 @@ async def get_parameter_analysis(
         "analysis": analysis
     }
 
+@router.get("/tasks/{task_id}/results/{result_id}")
+async def get_task_result(
+    task_id: str,
+    result_id: str,
+    fields: Optional[str] = Query(None, description="逗号分隔的结果字段，默认全部"),
+    max_points: Optional[int] = Query(None, ge=3, description="资金曲线最大点数，默认全部"),
+    equity_format: str = Query("rows", description="资金曲线格式: rows 或 columns")
+):
+    """按result_id获取单个回测结果，参数分析只返回result_id，完整结果由此获取"""
+    task = await get_task(task_id)
+    for result in task.results:
+        if result.result_id == result_id:
+            return result_payload(result, parse_result_fields(fields), max_points, equity_format)
+    raise HTTPException(status_code=404, detail="Result not found")
+
+@router.get("/cache/stats")
+async def get_result_cache_stats():
+    """获取回测结果缓存的命中统计"""
+    return {"enabled": settings.result_cache_enabled, **(await asyncio.to_thread(backtest_result_cache.get_stats))}
+
+@router.delete("/cache")
+async def clear_result_cache():
+    """清空回测结果缓存"""
+    removed = await asyncio.to_thread(backtest_result_cache.clear)
+    return {"message": f"已清空回测结果缓存，删除 {removed} 个缓存文件"}
+
 @router.delete("/tasks/{task_id}")
 async def delete_backtest_task(task_id: str):
-    """删除回测任务"""
+    """删除回测任务，排队中或运行中的任务先取消"""
     if task_id not in backtest_tasks:
         raise HTTPException(status_code=404, detail="Task not found")
 
+    task_queue.cancel(task_id)
+    queued_requests.pop(task_id, None)
+    result_tables.pop(task_id, None)
+    unloaded_results.pop(task_id, None)
     del backtest_tasks[task_id]
+    task_events.discard(task_id)
+    if task_persistence_enabled():
+        async with SessionLocal() as db:
+            await db_service.delete_backtest_task(db, task_id)
     return {"message": "Task deleted successfully"}
 
 
@@ -3019,7 +3495,7 @@ async def ensure_bn_data_config(config_path: str):
 
 # 修改主回测接口，集成按需数据获取
 @router.post("/run-with-auto-data")
-async def run_backtest_with_auto_data(request: BacktestRequest, background_tasks: BackgroundTasks):
+async def run_backtest_with_auto_data(request: BacktestRequest):
     """运行回测 - 使用本地数据源，创建后台任务"""
     import logging
     import uuid
@@ -3041,8 +3517,8 @@ async def run_backtest_with_auto_data(request: BacktestRequest, background_tasks
         )
         backtest_tasks[task_id] = task_status
 
-        # 在后台运行回测
-        background_tasks.add_task(run_backtest_with_auto_data_task, task_id, request)
+        # 提交到任务队列
+        await submit_task(task_id, "auto_backtest", request)
 
         return {
             "task_id": task_id,
@@ -3118,23 +3594,8 @@ async def run_backtest_with_auto_data_task(task_id: str, request: BacktestReques
         )
 
         # 执行回测
-        backtest_results = []
-        for i, symbol in enumerate(ready_symbols):
-            task_status.message = f"正在回测 {symbol}..."
-            task_status.progress = (i / len(ready_symbols)) * 100
-            task_status.symbols_completed = i
-
-            logger.info(f"🔄 回测 {symbol}")
-            try:
-                result = await run_real_backtest(symbol, filtered_request)
-                if result:
-                    result.task_id = task_id
-                    backtest_results.append(result)
-                    logger.info(f"✅ {symbol}: 回测完成")
-                else:
-                    logger.warning(f"⚠️ {symbol}: 回测失败")
-            except Exception as e:
-                logger.error(f"❌ {symbol}: 回测异常: {str(e)}")
+        logger.info(f"🔄 回测 {len(ready_symbols)} 个交易对")
+        backtest_results = await run_symbol_backtests(task_id, ready_symbols, filtered_request)
 
         # 更新任务状态
         task_status.symbols_completed = len(ready_symbols)
@@ -3333,3 +3794,300 @@ async def get_available_symbols():
         logger = logging.getLogger(__name__)
         logger.error(f"❌ 获取可用交易对失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取可用交易对失败: {str(e)}")
+
+
+# ==================== 任务队列 ====================
+
+# 任务类型 -> (请求模型, 执行函数)
+TASK_RUNNERS = {
+    "backtest": (BacktestRequest, run_backtest_task),
+    "auto_backtest": (BacktestRequest, run_backtest_with_auto_data_task),
+    "optimization": (OptimizationRequest, run_optimization_task),
+}
+
+# 各类任务的优先级，数值越小越先执行：交互式回测优先于批量参数优化
+TASK_PRIORITIES = {"backtest": 0, "auto_backtest": 0, "optimization": 10}
+
+# 排队和运行中任务的类型和请求，任务结束后删除
+queued_requests: Dict[str, Tuple[str, BaseModel]] = {}
+
+
+def task_persistence_enabled() -> bool:
+    """内存存储模式下任务只保存在backtest_tasks中，不需要持久化"""
+    return not db_service.use_memory
+
+
+async def persist_task(task_id: str, update_data: Dict[str, Any]):
+    """更新数据库中的任务记录，失败时只记录日志，不影响任务执行"""
+    if not task_persistence_enabled():
+        return
+    try:
+        async with SessionLocal() as db:
+            await db_service.update_backtest_task(db, task_id, update_data)
+    except Exception as e:
+        logger.error(f"❌ 保存任务状态失败 {task_id}: {e}")
+
+
+def result_record(result: BacktestResult, ordinal: Optional[int] = None) -> Dict[str, Any]:
+    """
+    回测结果转为数据库记录，资金曲线以列式保存，其余字段完整保存在statistics中
+
+    Args:
+        result: 回测结果
+        ordinal: 结果在任务结果中的位置，恢复任务时按此排序
+    """
+    equity_curve = (result.equity_curve_columns.model_dump() if result.equity_curve_columns
+                    else result.equity_curve)
+    return {
+        "id": result.result_id,
+        "task_id": result.task_id,
+        "ordinal": ordinal,
+        "symbol": result.symbol,
+        "strategy": result.strategy,
+        "parameters": result.parameters,
+        "final_return": result.final_return,
+        "annual_return": result.annual_return,
+        "max_drawdown": result.max_drawdown,
+        "sharpe_ratio": result.sharpe_ratio,
+        "win_rate": result.win_rate,
+        "profit_loss_ratio": result.profit_factor,
+        "total_trades": result.total_trades,
+        "equity_curve": equity_curve,
+        "trade_records": [trade.model_dump(mode="json") for trade in result.trade_records],
+        "statistics": result.model_dump(mode="json", exclude={"equity_curve", "equity_curve_columns", "trade_records"}),
+    }
+
+
+def result_from_record(record: Dict[str, Any]) -> BacktestResult:
+    """由数据库记录恢复回测结果"""
+    data = {"result_id": record["id"], **(record.get("statistics") or {}),
+            "trade_records": record.get("trade_records") or []}
+    equity_curve = record.get("equity_curve") or []
+    if isinstance(equity_curve, dict):
+        data["equity_curve_columns"] = equity_curve
+    else:
+        data["equity_curve"] = equity_curve
+    return BacktestResult(**data)
+
+
+async def submit_task(task_id: str, task_type: str, request: BaseModel):
+    """
+    任务写入数据库后提交到任务队列，调用前需要已在backtest_tasks中创建任务状态
+
+    Args:
+        task_id: 任务ID
+        task_type: TASK_RUNNERS中的任务类型
+        request: 任务请求，重启后据此恢复任务
+    """
+    priority = TASK_PRIORITIES[task_type]
+    queued_requests[task_id] = (task_type, request)
+
+    if task_persistence_enabled():
+        task_status = backtest_tasks[task_id]
+        parameters = request.parameter_ranges if task_type == "optimization" else request.parameters
+        try:
+            async with SessionLocal() as db:
+                await db_service.create_backtest_task(db, {
+                    "task_id": task_id,
+                    "status": "pending",
+                    "message": task_status.message,
+                    "task_type": task_type,
+                    "priority": priority,
+                    "request": request.model_dump(mode="json"),
+                    "symbols": request.symbols,
+                    "strategy": request.strategy,
+                    "parameters": parameters,
+                    "date_start": request.date_start,
+                    "date_end": request.date_end,
+                    "rule_type": request.rule_type,
+                    "leverage_rate": request.leverage_rate,
+                    "c_rate": request.c_rate,
+                    "slippage": request.slippage,
+                    "symbols_total": task_status.symbols_total,
+                })
+        except Exception as e:
+            logger.error(f"❌ 保存任务失败 {task_id}: {e}")
+
+    task_queue.submit(task_id, priority)
+
+
+async def finish_cancelled_task(task_id: str):
+    """把任务标记为已取消"""
+    task_status = backtest_tasks.get(task_id)
+    if task_status is not None:
+        task_status.status = "cancelled"
+        task_status.message = "任务已取消"
+    queued_requests.pop(task_id, None)
+    await persist_task(task_id, {"status": "cancelled", "message": "任务已取消", "cancel_requested": True,
+                                 "completed_at": datetime.utcnow()})
+    task_events.finish(task_id)
+
+
+async def execute_queued_task(task_id: str):
+    """任务队列的处理函数：执行任务，并把状态和结果写入数据库"""
+    task_type, request = queued_requests[task_id]
+    runner = TASK_RUNNERS[task_type][1]
+    task_status = backtest_tasks[task_id]
+
+    await persist_task(task_id, {"status": "running", "started_at": datetime.utcnow()})
+    try:
+        await runner(task_id, request)
+    except asyncio.CancelledError:
+        # 用户取消时记录为已取消；服务关闭时保持running状态，重启后重新排队
+        if task_queue.is_cancelled(task_id):
+            await finish_cancelled_task(task_id)
+        raise
+    task_events.finish(task_id)
+
+    # 先保存结果再更新状态，保存过程中服务关闭时任务仍是running状态，重启后重新执行
+    queued_requests.pop(task_id, None)
+    if task_persistence_enabled() and task_status.results:
+        try:
+            async with SessionLocal() as db:
+                await db_service.create_backtest_results(
+                    db, [result_record(r, ordinal) for ordinal, r in enumerate(task_status.results)])
+        except Exception as e:
+            logger.error(f"❌ 保存回测结果失败 {task_id}: {e}")
+    await persist_task(task_id, {
+        "status": task_status.status,
+        "message": task_status.message,
+        "progress": task_status.progress,
+        "symbols_completed": task_status.symbols_completed,
+        "completed_at": datetime.utcnow(),
+    })
+
+
+task_queue.set_handler(execute_queued_task)
+
+
+async def load_task_results(task_id: str, task_type: str):
+    """从数据库载入已结束任务的结果，按保存时在任务结果中的位置排列"""
+    async with SessionLocal() as db:
+        records = await db_service.get_backtest_results(db, task_id, limit=None)
+    results = []
+    for record in records:
+        try:
+            results.append(result_from_record(record))
+        except Exception as e:
+            logger.warning(f"⚠️ 跳过无法恢复的回测结果 {record.get('id')}: {e}")
+    if task_type == "optimization" and any(record.get("ordinal") is None for record in records):
+        # 没有保存位置的旧结果，按run_optimization_task保存时的顺序排列
+        results.sort(key=lambda x: x.sharpe_ratio, reverse=True)
+    task_status = backtest_tasks.get(task_id)
+    if task_status is not None and task_id in unloaded_results:
+        task_status.results = results
+    unloaded_results.pop(task_id, None)
+
+
+async def ensure_task_results(task_id: str):
+    """任务的结果尚未载入时从数据库载入，同时访问时共用一次载入，载入失败时在下次访问时重试"""
+    if task_id not in unloaded_results:
+        return
+    load = _result_loads.get(task_id)
+    if load is None:
+        load = asyncio.create_task(load_task_results(task_id, unloaded_results[task_id]))
+        _result_loads[task_id] = load
+        load.add_done_callback(lambda _: _result_loads.pop(task_id, None))
+    try:
+        # 请求断开时载入继续完成
+        await asyncio.shield(load)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"❌ 载入任务结果失败 {task_id}: {e}")
+
+
+async def get_task(task_id: str) -> BacktestStatus:
+    """
+    获取任务状态，重启后恢复的已结束任务在第一次访问时载入结果
+
+    Raises:
+        HTTPException: 任务不存在
+    """
+    if task_id not in backtest_tasks:
+        raise HTTPException(status_code=404, detail="Task not found")
+    await ensure_task_results(task_id)
+    return backtest_tasks[task_id]
+
+
+async def restore_backtest_tasks():
+    """
+    应用启动时从数据库恢复任务：排队中和重启前正在运行的任务重新排队（运行中的任务从头执行），
+    最近结束的task_history_limit个任务载入任务状态，结果在第一次访问任务时再载入（见get_task）
+    """
+    if not task_persistence_enabled():
+        return
+
+    try:
+        async with SessionLocal() as db:
+            unfinished = []
+            for status in ("pending", "running"):
+                unfinished.extend(await db_service.get_backtest_tasks(db, limit=None, status=status))
+
+            finished = []
+            for status in FINISHED_STATUSES:
+                finished.extend(await db_service.get_backtest_tasks(db, limit=None, status=status))
+            finished.sort(key=lambda t: t["created_at"], reverse=True)
+            finished = finished[:settings.task_history_limit]
+
+            for task in reversed(finished):
+                backtest_tasks[task["task_id"]] = BacktestStatus(
+                    task_id=task["task_id"],
+                    status=task["status"],
+                    progress=task["progress"] or 0.0,
+                    message=task["message"] or "",
+                    symbols_total=task["symbols_total"] or 0,
+                    symbols_completed=task["symbols_completed"] or 0,
+                )
+                unloaded_results[task["task_id"]] = task["task_type"] or "backtest"
+
+            unfinished.sort(key=lambda t: (t["priority"] or 0, t["created_at"]))
+            for task in unfinished:
+                task_id = task["task_id"]
+                task_type = task["task_type"] or "backtest"
+                if not task["request"] or task_type not in TASK_RUNNERS:
+                    await db_service.update_backtest_task(db, task_id, {
+                        "status": "failed", "message": "任务请求缺失，无法恢复", "completed_at": datetime.utcnow()})
+                    continue
+                request = TASK_RUNNERS[task_type][0](**task["request"])
+                message = "服务重启后重新排队"
+                backtest_tasks[task_id] = BacktestStatus(
+                    task_id=task_id, status="pending", message=message, symbols_total=len(request.symbols))
+                await db_service.update_backtest_task(db, task_id, {
+                    "status": "pending", "message": message, "progress": 0.0, "symbols_completed": 0})
+                # 清理上次执行中途保存的结果
+                await db_service.delete_backtest_results(db, task_id)
+                queued_requests[task_id] = (task_type, request)
+                task_queue.submit(task_id, task["priority"] or 0)
+
+        logger.info(f"✅ 恢复任务: {len(unfinished)} 个重新排队, {len(finished)} 个已结束")
+    except Exception as e:
+        logger.error(f"❌ 恢复任务失败: {e}")
+
+
+@router.post("/tasks/{task_id}/cancel")
+async def cancel_backtest_task(task_id: str):
+    """取消排队中或运行中的任务，运行中的任务已提交到进程池的回测会在后台执行完，结果被丢弃"""
+    if task_id not in backtest_tasks:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    task_status = backtest_tasks[task_id]
+    if task_status.status in FINISHED_STATUSES:
+        raise HTTPException(status_code=400, detail=f"任务已结束: {task_status.status}")
+
+    if task_queue.cancel(task_id):
+        await persist_task(task_id, {"cancel_requested": True})
+        return {"task_id": task_id, "status": "cancelling", "message": "正在取消运行中的任务"}
+
+    await finish_cancelled_task(task_id)
+    return {"task_id": task_id, "status": "cancelled", "message": "任务已取消"}
+
+
+@router.get("/queue")
+async def get_task_queue_status():
+    """任务队列状态"""
+    return {
+        "workers": settings.task_queue_workers,
+        "queued": task_queue.queued_count(),
+        "running": task_queue.running_tasks(),
+    }
@@ -51,6 +51,18 @@ class Settings(BaseSettings):
     db_max_overflow: int = 20
     db_pool_timeout: int = 30
 
+    # 回测执行配置
+    backtest_process_workers: int = 0  # 回测进程池的进程数，0表示使用CPU核数
+    backtest_symbol_concurrency: int = 4  # 单个回测任务同时回测的交易对数量上限
+    task_queue_workers: int = 2  # 同时运行的回测/优化任务数量上限，其余任务排队
+    task_history_limit: int = 100  # 启动时从数据库载入的已结束任务数量
+
+    # 回测结果缓存配置
+    result_cache_enabled: bool = True
+    result_cache_memory_size: int = 64  # 内存中保留的回测结果数量
+    result_cache_dir: str = os.path.join(os.path.dirname(__file__), "..", "..", "cache", "backtest_results")  # 为空表示只使用内存
+    result_cache_max_disk_mb: int = 512  # 磁盘缓存的大小上限(MB)，超过时删除最久未使用的结果，0表示不限制
+
     @property
     def async_database_url(self) -> str:
         """获取异步数据库URL"""
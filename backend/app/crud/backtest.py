@@ -13,6 +13,11 @@ from ..models.backtest import BacktestTask, BacktestResult
 class CRUDBacktestTask(CRUDBase[BacktestTask, Dict[str, Any], Dict[str, Any]]):
     """回测任务CRUD操作类"""
     
+    async def get(self, db: AsyncSession, id: Any) -> Optional[BacktestTask]:
+        """根据任务ID获取任务（主键为task_id）"""
+        result = await db.execute(select(self.model).where(self.model.task_id == id))
+        return result.scalar_one_or_none()
+    
     async def get_by_status(
         self, 
         db: AsyncSession, 
@@ -61,7 +66,7 @@ class CRUDBacktestTask(CRUDBase[BacktestTask, Dict[str, Any], Dict[str, Any]]):
             update_data["message"] = message
         if progress is not None:
             update_data["progress"] = progress
-        if status in ["completed", "failed"]:
+        if status in ["completed", "failed", "cancelled"]:
             update_data["completed_at"] = datetime.utcnow()
         
         return await self.update(db, db_obj=task, obj_in=update_data)
@@ -113,10 +118,18 @@ class CRUDBacktestResult(CRUDBase[BacktestResult, Dict[str, Any], Dict[str, Any]
         db: AsyncSession, 
         task_id: str,
         skip: int = 0,
-        limit: int = 100
+        limit: Optional[int] = 100
     ) -> List[BacktestResult]:
-        """根据任务ID获取结果"""
-        return await self.get_multi_by_field(db, "task_id", task_id, skip, limit)
+        """根据任务ID获取结果，按结果在任务中的位置排序（旧数据没有位置时按创建时间和ID），limit为None时返回全部结果"""
+        query = (
+            select(self.model)
+            .where(self.model.task_id == task_id)
+            .order_by(self.model.ordinal, self.model.created_at, self.model.id)
+            .offset(skip)
+            .limit(limit)
+        )
+        result = await db.execute(query)
+        return result.scalars().all()
     
     async def get_by_symbol(
         self, 
@@ -187,6 +200,12 @@ class CRUDBacktestResult(CRUDBase[BacktestResult, Dict[str, Any], Dict[str, Any]
             "worst_return": float(row.min_return or 0),
         }
     
+    async def create_many(self, db: AsyncSession, objs_in: List[Dict[str, Any]]) -> int:
+        """在一个事务中批量创建结果"""
+        db.add_all([self.model(**obj_in) for obj_in in objs_in])
+        await db.commit()
+        return len(objs_in)
+    
     async def delete_results_by_task(self, db: AsyncSession, task_id: str) -> int:
         """删除指定任务的所有结果"""
         query = select(self.model).where(self.model.task_id == task_id)
@@ -57,6 +57,27 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+def add_missing_columns(sync_conn):
+    """
+    为已存在的表补充模型中新增的列
+    create_all不会修改已存在的表，新增的列在旧数据中为NULL
+    """
+    from sqlalchemy import inspect
+    from .base import Base
+
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            logger.info(f"数据库表 {table.name} 新增列: {column.name}")
+
+
 async def init_db():
     """
     初始化数据库
@@ -69,6 +90,8 @@ async def init_db():
         async with engine.begin() as conn:
             # 创建所有表
             await conn.run_sync(Base.metadata.create_all)
+            # 补充已存在的表中缺少的列
+            await conn.run_sync(add_missing_columns)
         logger.info("数据库初始化成功")
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}")
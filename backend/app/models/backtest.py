@@ -17,9 +17,15 @@ class BacktestTask(Base):
     task_id = Column(String(36), primary_key=True, index=True)
     
     # 任务基本信息
-    status = Column(String(50), nullable=False, index=True, default="pending")  # pending, running, completed, failed
+    status = Column(String(50), nullable=False, index=True, default="pending")  # pending, running, completed, failed, cancelled
     message = Column(Text)
     progress = Column(Float, default=0.0)
+
+    # 任务队列
+    task_type = Column(String(20), nullable=False, default="backtest")  # backtest, optimization, auto_backtest
+    priority = Column(Integer, nullable=False, default=0)  # 数值越小越先执行
+    request = Column(JSON)  # 完整的任务请求，重启后据此恢复任务
+    cancel_requested = Column(Boolean, default=False)
     
     # 回测配置
     symbols = Column(JSON, nullable=False)  # 交易对列表
@@ -43,11 +49,13 @@ class BacktestTask(Base):
     # 时间戳
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
     
     # 创建索引
     __table_args__ = (
         Index('idx_backtest_status_created', 'status', 'created_at'),
+        Index('idx_backtest_queue', 'status', 'priority', 'created_at'),
         Index('idx_backtest_strategy', 'strategy'),
     )
     
@@ -69,8 +77,13 @@ class BacktestTask(Base):
             "slippage": self.slippage,
             "symbols_total": self.symbols_total,
             "symbols_completed": self.symbols_completed,
+            "task_type": self.task_type,
+            "priority": self.priority,
+            "request": self.request or {},
+            "cancel_requested": self.cancel_requested,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
+            "started_at": self.started_at,
             "completed_at": self.completed_at,
         }
 
@@ -84,6 +97,7 @@ class BacktestResult(Base):
     
     # 关联任务
     task_id = Column(String(36), nullable=False, index=True)
+    ordinal = Column(Integer)  # 结果在任务结果中的位置，恢复任务时按此排序
     
     # 基本信息
     symbol = Column(String(50), nullable=False, index=True)
@@ -119,6 +133,7 @@ class BacktestResult(Base):
         return {
             "id": self.id,
             "task_id": self.task_id,
+            "ordinal": self.ordinal,
             "symbol": self.symbol,
             "strategy": self.strategy,
             "parameters": self.parameters or {},
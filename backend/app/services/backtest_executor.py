@@ -0,0 +1,74 @@
+"""
+回测进程池
+回测中的信号计算、资金曲线和统计都是同步的pandas计算，放在事件循环中运行会阻塞所有接口，
+因此由应用生命周期管理一个进程池，按交易对把回测提交到进程池中执行。
+进程池用spawn方式启动子进程：fork会把事件循环、数据库连接池和线程持有的锁复制到子进程中，
+子进程重新导入模块，回测函数需要定义在模块顶层
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BacktestExecutor:
+    """回测进程池，由应用生命周期启动和关闭"""
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.max_workers = 0
+
+    @property
+    def started(self) -> bool:
+        return self._pool is not None
+
+    def start(self, max_workers: int = 0):
+        """
+        启动进程池
+
+        Args:
+            max_workers: 进程数量，0表示使用CPU核数
+        """
+        if self._pool is not None:
+            return
+        self.max_workers = max_workers if max_workers > 0 else (os.cpu_count() or 1)
+        self._pool = self._create_pool()
+        logger.info(f"✅ 回测进程池已启动，进程数: {self.max_workers}")
+
+    def shutdown(self):
+        """关闭进程池，取消尚未开始的回测"""
+        if self._pool is None:
+            return
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+        logger.info("✅ 回测进程池已关闭")
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        在进程池中执行同步函数，func和参数都需要可以pickle
+
+        进程池中的进程意外退出后进程池不可再用，此时重建进程池，并把本次调用的异常抛给调用方
+        """
+        if self._pool is None:
+            raise RuntimeError("回测进程池未启动")
+        pool = self._pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            if self._pool is pool:
+                logger.error("❌ 回测进程池异常退出，重建进程池")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._create_pool()
+            raise
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# 全局实例
+backtest_executor = BacktestExecutor()
@@ -231,20 +231,67 @@ class DatabaseService:
         result = await backtest_crud.result.create(db, obj_in=result_data)
         return result.to_dict()
     
-    async def get_backtest_results(
+    async def create_backtest_results(
+        self, 
+        db: Optional[AsyncSession], 
+        results_data: List[Dict[str, Any]]
+    ) -> int:
+        """批量创建回测结果"""
+        if self.use_memory:
+            for result_data in results_data:
+                await self.create_backtest_result(db, result_data)
+            return len(results_data)
+        
+        if not db:
+            raise ValueError("数据库会话不能为空")
+        
+        return await backtest_crud.result.create_many(db, results_data)
+    
+    async def delete_backtest_results(
+        self, 
+        db: Optional[AsyncSession], 
+        task_id: str
+    ) -> int:
+        """删除任务的全部回测结果"""
+        if self.use_memory:
+            return len(self._memory_storage["backtest_results"].pop(task_id, []))
+        
+        if not db:
+            raise ValueError("数据库会话不能为空")
+        
+        return await backtest_crud.result.delete_results_by_task(db, task_id)
+    
+    async def delete_backtest_task(
         self, 
         db: Optional[AsyncSession], 
         task_id: str
+    ) -> bool:
+        """删除回测任务及其结果"""
+        if self.use_memory:
+            self._memory_storage["backtest_results"].pop(task_id, None)
+            return self._memory_storage["backtest_tasks"].pop(task_id, None) is not None
+        
+        if not db:
+            raise ValueError("数据库会话不能为空")
+        
+        await backtest_crud.result.delete_results_by_task(db, task_id)
+        return await backtest_crud.task.remove(db, id=task_id) is not None
+    
+    async def get_backtest_results(
+        self, 
+        db: Optional[AsyncSession], 
+        task_id: str,
+        limit: Optional[int] = 100
     ) -> List[Dict[str, Any]]:
-        """获取回测结果"""
+        """获取回测结果，limit为None时返回全部结果"""
         if self.use_memory:
-            results = self._memory_storage["backtest_results"].get(task_id, [])
+            results = self._memory_storage["backtest_results"].get(task_id, [])[:limit]
             return [r.to_dict() if hasattr(r, 'to_dict') else r for r in results]
         
         if not db:
             raise ValueError("数据库会话不能为空")
         
-        results = await backtest_crud.result.get_by_task_id(db, task_id)
+        results = await backtest_crud.result.get_by_task_id(db, task_id, limit=limit)
         return [result.to_dict() for result in results]
     
     # ==================== 数据状态相关操作 ====================
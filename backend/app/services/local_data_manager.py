@@ -35,6 +35,7 @@ class LocalDataManager:
         self.spot_data: Optional[Dict] = None
         self.swap_data: Optional[Dict] = None
         self._data_loaded = False
+        self._loaded_fingerprint: Optional[str] = None
 
         # 创建数据目录（如果不存在）
         if not os.path.exists(data_dir):
@@ -43,10 +44,30 @@ class LocalDataManager:
 
         logger.info(f"✅ 初始化本地数据管理器，数据目录: {data_dir}")
 
+    def data_fingerprint(self) -> str:
+        """
+        数据文件指纹（文件大小和修改时间），数据文件更新后指纹随之改变
+
+        Returns:
+            指纹字符串
+        """
+        parts = []
+        for name in ("spot_dict.pkl", "swap_dict.pkl"):
+            try:
+                stat = os.stat(os.path.join(self.data_dir, name))
+                parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+            except OSError:
+                parts.append(f"{name}:missing")
+        return "|".join(parts)
+
     def _load_data(self) -> None:
-        """加载数据文件"""
-        if self._data_loaded:
+        """加载数据文件，数据文件更新后重新加载"""
+        fingerprint = self.data_fingerprint()
+        if self._data_loaded and fingerprint == self._loaded_fingerprint:
             return
+        if self._data_loaded:
+            logger.info("🔄 数据文件已更新，重新加载")
+        self._loaded_fingerprint = fingerprint
 
         try:
             logger.info("🔄 开始加载本地数据文件...")
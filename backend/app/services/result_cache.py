@@ -0,0 +1,245 @@
+"""
+回测结果缓存
+以回测请求的规范化哈希加数据文件指纹作为键，内存中保留最近使用的结果，同时写入磁盘，
+相同的请求再次提交时直接返回结果；数据文件变化后指纹改变，旧的结果不会再被命中。
+磁盘上每个数据指纹一个子目录，写入新指纹的结果时删除其他指纹的目录，当前目录超过大小上限时删除最久未使用的结果
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 回测计算逻辑变化导致旧结果失效时修改此版本号
+CACHE_VERSION = 2
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """
+    生成缓存键
+
+    Args:
+        payload: 决定回测结果的全部输入，需要可以JSON序列化
+
+    Returns:
+        规范化JSON的sha256
+    """
+    canonical = json.dumps({"version": CACHE_VERSION, **payload}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_cache_generation(fingerprint: str) -> str:
+    """
+    数据指纹对应的磁盘缓存子目录名，缓存版本号变化时同样视为新的一代
+
+    Args:
+        fingerprint: 数据文件指纹
+    """
+    return hashlib.sha256(f"{CACHE_VERSION}:{fingerprint}".encode("utf-8")).hexdigest()[:16]
+
+
+class ResultCache:
+    """两级结果缓存，值为序列化后的字符串（内存LRU + 磁盘目录），可以在多个线程中使用"""
+
+    def __init__(self, cache_dir: Optional[str] = None, memory_size: int = 64, max_disk_bytes: int = 0):
+        """
+        Args:
+            cache_dir: 磁盘缓存目录，None表示只使用内存
+            memory_size: 内存中保留的结果数量
+            max_disk_bytes: 磁盘缓存的大小上限，超过时按最近使用时间删除，0表示不限制
+        """
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()  # 保护内存LRU和统计，磁盘读写不持有锁
+        self._disk_lock = threading.Lock()  # 保护磁盘LRU，写入和删除磁盘文件时持有
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # 当前一代磁盘文件的使用顺序，{路径: 字节数}
+        self._disk_bytes = 0
+        self._generation: Optional[str] = None  # _disk对应的一代，第一次写入时载入
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _dir(self, generation: str) -> str:
+        return os.path.join(self.cache_dir, generation) if generation else self.cache_dir
+
+    def _path(self, key: str, generation: str) -> str:
+        return os.path.join(self._dir(generation), f"{key}.json")
+
+    def _use_generation(self, generation: str):
+        """
+        切换到generation：删除其他代的缓存文件，按修改时间载入当前目录的文件作为磁盘LRU，调用方需持有_disk_lock
+        """
+        if generation == self._generation:
+            return
+        if self._generation is not None:
+            # 数据文件已更新，内存中的旧结果也不会再被命中
+            with self._lock:
+                self._memory.clear()
+        self._generation = generation
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_dir() and entry.name != generation:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                elif entry.is_file() and entry.name.endswith(".json") and generation:
+                    os.remove(entry.path)
+        files = []
+        if os.path.isdir(self._dir(generation)):
+            for entry in os.scandir(self._dir(generation)):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        files.sort()
+        self._disk = OrderedDict((path, size) for _, path, size in files)
+        self._disk_bytes = sum(self._disk.values())
+
+    def _prune(self):
+        """删除最久未使用的磁盘文件直到不超过大小上限，刚写入的结果保留，调用方需持有_disk_lock"""
+        while self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+            path, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self.stats["evictions"] += 1
+
+    def _remember(self, key: str, value: str):
+        """调用方需持有锁"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str, generation: str = "") -> Optional[str]:
+        """
+        读取缓存，先查内存再查磁盘，磁盘命中的结果会放回内存，并更新文件的修改时间作为最近使用时间
+
+        Args:
+            key: 缓存键
+            generation: 数据指纹对应的一代(make_cache_generation)，空字符串表示直接放在缓存目录中
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+
+        if self.cache_dir:
+            path = self._path(key, generation)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = f.read()
+                with self._lock:
+                    self._remember(key, value)
+                    self.stats["disk_hits"] += 1
+                with self._disk_lock:
+                    if path in self._disk:
+                        self._disk.move_to_end(path)
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                return value
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"⚠️ 读取结果缓存失败: {e}")
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: str, generation: str = ""):
+        """
+        写入缓存，磁盘文件先写临时文件再替换，避免读到写了一半的结果。
+        写入新一代的结果时删除其他代的文件，写入后超过大小上限时删除最久未使用的文件
+
+        Args:
+            key: 缓存键
+            value: 序列化后的结果
+            generation: 数据指纹对应的一代，与get一致
+        """
+        if not self.cache_dir:
+            with self._lock:
+                self._remember(key, value)
+                self.stats["stores"] += 1
+            return
+        with self._disk_lock:
+            try:
+                self._use_generation(generation)
+                with self._lock:
+                    self._remember(key, value)
+                    self.stats["stores"] += 1
+                path = self._path(key, generation)
+                os.makedirs(self._dir(generation), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(value)
+                os.replace(tmp_path, path)
+                size = os.path.getsize(path)
+                self._disk_bytes += size - self._disk.pop(path, 0)
+                self._disk[path] = size
+                self._prune()
+            except OSError as e:
+                logger.warning(f"⚠️ 写入结果缓存失败: {e}")
+
+    def clear(self) -> int:
+        """
+        清空内存和磁盘缓存
+
+        Returns:
+            删除的磁盘文件数量
+        """
+        with self._lock:
+            self._memory.clear()
+        removed = 0
+        with self._disk_lock:
+            for path in self._disk_files():
+                os.remove(path)
+                removed += 1
+            self._disk.clear()
+            self._disk_bytes = 0
+        return removed
+
+    def _disk_files(self) -> List[str]:
+        """磁盘上全部的缓存文件，包括各代子目录中的文件"""
+        paths = []
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for root, _, names in os.walk(self.cache_dir):
+                paths.extend(os.path.join(root, name) for name in names if name.endswith(".json"))
+        return paths
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        disk_files = self._disk_files()
+        disk_bytes = 0
+        for path in disk_files:
+            try:
+                disk_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+        return {
+            **self.stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_size": self.memory_size,
+            "disk_entries": len(disk_files),
+            "disk_bytes": disk_bytes,
+            "max_disk_bytes": self.max_disk_bytes,
+            "cache_dir": self.cache_dir,
+        }
+
+
+# 全局实例
+backtest_result_cache = ResultCache(settings.result_cache_dir or None, settings.result_cache_memory_size,
+                                    settings.result_cache_max_disk_mb * 1024 * 1024)
@@ -0,0 +1,115 @@
+"""
+回测结果列式表
+参数优化会产生上千个（参数组合 × 交易对）结果，排行榜每次请求都对完整的结果列表排序代价很高。
+这里把结果的指标列存为numpy数组，各列的排序下标在第一次使用时计算并缓存，
+过滤条件按列向量化计算，分页只取排序下标中的一段
+"""
+import operator
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 过滤条件支持的比较运算符
+FILTER_OPERATORS = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+}
+
+_FILTER_PATTERN = re.compile(r"^\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(.+?)\s*$")
+
+Filter = Tuple[str, str, Any]
+
+
+class ResultTable:
+    """结果的列式索引，行号即结果在原列表中的位置，建立后不再修改"""
+
+    def __init__(self, records: List[Any], numeric_fields: Iterable[str], text_fields: Iterable[str] = ()):
+        """
+        Args:
+            records: 结果对象，按属性名读取列值
+            numeric_fields: 可以排序和数值比较的列，缺失值为NaN
+            text_fields: 只能做相等比较的列
+        """
+        self.size = len(records)
+        self.numeric: Dict[str, np.ndarray] = {
+            name: np.array([np.nan if getattr(r, name, None) is None else getattr(r, name) for r in records],
+                           dtype=float)
+            for name in numeric_fields
+        }
+        self.text: Dict[str, np.ndarray] = {
+            name: np.array([str(getattr(r, name, "")) for r in records], dtype=object)
+            for name in text_fields
+        }
+        self._sort_indexes: Dict[Tuple[str, bool], np.ndarray] = {}
+
+    def sort_index(self, column: str, descending: bool) -> np.ndarray:
+        """
+        列的排序下标，值相同的行保持原顺序，NaN排在最后
+
+        Args:
+            column: 数值列
+            descending: 是否降序
+        """
+        key = (column, descending)
+        if key not in self._sort_indexes:
+            values = self.numeric[column]
+            self._sort_indexes[key] = np.argsort(-values if descending else values, kind="stable")
+        return self._sort_indexes[key]
+
+    def parse_filters(self, expression: Optional[str]) -> List[Filter]:
+        """
+        解析过滤表达式，多个条件用逗号或and连接，如 "max_drawdown < 0.3, sharpe_ratio >= 1"
+        只接受列名、比较运算符和常量，不执行任意表达式
+
+        Raises:
+            ValueError: 表达式格式错误、列不存在或取值类型不匹配
+        """
+        filters: List[Filter] = []
+        if not expression:
+            return filters
+        for condition in re.split(r",|\s+and\s+", expression, flags=re.IGNORECASE):
+            if not condition.strip():
+                continue
+            match = _FILTER_PATTERN.match(condition)
+            if not match:
+                raise ValueError(f"过滤条件格式错误: {condition.strip()}")
+            column, op, raw_value = match.groups()
+            if column in self.numeric:
+                try:
+                    value = float(raw_value)
+                except ValueError:
+                    raise ValueError(f"{column} 的取值需要是数字: {raw_value}")
+            elif column in self.text:
+                if op not in ("==", "!="):
+                    raise ValueError(f"{column} 只支持 == 和 !=")
+                value = raw_value.strip("'\"")
+            else:
+                raise ValueError(f"不支持过滤的列: {column}")
+            filters.append((column, op, value))
+        return filters
+
+    def mask(self, filters: List[Filter]) -> np.ndarray:
+        """满足全部过滤条件的行"""
+        selected = np.ones(self.size, dtype=bool)
+        for column, op, value in filters:
+            values = self.numeric[column] if column in self.numeric else self.text[column]
+            selected &= np.asarray(FILTER_OPERATORS[op](values, value), dtype=bool)
+        return selected
+
+    def query(self, sort_by: str, descending: bool, filters: List[Filter],
+              offset: int, limit: int) -> Tuple[np.ndarray, int]:
+        """
+        排序、过滤后取一页
+
+        Returns:
+            (本页的行号, 满足过滤条件的总行数)
+        """
+        rows = self.sort_index(sort_by, descending)
+        if filters:
+            rows = rows[self.mask(filters)[rows]]
+        return rows[offset:offset + limit], len(rows)
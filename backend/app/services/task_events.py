@@ -0,0 +1,87 @@
+"""
+回测任务事件
+按完成顺序记录每个交易对/参数组合的结果摘要，并通知正在等待任务更新的推送连接（SSE），
+客户端不再需要反复轮询完整的任务状态。任务结束且没有推送连接后摘要即被释放，之后的连接按结果上记录的序号由任务结果生成摘要
+"""
+import asyncio
+from typing import Any, Dict, List, Set
+
+
+class TaskEvents:
+    """任务结果摘要和更新通知，只在事件循环所在的进程中使用"""
+
+    def __init__(self):
+        self._summaries: Dict[str, List[Dict[str, Any]]] = {}
+        self._listeners: Dict[str, Set[asyncio.Event]] = {}
+        self._streams: Dict[str, int] = {}  # 每个任务的推送连接数量
+        self._finished: Set[str] = set()
+
+    def publish(self, task_id: str, summary: Dict[str, Any]) -> int:
+        """追加一条结果摘要并通知监听者，返回摘要的index，即该结果在任务内按完成顺序的序号"""
+        summaries = self._summaries.setdefault(task_id, [])
+        index = len(summaries)
+        summaries.append({"index": index, **summary})
+        self.notify(task_id)
+        return index
+
+    def notify(self, task_id: str):
+        """任务进度有变化，唤醒等待该任务的连接"""
+        for event in self._listeners.get(task_id, ()):
+            event.set()
+
+    def summaries(self, task_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        """序号不小于since的结果摘要"""
+        return self._summaries.get(task_id, [])[since:]
+
+    def retained(self, task_id: str) -> bool:
+        """任务的结果摘要是否还保留在内存中"""
+        return task_id in self._summaries
+
+    def attach(self, task_id: str):
+        """推送连接开始"""
+        self._streams[task_id] = self._streams.get(task_id, 0) + 1
+
+    def detach(self, task_id: str):
+        """推送连接结束，任务已结束且没有其他连接时释放摘要"""
+        remaining = self._streams.get(task_id, 0) - 1
+        if remaining > 0:
+            self._streams[task_id] = remaining
+            return
+        self._streams.pop(task_id, None)
+        if task_id in self._finished:
+            self._release(task_id)
+
+    def finish(self, task_id: str):
+        """任务结束：没有推送连接时立即释放摘要，否则在最后一个连接结束时释放"""
+        self.notify(task_id)
+        if self._streams.get(task_id):
+            self._finished.add(task_id)
+        else:
+            self._release(task_id)
+
+    def _release(self, task_id: str):
+        self._summaries.pop(task_id, None)
+        self._finished.discard(task_id)
+
+    async def wait(self, task_id: str, timeout: float):
+        """等待任务更新，超时后返回，调用方据此检查没有主动通知的状态变化"""
+        event = asyncio.Event()
+        listeners = self._listeners.setdefault(task_id, set())
+        listeners.add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            listeners.discard(event)
+            if not listeners:
+                self._listeners.pop(task_id, None)
+
+    def discard(self, task_id: str):
+        """删除任务时清理摘要"""
+        self._release(task_id)
+        self.notify(task_id)
+
+
+# 全局实例
+task_events = TaskEvents()
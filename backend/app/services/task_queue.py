@@ -0,0 +1,126 @@
+"""
+回测任务队列
+任务按优先级（数值越小越先执行，同优先级先提交先执行）排队，由固定数量的worker协程执行，
+限制同时运行的CPU密集任务数量；支持取消排队中和运行中的任务。
+任务的持久化（提交、状态、结果、重启后恢复）由任务处理函数所在的模块负责
+"""
+import asyncio
+import itertools
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TaskHandler = Callable[[str], Awaitable[None]]
+
+
+class TaskQueue:
+    """优先级任务队列"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._pending: List[Tuple[int, int, str]] = []  # 队列启动前提交的任务
+        self._seq = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._queued: Set[str] = set()
+        self._cancelled: Set[str] = set()  # 已取消但尚未结束的任务，任务结束（或出队跳过）后移除
+        self._handler: Optional[TaskHandler] = None
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    def set_handler(self, handler: TaskHandler):
+        """设置任务处理函数，参数为task_id"""
+        self._handler = handler
+
+    def start(self, workers: int = 2):
+        """
+        启动worker协程，需要在事件循环中调用
+
+        Args:
+            workers: 同时运行的任务数量上限
+        """
+        if self.started:
+            return
+        self._queue = asyncio.PriorityQueue()
+        for item in self._pending:
+            self._queue.put_nowait(item)
+        self._pending.clear()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(max(1, workers))]
+        logger.info(f"✅ 任务队列已启动，并发任务数: {len(self._workers)}")
+
+    async def shutdown(self):
+        """停止worker，运行中的任务被取消，重启后由持久化的状态恢复"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        logger.info("✅ 任务队列已停止")
+
+    def submit(self, task_id: str, priority: int = 0):
+        """提交任务"""
+        self._cancelled.discard(task_id)
+        self._queued.add(task_id)
+        item = (priority, next(self._seq), task_id)
+        if self._queue is None:
+            self._pending.append(item)
+        else:
+            self._queue.put_nowait(item)
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        取消任务：排队中的任务出队时直接跳过，运行中的任务立即取消，已结束的任务不做处理
+
+        Returns:
+            任务是否正在运行
+        """
+        running = self._running.get(task_id)
+        if running is None and task_id not in self._queued:
+            return False
+        self._cancelled.add(task_id)
+        if running is not None:
+            running.cancel()
+            return True
+        return False
+
+    def is_cancelled(self, task_id: str) -> bool:
+        """任务是否已被取消，长时间运行的任务可以据此提前结束"""
+        return task_id in self._cancelled
+
+    def queued_count(self) -> int:
+        """排队中的任务数量（含已取消但尚未出队的任务）"""
+        return self._queue.qsize() if self._queue is not None else len(self._pending)
+
+    def running_tasks(self) -> List[str]:
+        """运行中的任务"""
+        return list(self._running)
+
+    async def _worker(self, index: int):
+        while True:
+            _, _, task_id = await self._queue.get()
+            self._queued.discard(task_id)
+            try:
+                if task_id in self._cancelled:
+                    continue
+                task = asyncio.create_task(self._handler(task_id))
+                self._running[task_id] = task
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    # worker本身被停止时继续向上抛出，否则是任务被取消
+                    if not task.cancelled() or task_id not in self._cancelled:
+                        raise
+                    logger.info(f"🛑 任务已取消: {task_id}")
+                except Exception as e:
+                    logger.error(f"❌ 任务执行异常 {task_id}: {e}")
+            finally:
+                self._running.pop(task_id, None)
+                self._cancelled.discard(task_id)
+                self._queue.task_done()
+
+
+# 全局实例
+task_queue = TaskQueue()
@@ -19,6 +19,8 @@ from app.api import data, backtest, strategies
 from app.core.config import settings
 from app.database.connection import init_db, close_db
 from app.services.database_service import db_service
+from app.services.backtest_executor import backtest_executor
+from app.services.task_queue import task_queue
 
 # 配置日志
 logging.basicConfig(
@@ -51,6 +53,13 @@ async def lifespan(app: FastAPI):
 
         logger.info(f"数据库模式: {'内存存储' if settings.use_memory_storage else '持久化存储'}")
 
+        # 启动回测进程池
+        backtest_executor.start(settings.backtest_process_workers)
+
+        # 恢复数据库中的任务并启动任务队列
+        await backtest.restore_backtest_tasks()
+        task_queue.start(settings.task_queue_workers)
+
     except Exception as e:
         logger.error(f"应用启动失败: {e}")
         raise
@@ -60,6 +69,9 @@ async def lifespan(app: FastAPI):
     # 关闭时的清理
     logger.info("🛑 NagaFlow Backend shutting down...")
 
+    await task_queue.shutdown()
+    backtest_executor.shutdown()
+
     try:
         if not settings.use_memory_storage:
             await close_db()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+资金曲线计算回归测试脚本
+对比向量化的 calculate_equity_curve_simple 与原逐行循环实现的结果
+"""
+import sys
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.api.backtest import calculate_equity_curve_simple, ensure_position_lag
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COMPARE_COLUMNS = ['trade_cost', 'net_return', 'equity_curve', 'drawdown']
+
+
+def legacy_equity_curve(df: pd.DataFrame, leverage_rate: float, c_rate: float, slippage: float) -> pd.DataFrame:
+    """原逐行循环实现，作为对照"""
+    df = df.copy()
+    df = ensure_position_lag(df)
+    df['pos_change'] = df['pos'].diff().fillna(0)
+    df['price_change'] = df['close'].pct_change().fillna(0)
+    df['strategy_return'] = df['pos'].shift(1) * df['price_change'] * leverage_rate
+    df['trade_value'] = abs(df['pos_change']) * df['close']
+
+    initial_capital = 10000.0
+    df['equity_curve_temp'] = float(initial_capital)
+    df['net_return'] = 0.0
+    df['trade_cost'] = 0.0
+
+    for i in range(1, len(df)):
+        prev_equity = df.iloc[i-1]['equity_curve_temp']
+        strategy_pnl = df.iloc[i]['strategy_return'] * prev_equity
+        if df.iloc[i]['pos_change'] != 0:
+            trade_cost_absolute = prev_equity * abs(df.iloc[i]['pos_change']) * (c_rate + slippage)
+        else:
+            trade_cost_absolute = 0
+        df.iloc[i, df.columns.get_loc('trade_cost')] = trade_cost_absolute
+        net_pnl = strategy_pnl - trade_cost_absolute
+        df.iloc[i, df.columns.get_loc('equity_curve_temp')] = prev_equity + net_pnl
+        df.iloc[i, df.columns.get_loc('net_return')] = net_pnl / prev_equity if prev_equity > 0 else 0
+
+    df['equity_curve'] = df['equity_curve_temp'] / initial_capital
+    df['peak'] = df['equity_curve'].expanding().max()
+    df['drawdown'] = (df['equity_curve'] - df['peak']) / df['peak']
+    df.drop(['equity_curve_temp', 'trade_value'], axis=1, inplace=True, errors='ignore')
+    return df
+
+
+def make_data(bars: int, seed: int, signal_num: int, use_signal: bool = True) -> pd.DataFrame:
+    """生成随机K线和交易信号"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, bars))
+    df = pd.DataFrame({
+        'candle_begin_time': pd.date_range('2021-01-01', periods=bars, freq='h'),
+        'open': close, 'high': close * 1.005, 'low': close * 0.995, 'close': close,
+        'volume': rng.uniform(100, 1000, bars),
+    })
+    idx = rng.choice(bars, size=min(signal_num, bars), replace=False)
+    if use_signal:
+        df['signal'] = np.nan
+        df.loc[idx, 'signal'] = rng.choice([1, -1, 0], size=len(idx))
+    else:
+        pos = np.full(bars, np.nan)
+        pos[idx] = rng.choice([1, -1, 0, 0.5], size=len(idx))
+        df['pos'] = pd.Series(pos).ffill().fillna(0)
+    return df
+
+
+def compare(bars: int, seed: int, signal_num: int, leverage_rate: float, c_rate: float, slippage: float, use_signal: bool = True):
+    df = make_data(bars, seed, signal_num, use_signal)
+
+    start = time.perf_counter()
+    expected = legacy_equity_curve(df, leverage_rate, c_rate, slippage)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = calculate_equity_curve_simple(df, leverage_rate, c_rate, slippage)
+    new_seconds = time.perf_counter() - start
+
+    for col in COMPARE_COLUMNS:
+        np.testing.assert_allclose(result[col].to_numpy(), expected[col].to_numpy(), rtol=1e-10, atol=1e-12, err_msg=col)
+    assert list(result.columns) == list(expected.columns), (list(result.columns), list(expected.columns))
+
+    logger.info(f"✅ bars={bars} seed={seed} 信号数={signal_num} 杠杆={leverage_rate} "
+                f"循环 {legacy_seconds:.3f}s -> 向量化 {new_seconds:.4f}s")
+
+
+def main():
+    logger.info("🧪 资金曲线回归测试...")
+    compare(bars=2, seed=0, signal_num=1, leverage_rate=1, c_rate=8 / 10000, slippage=1 / 1000)
+    compare(bars=500, seed=1, signal_num=50, leverage_rate=1, c_rate=8 / 10000, slippage=1 / 1000)
+    compare(bars=2000, seed=2, signal_num=1500, leverage_rate=3, c_rate=5 / 10000, slippage=0)
+    compare(bars=2000, seed=3, signal_num=300, leverage_rate=2, c_rate=8 / 10000, slippage=1 / 1000, use_signal=False)
+    compare(bars=2000, seed=4, signal_num=0, leverage_rate=1, c_rate=8 / 10000, slippage=1 / 1000)
+    # 高杠杆下资金可能变为负数
+    compare(bars=3000, seed=5, signal_num=800, leverage_rate=100, c_rate=8 / 10000, slippage=1 / 1000)
+    compare(bars=35000, seed=6, signal_num=2000, leverage_rate=1, c_rate=8 / 10000, slippage=1 / 1000)
+    logger.info("🎉 全部通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+参数优化数据加载测试脚本
+统计网格搜索中 load_backtest_data 的调用次数：交易对数量超过每个进程的数据缓存大小时，
+每个交易对仍然只加载一次
+"""
+import asyncio
+import sys
+import os
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# 添加项目路径
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.api import backtest as bt
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_calls: Counter = Counter()
+
+
+async def counting_load_backtest_data(symbol: str, request: bt.BacktestRequest, context: bt.BacktestContext):
+    """代替 load_backtest_data，记录调用次数并返回模拟数据"""
+    load_calls[symbol] += 1
+    context.data_source = bt.LOCAL_DATA_SOURCE
+    close = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.01, 100))
+    return pd.DataFrame({'candle_begin_time': pd.date_range('2021-01-01', periods=100, freq='h'), 'close': close})
+
+
+def fake_run_backtest_on_data(df: pd.DataFrame, symbol: str, request: bt.BacktestRequest, context: bt.BacktestContext):
+    """代替 run_backtest_on_data，只关心数据加载次数"""
+    return bt.BacktestResult(task_id="", symbol=symbol, strategy=request.strategy, parameters=request.parameters,
+                             final_return=0.0, annual_return=0.0, max_drawdown=0.0, sharpe_ratio=0.0,
+                             win_rate=0.0, total_trades=0, created_at=datetime.now())
+
+
+async def run_optimization(symbol_num: int, combo_num: int):
+    load_calls.clear()
+    task_id = f"load-test-{symbol_num}-{combo_num}"
+    symbols = [f"TEST{i}USDT" for i in range(symbol_num)]
+    request = bt.OptimizationRequest(symbols=symbols, strategy="sma",
+                                     parameter_ranges={"n": [float(n) for n in range(10, 10 + combo_num)]})
+    bt.backtest_tasks[task_id] = bt.BacktestStatus(task_id=task_id, status="running", symbols_total=symbol_num)
+    try:
+        results = await bt.run_grid_search_optimization(task_id, request)
+    finally:
+        bt.backtest_tasks.pop(task_id, None)
+
+    assert len(results) == symbol_num * combo_num, len(results)
+    assert load_calls == Counter({symbol: 1 for symbol in symbols}), dict(load_calls)
+    assert not any(key[0] == task_id for key in bt._optimization_data_cache), "任务结束后数据缓存未释放"
+    logger.info(f"✅ 交易对={symbol_num} 参数组合={combo_num} load_backtest_data 调用 {sum(load_calls.values())} 次")
+
+
+async def main():
+    logger.info("🧪 参数优化数据加载测试...")
+    assert not bt.backtest_executor.started, "测试在当前进程中执行回测"
+    bt.load_backtest_data = counting_load_backtest_data
+    bt.run_backtest_on_data = fake_run_backtest_on_data
+
+    await run_optimization(symbol_num=1, combo_num=5)
+    await run_optimization(symbol_num=bt._OPTIMIZATION_DATA_CACHE_SIZE, combo_num=3)
+    # 交易对数量超过数据缓存大小
+    await run_optimization(symbol_num=bt._OPTIMIZATION_DATA_CACHE_SIZE * 3, combo_num=4)
+    logger.info("🎉 全部通过")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,6 @@
+import hashlib
 import warnings
+from collections import OrderedDict
 from datetime import datetime
 from datetime import timedelta
 from functools import partial
@@ -9,9 +11,35 @@ from cta_api.position import *
 from cta_api.function import *
 from cta_api.statistics import *
 from cta_api.cta_core import *
+from cta_api import result_store as store
+from cta_api import work_queue as wq
+from cta_api.tools import stage_timer, profile_task, reset_profile, flush_profile, report_profile
 from dateutil.relativedelta import relativedelta
 
-def calculate_by_one_loop(para, df, signal_name, symbol, rule_type, min_amount, start, end):
+# 持仓序列指纹缓存：{(币种, 周期, 开始时间, 结束时间, 持仓指纹): (回测结果, 是否有资金曲线, 首个参数)}
+# 每个进程各自一份，进程池按连续分块分配参数，相邻参数通常落在同一进程内
+_signal_cache = {}
+# 参数覆盖曲线用的涨跌幅汇总是逐K线的，只保留最近使用的几个，被淘汰后再次命中时重新计算资金曲线(不再做策略评价)
+_curve_cache = OrderedDict()
+curve_cache_size = 8
+
+
+def equity_pct_curve(_df):
+    """
+    按时间汇总资金曲线涨跌幅，由主进程累加后求均值，得到参数覆盖曲线
+    """
+    equity_pct = _df['equity_curve'].pct_change().fillna(0)
+    return equity_pct.groupby(_df['candle_begin_time']).agg(['sum', 'count'])
+
+
+def remember_curve(signal_key, curve):
+    _curve_cache[signal_key] = curve
+    _curve_cache.move_to_end(signal_key)
+    while len(_curve_cache) > curve_cache_size:
+        _curve_cache.popitem(last=False)
+
+@profile_task
+def calculate_by_one_loop(para, df, signal_name, symbol, rule_type, min_amount, start, end, return_curve=False):
     """
     回测每个传递进来的数据
     :param para:    回测参数
@@ -20,8 +48,11 @@ def calculate_by_one_loop(para, df, signal_name, symbol, rule_type, min_amount,
     :param symbol:  币种名称
     :param rule_type:   回测时间周期
     :param min_amount:  最小下单量
+    :param return_curve:    是否同时返回资金曲线涨跌幅，用于在内存中计算参数覆盖曲线
     :return:
         返回币种的回测结果，包含累积币种名称、净值、年化收益最大回撤、年化收益回撤比字段
+        持仓与之前某个参数完全相同时直接复用其结果，并在等效参数字段中记录该参数
+        return_curve为True时返回(回测结果, 涨跌幅汇总)，涨跌幅汇总以candle_begin_time为索引，包含sum、count两列，没有资金曲线时为None
     """
     warnings.filterwarnings('ignore')
     # ==== 获取数据
@@ -30,36 +61,73 @@ def calculate_by_one_loop(para, df, signal_name, symbol, rule_type, min_amount,
 
     # === 计算交易信号
     cls = __import__('factors.%s' % signal_name, fromlist=('',))
-    _df = cls.signal(_df, para=para, proportion=proportion,leverage_rate=leverage_rate)  # 调用传递过来的signal名称生成signal信号
+    with stage_timer('signal'):
+        _df = cls.signal(_df, para=para, proportion=proportion,leverage_rate=leverage_rate)  # 调用传递过来的signal名称生成signal信号
 
     # === 计算实际持仓
-    _df = position_for_future(_df)  # 调用函数，计算实际的持仓
+    with stage_timer('position_for_future'):
+        _df = position_for_future(_df)  # 调用函数，计算实际的持仓
 
     # 过滤出我们所要计算的区间
     _df = _df[(_df['candle_begin_time'] >= pd.to_datetime(start))&(_df['candle_begin_time'] <= pd.to_datetime(end))]
 
+    # === 持仓去重
+    # 资金曲线和评价指标只由区间内的持仓决定，持仓完全相同的参数直接复用之前的结果
+    # 需要保存每个参数的资金曲线文件时(文件中包含各自的signal)不复用
+    with stage_timer('signal_dedup'):
+        signal_key = (symbol, rule_type, str(start), str(end), hashlib.md5(_df['pos'].values.tobytes()).hexdigest())
+    if save_para_equity == False and signal_key in _signal_cache:
+        rtn, has_curve, same_para = _signal_cache[signal_key]
+        if not rtn.empty:
+            rtn = rtn.copy()
+            rtn.loc[0, 'para'] = str(para)
+            rtn.loc[0, '等效参数'] = str(same_para)
+            print(signal_name, symbol, rule_type, para, '策略收益：', rtn.loc[0, '累积净值'], '等效参数：', same_para)
+        if not return_curve:
+            return rtn
+        curve = None
+        if has_curve:
+            curve = _curve_cache.get(signal_key)
+            if curve is None:
+                with stage_timer('cal_equity_curve'):
+                    _df = cal_equity_curve(_df, slippage=slippage, c_rate=c_rate, leverage_rate=leverage_rate, min_amount=min_amount, min_margin_ratio=min_margin_ratio)
+                curve = equity_pct_curve(_df)
+            remember_curve(signal_key, curve)
+        return rtn, curve
+
     # ===== 计算资金曲线
     # === 计算资金曲线
     try:
-        _df = cal_equity_curve(_df, slippage=slippage, c_rate=c_rate, leverage_rate=leverage_rate, min_amount=min_amount, min_margin_ratio=min_margin_ratio)  # 计算资金曲线
+        with stage_timer('cal_equity_curve'):
+            _df = cal_equity_curve(_df, slippage=slippage, c_rate=c_rate, leverage_rate=leverage_rate, min_amount=min_amount, min_margin_ratio=min_margin_ratio)  # 计算资金曲线
     except Exception as e:
         print(f'错误代码:{e},可能是没有开仓导致')
-        return pd.DataFrame()
+        _signal_cache[signal_key] = (pd.DataFrame(), False, para)
+        return (pd.DataFrame(), None) if return_curve else pd.DataFrame()
 
-    if cover_curve == True:
+    curve = None
+    if return_curve:
+        curve = equity_pct_curve(_df)
+        remember_curve(signal_key, curve)
+
+    if save_para_equity == True:
         _df_output = _df[['candle_begin_time', 'open', 'high', 'low', 'close', 'signal', 'pos', 'quote_volume', 'equity_curve']].copy()
         _df_output.rename(columns={'median': 'line_median', 'upper': 'line_upper', 'lower': 'line_lower', 'quote_volume': 'b_bar_quote_volume', 'equity_curve': 'r_line_equity_curve'}, inplace=True)  # 对指定列名重命名，方便我们看数据是容易理解
-        _df_output.to_csv(os.path.join(root_path,'data/output/para_equity_curve/%s&%s&%s&%s.csv') % (signal_name, symbol.split('-')[0], rule_type, str(para)), index=False, encoding='gbk')  # 以GBK编码并且删除index保存csv文件
+        with stage_timer('output_io'):
+            _df_output.to_csv(os.path.join(root_path,'data/output/para_equity_curve/%s&%s&%s&%s.csv') % (signal_name, symbol.split('-')[0], rule_type, str(para)), index=False, encoding='gbk')  # 以GBK编码并且删除index保存csv文件
     # ==== 策略评价
     # === 计算每笔交易
-    trade = transfer_equity_curve_to_trade(_df)  # 调用函数，通过带有资金曲线的df计算每笔交易
+    with stage_timer('transfer_equity_curve_to_trade'):
+        trade = transfer_equity_curve_to_trade(_df)  # 调用函数，通过带有资金曲线的df计算每笔交易
     # 判断每笔交易是否为空，如果为空即为没有触发信号，直接返回空的数据
     if trade.empty:  # 判断trade是否为空
-        return pd.DataFrame()  # 返回一个空的df
+        _signal_cache[signal_key] = (pd.DataFrame(), True, para)
+        return (pd.DataFrame(), curve) if return_curve else pd.DataFrame()  # 返回一个空的df
 
     # === 计算各类统计指标
     # 计算策略评价指标
-    r, monthly_return = strategy_evaluate(_df, trade,rule_type)  # 调用函数策略评价指标，需要传入带有资金曲线的df以及每笔交易数据
+    with stage_timer('strategy_evaluate'):
+        r, monthly_return = strategy_evaluate(_df, trade,rule_type)  # 调用函数策略评价指标，需要传入带有资金曲线的df以及每笔交易数据
     # 保存策略收益
     rtn = pd.DataFrame()  # 创建一个新的df，用于保存回测的指标数据
     rtn.loc[0, 'para'] = str(para)  # 保存回测的参数
@@ -68,14 +136,69 @@ def calculate_by_one_loop(para, df, signal_name, symbol, rule_type, min_amount,
         rtn.loc[0, i] = r.loc[i, 0]  # 进行保存
     # 输出一下回测的结果
     print(signal_name, symbol, rule_type, para, '策略收益：', r.loc['累积净值', 0])  # 输出策略名称、币种、回测时间周期、策略的累积净值
+    _signal_cache[signal_key] = (rtn, True, para)
     # 返回回测的详情数据
-    return rtn
+    return (rtn, curve) if return_curve else rtn
+
+def merge_base_result(para_curve_df, symbol, rule_type, start, end):
+    """
+    合并币种的基准数据，并标记回测区间
+    :param para_curve_df:   合并后的参数遍历结果
+    :param symbol:  币种名称
+    :param rule_type:   回测时间周期
+    :param start:   回测开始时间
+    :param end: 回测结束时间
+    :return:
+        包含币种原始指标和回测区间字段的遍历结果
+    """
+    # ==== 读取基准数据，即从回测开始持有到回测结束的结果
+    # 拼接一下基本数据的路径
+    p = root_path + '/data/output/para/基准&%s&%s.csv' % (leverage_rate, rule_type)  # 拼接数据保存的路径
+    original = pd.read_csv(p, encoding='gbk')  # 以GBK编码读取基本数据的csv文件
+    # ==== 合并基准数据
+    para_curve_df['币种原始累积净值'] = original.loc[original['币种'] == symbol].iloc[0]['累积净值']  # 合并基准累积净值
+    para_curve_df['币种原始年化收益'] = original.loc[original['币种'] == symbol].iloc[0]['年化收益']  # 合并基准年化收益
+    para_curve_df['币种原始最大回撤'] = original.loc[original['币种'] == symbol].iloc[0]['最大回撤']  # 合并基准最大回撤
+    para_curve_df['币种原始年化收益/回撤比'] = original.loc[original['币种'] == symbol].iloc[0]['年化收益/回撤比']  # 合并基准年化收益回撤比
+
+    # ==== 标记回测区间
+    para_curve_df['回测区间'] = f'{start}_{end}'
+    return para_curve_df
+
+def enqueue_playblack(signal_name, symbol, rule_type, start, end, sweep):
+    """
+    任务队列模式：把一个回测区间的参数分组写入任务队列，由fastover_worker.py计算
+    :param sweep:   本次遍历的标识
+    :return:
+        写入的任务数量
+    """
+    df = pd.read_feather(os.path.join(data_path, rule_type, symbol + '.pkl'))
+    df = df[(df['candle_begin_time'] >= pd.to_datetime(start)) & (df['candle_begin_time'] <= pd.to_datetime(end))]
+    if df.empty:
+        print(f'{start}-{end},该区间没有数据')
+        return 0
+    cls = __import__('factors.%s' % signal_name, fromlist=('',))
+    job_num = wq.enqueue(sweep, signal_name, symbol, leverage_rate, rule_type, start, end, cls.para_list(), chunk_size=queue_chunk_size)
+    print('写入任务队列：', signal_name, symbol, rule_type, start, end, '任务数量：', job_num)
+    return job_num
+
+def sweep_window(signal_name, symbol, rule_type, start, end):
+    """
+    遍历一个回测区间，sweep_backend为queue时写入任务队列，否则在本机进程池中计算
+    """
+    if sweep_backend == 'queue':
+        enqueue_playblack(signal_name, symbol, rule_type, start, end, sweep_id)
+    else:
+        run_playblack(signal_name, symbol, rule_type, start, end)
 
 def run_playblack(signal_name,symbol,rule_type,start,end):
     # ===== 输出一下回测的详情
     print('开始遍历该策略参数：', signal_name, symbol, rule_type,start,end)  # 输出当前要回测的策略名称、币种、回测时间周期
+    reset_profile()
     # ==== 读入数据
-    df = pd.read_feather(os.path.join(data_path, rule_type, symbol + '.pkl'))
+    with stage_timer('data_load'):
+        df = pd.read_feather(os.path.join(data_path, rule_type, symbol + '.pkl'))
+    flush_profile(signal_name, f'{symbol} {rule_type} 读入数据')
 
     # 检测回测区间是否有数据
     df_ = df.copy()
@@ -93,40 +216,48 @@ def run_playblack(signal_name,symbol,rule_type,start,end):
     # === 并行回测
     # 标记开始时间
     start_time = datetime.now()  # 标记开始时间
+    _signal_cache.clear()  # 串行时缓存在主进程中，每轮遍历前清空
+    _curve_cache.clear()
     # 利用partial指定参数值
-    part = partial(calculate_by_one_loop, df=df, signal_name=signal_name, symbol=symbol, rule_type=rule_type, min_amount=min_amount, start=start, end=end)  # 使用便函数指定所有固定的参数
-    
+    part = partial(calculate_by_one_loop, df=df, signal_name=signal_name, symbol=symbol, rule_type=rule_type, min_amount=min_amount, start=start, end=end, return_curve=cover_curve)  # 使用便函数指定所有固定的参数
+    if save_para_equity == True and os.path.exists(os.path.join(root_path, 'data/output/para_equity_curve')) == False:
+        os.makedirs(os.path.join(root_path, 'data/output/para_equity_curve'))
+
     multiple_process = True  # 设置是否并行，True为并行，False为串行
     # === 开始进行回测
+    pool = None
     if multiple_process:
-        with Pool(max(cpu_count() - 1, 1)) as pool:
-            # 使用并行批量获得data frame的一个列表
-            df_list = pool.map(part, para_list)
+        processes = max(cpu_count() - 1, 1)
+        pool = Pool(processes)
+        # 按顺序逐个取回结果，分块方式与pool.map一致
+        res_iter = pool.imap(part, para_list, chunksize=max(-(-len(para_list) // (processes * 4)), 1))
     else:
-        df_list = []  # 定义一个空的列表，用来保存回测的结果
-         # 循环每个参数
-        for para in para_list:
-            res_df = calculate_by_one_loop(para=para, df=df, signal_name=signal_name, symbol=symbol, rule_type=rule_type, min_amount=min_amount, start=start, end=end)  # 调用回测的函数，返回回测结果
-            df_list.append(res_df)  # 将回测结果累加到df_list，用于后续合并大表使用
+        res_iter = map(part, para_list)  # 串行，循环每个参数
+    df_list = []  # 定义一个空的列表，用来保存回测的结果
+    cover_sum = None  # 参数覆盖曲线：每根K线上所有参数的涨跌幅之和与参数个数
+    for res_df in res_iter:
+        if cover_curve == True:
+            res_df, curve = res_df
+            if curve is not None:
+                cover_sum = curve if cover_sum is None else cover_sum.add(curve, fill_value=0)
+        df_list.append(res_df)  # 将回测结果累加到df_list，用于后续合并大表使用
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     print('读入完成, 开始合并', datetime.now() - start_time)  # 回测结束，输出一下使用的时间
 
     # ==== 整理回测后的数据
     # === 将df_list内所有的回测结果合并，作为一个大表，并重新设置一下index
     para_curve_df = pd.concat(df_list, ignore_index=True)  # 合并为一个大的DataFrame
+    # === 持仓去重命中情况
+    if '等效参数' not in para_curve_df.columns:
+        para_curve_df['等效参数'] = None
+    hit_num = int(para_curve_df['等效参数'].notnull().sum())
+    print(f'参数数量：{len(para_list)}，有交易的参数：{len(para_curve_df)}，持仓相同复用结果：{hit_num}')
 
-    # ==== 读取基准数据，即从回测开始持有到回测结束的结果
-    # 拼接一下基本数据的路径
-    p = root_path + '/data/output/para/基准&%s&%s.csv' % (leverage_rate, rule_type)  # 拼接数据保存的路径
-    original = pd.read_csv(p, encoding='gbk')  # 以GBK编码读取基本数据的csv文件
-    # ==== 合并基准数据
-    para_curve_df['币种原始累积净值'] = original.loc[original['币种'] == symbol].iloc[0]['累积净值']  # 合并基准累积净值
-    para_curve_df['币种原始年化收益'] = original.loc[original['币种'] == symbol].iloc[0]['年化收益']  # 合并基准年化收益
-    para_curve_df['币种原始最大回撤'] = original.loc[original['币种'] == symbol].iloc[0]['最大回撤']  # 合并基准最大回撤
-    para_curve_df['币种原始年化收益/回撤比'] = original.loc[original['币种'] == symbol].iloc[0]['年化收益/回撤比']  # 合并基准年化收益回撤比
-
-    # ==== 标记回测区间
-    para_curve_df['回测区间'] = f'{start}_{end}'
+    # ==== 合并基准数据，标记回测区间
+    para_curve_df = merge_base_result(para_curve_df, symbol, rule_type, start, end)
 
     # ==== 整理回测后的数据
     # === 对数据进行排序
@@ -134,34 +265,37 @@ def run_playblack(signal_name,symbol,rule_type,start,end):
     print(para_curve_df.head(10))  # 输出前10行数据
 
     # === 保存回测后的结果
-    result_path = root_path + '/data/output/para/%s&%s&%s&%s.csv' % (signal_name, symbol, leverage_rate, rule_type)  # 拼接数据保存的路径
-    
-    # === 保存文件
-    if os.path.exists(result_path):  # 如果文件存在，往原有的文件中添加新的结果
-        para_curve_df.to_csv(result_path, index=False, header=False, mode='a', encoding='gbk')
-    else:
-        para_curve_df.to_csv(result_path, index=False, encoding='gbk')
-    if cover_curve == True:
-        equity_df_list = []
-        for para in para_list:
-            equity_df = pd.read_csv(os.path.join(root_path,'data/output/para_equity_curve/%s&%s&%s&%s.csv') % (signal_name, symbol.split('-')[0], rule_type, str(para)),encoding='gbk')
-            equity_df['equity_pct'] = equity_df['r_line_equity_curve'].pct_change()
-            equity_df.fillna(0,inplace=True)
-            equity_df_list.append(equity_df)
-        tot_equity_df = pd.concat(equity_df_list,ignore_index=True,axis=0)
-        cover_df = tot_equity_df.groupby('candle_begin_time',as_index=False)['equity_pct'].mean()
+    with stage_timer('output_io'):
+        if use_result_store:
+            store.append_results(para_curve_df, signal_name, symbol, leverage_rate, rule_type)  # 以数值类型写入结果库
+        else:
+            result_path = root_path + '/data/output/para/%s&%s&%s&%s.csv' % (signal_name, symbol, leverage_rate, rule_type)  # 拼接数据保存的路径
+            # === 保存文件
+            if os.path.exists(result_path):  # 如果文件存在，往原有的文件中添加新的结果
+                para_curve_df.to_csv(result_path, index=False, header=False, mode='a', encoding='gbk')
+            else:
+                para_curve_df.to_csv(result_path, index=False, encoding='gbk')
+    flush_profile(signal_name, f'{symbol} {rule_type} 保存结果')
+    if cover_curve == True and cover_sum is not None:
+        # 所有参数资金曲线涨跌幅的均值，直接由worker返回的汇总计算，不再读写每个参数的资金曲线文件
+        cover_sum.sort_index(inplace=True)
+        cover_df = pd.DataFrame({'candle_begin_time': cover_sum.index, 'equity_pct': (cover_sum['sum'] / cover_sum['count']).values})
         cover_df['equity'] = (1 + cover_df['equity_pct']).cumprod()
         cover_df['maxh'] = cover_df['equity'].cummax()
         cover_df['回撤'] = cover_df['equity'] / cover_df['maxh'] - 1
         title = f'{symbol}_{signal_name}_{rule_type}_{start}_{end}_cover'
-        draw_equity_curve_plotly(cover_df, data_dict={'equity':'equity'}, date_col='candle_begin_time', right_axis={'最大回撤':'回撤'}, title=title, path=os.path.join(root_path,f'data/output/para_pic/{title}.html'), show=False)
+        if os.path.exists(os.path.join(root_path, 'data/output/para_pic')) == False:
+            os.makedirs(os.path.join(root_path, 'data/output/para_pic'))
+        draw_equity_curve_plotly(cover_df, data_dict={'equity':'equity'}, date_col='candle_begin_time', right_axis={'最大回撤':'回撤'}, title=title, path=os.path.join(root_path,f'data/output/para_pic/{title}.html'), show=False, max_points=pic_max_points)
     
     # ==== 输出一下本轮回测使用的时间
     print(datetime.now() - start_time)  # 输出回测时间
+    report_profile(f"{signal_name}_{symbol}_{rule_type}_{pd.to_datetime(start).strftime('%Y%m%d')}_{pd.to_datetime(end).strftime('%Y%m%d')}")
 
     return
 
 if __name__ == '__main__':
+    wq.check_backend(sweep_backend, use_result_store)
     # 计算基准数据
     print('计算基准数据')
     multiple_process = True  # 设置是否并行，True为并行，False为串行
@@ -174,6 +308,12 @@ if __name__ == '__main__':
         para_curve_df.to_csv(os.path.join(result_path,f'基准&{leverage_rate}&{rule_type}.csv'), index=False, encoding='gbk')  # 以GBK编码并且删除index保存csv文件
 
     # ==== 遍历所有的策略
+    if sweep_backend == 'queue':
+        # 任务队列模式：本进程只写入任务，计算由任意机器上运行的fastover_worker.py完成，结果写入结果库
+        sweep_id = datetime.now().strftime('%Y%m%d%H%M%S')
+        print('任务队列模式，遍历标识：', sweep_id)
+        if cover_curve == True:
+            print('任务队列模式不绘制参数覆盖曲线')
     # 遍历指定的策略
     for signal_name in signal_name_list:
         # 遍历不同的币种
@@ -186,7 +326,10 @@ if __name__ == '__main__':
                 if del_mode:
                     # 启动删除模式
                     print('删除模式')
-                    if os.path.exists(result_path):
+                    if use_result_store or sweep_backend == 'queue':
+                        print('删除结果库中的历史结果：', store.delete_results(signal_name, symbol, leverage_rate, rule_type))
+                        print('删除历史任务：', wq.delete_jobs(signal_name, symbol, leverage_rate, rule_type))
+                    elif os.path.exists(result_path):
                         print('存在历史文件，正在删除')
                         os.remove(result_path)
                 if per_eva == 'm':
@@ -194,7 +337,7 @@ if __name__ == '__main__':
                     start = pd.to_datetime(date_start)
                     end = start + relativedelta(months=+1)
                     while end <= pd.to_datetime(date_end):
-                        run_playblack(signal_name,symbol,rule_type,start,end)
+                        sweep_window(signal_name,symbol,rule_type,start,end)
                         start = end
                         end += relativedelta(months=+1)
                 elif per_eva == 'y':
@@ -202,7 +345,7 @@ if __name__ == '__main__':
                     start = pd.to_datetime(date_start)
                     end = start + relativedelta(years=+1)
                     while end <= pd.to_datetime(date_end):
-                        run_playblack(signal_name,symbol,rule_type,start,end)
+                        sweep_window(signal_name,symbol,rule_type,start,end)
                         start = end
                         end += relativedelta(years=+1)
                 elif per_eva == 'w':
@@ -210,12 +353,22 @@ if __name__ == '__main__':
                     start = pd.to_datetime(date_start)
                     end = start + relativedelta(weeks=+1)
                     while end <= pd.to_datetime(date_end):
-                        run_playblack(signal_name,symbol,rule_type,start,end)
+                        sweep_window(signal_name,symbol,rule_type,start,end)
                         start = end
                         end += relativedelta(weeks=+1)
                 else:
                     start = date_start
                     end = date_end
-                    run_playblack(signal_name,symbol,rule_type,start,end)
+                    sweep_window(signal_name,symbol,rule_type,start,end)
 
                         
+
+    if sweep_backend == 'queue':
+        # 等待所有worker完成本次遍历的任务，租约过期的任务会重新回到队列
+        status = wq.wait_sweep(sweep_id)
+        if status[wq.FAILED]:
+            print('失败的任务：')
+            print(wq.failed_jobs(sweep_id))
+
+    if os.path.exists(os.path.join(root_path, 'data/output/para_pic')):
+        write_chart_index(os.path.join(root_path, 'data/output/para_pic'), '参数遍历')
@@ -6,9 +6,15 @@ from cta_api.tools import get_list_dimension
 from config import *
 from cta_api.evaluate import *
 from cta_api.function import write_file, num_to_pct
+from cta_api import result_store as store
+from cta_api.work_queue import check_backend
+from cta_api.robustness import robustness_score
 
 pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
 
+check_backend(sweep_backend, use_result_store)
+top_n = 10  # 输出年化收益/回撤比排名前N的参数
+robust_list = []  # 每个策略、币种、周期最稳健的参数
 # 遍历所有策略结果
 for signal_name in signal_name_list:
     cls = __import__('factors.%s' % signal_name, fromlist=('',))
@@ -17,46 +23,73 @@ for signal_name in signal_name_list:
     for symbol in symbol_list:
         for rule_type in rule_type_list:
             # === 获取所有指定策略的遍历结果
-            path = os.path.join(root_path, f'data/output/para/{signal_name}&{symbol}&{leverage_rate}&{rule_type}.csv')  # python自带的库，或者某文件夹中所有csv文件的路径
-            # 读取最优参数，选择排名前strategy_num的
-            try:
-                df = pd.read_csv(path, encoding='gbk')
-            except FileNotFoundError:
-                print(f"File not found: {path}")
-                continue
-            
-            df.replace(np.inf, -1, inplace=True)
-            # df = df.sort_values(by='年化收益/回撤比', ascending=False).head(1)
-            df['strategy_name'] = path.split('/')[-1].split('&')[0]
-            filename = path.split('/')[-1][:-4]
-            df['symbol'] = filename.split('&')[1]
-            df['leverage'] = filename.split('&')[2]
-            df['周期'] = filename.split('&')[3]
-
-            # 合并所有币种的遍历结果
-            rtn = df
-            rtn.reset_index(inplace=True, drop=False)
-            # === 对一些列进行处理
-            rtn['最大回撤'] = rtn['最大回撤'].apply(lambda x: float(x[:-1]) / 100)
-            rtn['币种原始最大回撤'] = rtn['币种原始最大回撤'].apply(lambda x: float(x[:-1]) / 100)
-            rtn['年化收益'] = rtn['年化收益'].apply(lambda x: float(x))
-            rtn['币种原始年化收益'] = rtn['币种原始年化收益'].apply(lambda x: float(x))
-
-            # 把合并的数据根据年化收益回撤比排序
-            rtn.sort_values('年化收益/回撤比', inplace=True, ascending=False)
+            if use_result_store:
+                # 结果库中的指标已经是数值类型，百分比已转为小数
+                # 排名前N的参数按指标索引查询，参数平原和稳健性评价只读取需要的列，不再读取全部结果
+                rtn = store.query_top(signal_name, symbol, leverage_rate, rule_type, metric='年化收益/回撤比', n=top_n)
+                if rtn.empty:
+                    print(f"No results in store: {signal_name}&{symbol}&{leverage_rate}&{rule_type}")
+                    continue
+                plateau = store.query_plateau(signal_name, symbol, leverage_rate, rule_type, metric=['累积净值', '年化收益/回撤比'])
+            else:
+                path = os.path.join(root_path, f'data/output/para/{signal_name}&{symbol}&{leverage_rate}&{rule_type}.csv')  # python自带的库，或者某文件夹中所有csv文件的路径
+                # 读取最优参数，选择排名前strategy_num的
+                try:
+                    df = pd.read_csv(path, encoding='gbk')
+                except FileNotFoundError:
+                    print(f"File not found: {path}")
+                    continue
+                # === 对一些列进行处理
+                df['最大回撤'] = df['最大回撤'].apply(lambda x: float(x[:-1]) / 100)
+                df['币种原始最大回撤'] = df['币种原始最大回撤'].apply(lambda x: float(x[:-1]) / 100)
+                df['年化收益'] = df['年化收益'].apply(lambda x: float(x))
+                df['币种原始年化收益'] = df['币种原始年化收益'].apply(lambda x: float(x))
+                plateau = df
+                # 把数据根据年化收益回撤比排序
+                rtn = df.sort_values('年化收益/回撤比', ascending=False).head(top_n)
+
+            rtn = rtn.replace(np.inf, -1)
+            plateau = plateau.replace(np.inf, -1)
+            rtn['strategy_name'] = signal_name
+            rtn['symbol'] = symbol
+            rtn['leverage'] = str(leverage_rate)
+            rtn['周期'] = rule_type
 
             rtn['年化收益/回撤比_超额'] = rtn['年化收益/回撤比'] - rtn['币种原始年化收益/回撤比']
-            all_symbol_rtn = rtn[['strategy_name', 'symbol', '周期', 'leverage', 'para', '累积净值', '年化收益', '最大回撤', '年化收益/回撤比','年化收益/回撤比_超额','回测区间']]
-            print(all_symbol_rtn)
+            print(rtn[['strategy_name', 'symbol', '周期', 'leverage', 'para', '累积净值', '年化收益', '最大回撤', '年化收益/回撤比','年化收益/回撤比_超额','回测区间']])
             draw_chart_list = ['para', '累积净值']
             print('参数维数为:',dim)
             if os.path.exists(os.path.join(root_path,f'data/output/para_pic')) == False:
                 os.makedirs(os.path.join(root_path,f'data/output/para_pic'))
             if dim == 1:
-                if not all_symbol_rtn.empty:
+                if not plateau.empty:
                     print('绘制参数平原')
-                    draw_equity_parameters_plateau(all_symbol_rtn,draw_chart_list,show=False,path=os.path.join(root_path,f'data/output/para_pic/{signal_name}_{symbol}_{rule_type}_{per_eva}.html'))
+                    draw_equity_parameters_plateau(plateau,draw_chart_list,show=False,path=os.path.join(root_path,f'data/output/para_pic/{signal_name}_{symbol}_{rule_type}_{per_eva}.html'))
 
             if dim == 2:
-                if not all_symbol_rtn.empty:
-                    draw_thermodynamic_diagram(all_symbol_rtn,draw_chart_list,show=False,path=os.path.join(root_path,f'data/output/para_pic/{signal_name}_{symbol}_{rule_type}_{per_eva}.html'))
+                if not plateau.empty:
+                    draw_thermodynamic_diagram(plateau,draw_chart_list,show=False,path=os.path.join(root_path,f'data/output/para_pic/{signal_name}_{symbol}_{rule_type}_{per_eva}.html'))
+
+            # === 参数稳健性：邻域平滑后的指标、邻域波动和各回测区间的一致性
+            if not plateau.empty:
+                robust = robustness_score(plateau, metric='年化收益/回撤比', radius=robust_radius)
+                print('参数稳健性排名：')
+                print(robust.head(10))
+                if os.path.exists(os.path.join(root_path, 'data/output/para_robust')) == False:
+                    os.makedirs(os.path.join(root_path, 'data/output/para_robust'))
+                robust.to_csv(os.path.join(root_path, f'data/output/para_robust/{signal_name}_{symbol}_{rule_type}_{per_eva}.csv'), index=False, encoding='gbk')
+                best = robust.head(1).copy()
+                best.insert(0, '周期', rule_type)
+                best.insert(0, 'symbol', symbol)
+                best.insert(0, 'strategy_name', signal_name)
+                robust_list.append(best)
+
+# 汇总所有策略、币种、周期最稳健的参数
+if robust_list:
+    robust_all = pd.concat(robust_list, ignore_index=True)
+    robust_all.sort_values('稳健得分', ascending=False, inplace=True)
+    print(robust_all)
+    robust_all.to_csv(os.path.join(root_path, f'data/output/para_robust/汇总_{per_eva}.csv'), index=False, encoding='gbk')
+
+if os.path.exists(os.path.join(root_path, 'data/output/para_pic')):
+    write_chart_index(os.path.join(root_path, 'data/output/para_pic'), '参数遍历')
@@ -0,0 +1,50 @@
+'''
+轮动回测
+在signal_name_list的所有策略、rule_type_list的各个周期下，读取已保存的子资金曲线(2_fast_backview.py或3_fastover.py输出)，
+按config中的轮动配置回测，输出组合资金曲线、调仓权重、子策略收益贡献和评价指标
+'''
+import os
+import glob
+from config import *
+from cta_api.reader import equity_path
+from cta_api.rotation import load_returns, rotate
+from cta_api.statistics import shift_evaluate
+from cta_api.evaluate import draw_shift_equity_curve_plotly, write_chart_index
+
+pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
+
+if __name__ == '__main__':
+    output_path = os.path.join(root_path, 'data/output/rotation')
+    if os.path.exists(output_path) == False:
+        os.makedirs(output_path)
+
+    for rule_type in rule_type_list:
+        # === 子资金曲线名称：策略&币种&周期&参数
+        equity_names = []
+        for signal_name in signal_name_list:
+            files = glob.glob(equity_path(f'{signal_name}&*&{rule_type}&*'))
+            equity_names += sorted(os.path.basename(f)[:-4] for f in files)
+        if len(equity_names) < 2:
+            print(rule_type, '子资金曲线数量不足，跳过：', equity_names)
+            continue
+        print(rule_type, '子资金曲线数量：', len(equity_names))
+
+        # === 对齐子资金曲线并轮动
+        times, returns = load_returns(equity_names)
+        equity, weights, attribution = rotate(times, returns, equity_names, hold=rotation_hold, lookback=rotation_lookback,
+                                              top_k=rotation_top_k, score=rotation_rule, c_rate=c_rate)
+        results, year_return, month_return = shift_evaluate(equity)
+        print(results.T)
+        print(year_return)
+        print(attribution.head(20))
+
+        # === 保存结果
+        title = f'轮动_{rule_type}_{rotation_rule}_{rotation_lookback}_{rotation_hold}_{rotation_top_k}'
+        equity.to_csv(os.path.join(output_path, f'{title}_资金曲线.csv'), index=False, encoding='gbk')
+        weights.to_csv(os.path.join(output_path, f'{title}_调仓权重.csv'), encoding='gbk')
+        attribution.to_csv(os.path.join(output_path, f'{title}_收益贡献.csv'), encoding='gbk')
+        results.to_csv(os.path.join(output_path, f'{title}_评价.csv'), index=False, encoding='gbk')
+        draw_shift_equity_curve_plotly(equity, {'轮动资金曲线': 'shift_equity'}, date_col='candle_begin_time', title=title,
+                                       path=os.path.join(output_path, f'{title}.html'), show=False, max_points=pic_max_points)
+
+    write_chart_index(output_path, '轮动')
@@ -0,0 +1,322 @@
+'''
+crypto_cta 核心函数性能基准
+使用固定随机种子生成的模拟K线数据，对数据处理、信号、持仓、资金曲线、策略评价以及一次小规模参数遍历计时，
+结果保存为json基准文件，可以与之前的基准文件对比，找出变慢的函数
+
+用法：
+    python benchmark.py run --name baseline                         # 运行并保存为 data/output/benchmark/baseline.json
+    python benchmark.py run --name new --compare baseline           # 运行后与baseline对比
+    python benchmark.py compare baseline new --threshold 0.2        # 对比两个已保存的基准，变慢超过20%时标记
+'''
+import io
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import inspect
+import argparse
+import platform
+import tempfile
+import importlib
+import warnings
+from datetime import datetime
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+from config import *
+from cta_api.function import transfer_to_period_data, cal_equity_curve, process_stop_loss_close
+from cta_api.position import position_for_future
+from cta_api.statistics import transfer_equity_curve_to_trade, strategy_evaluate
+from cta_api import result_store as store
+
+benchmark_path = os.path.join(root_path, 'data/output/benchmark')
+bench_symbol = 'BENCH-USDT'
+
+
+# ===== 模拟数据
+def make_minute_data(bars, rule_type='1H', volatility=0.002, seed=0, start='2021-01-01'):
+    '''
+    生成1分钟模拟K线，格式与1_kline_data中读取的原始数据一致，可直接传入transfer_to_period_data
+    :param bars: 按rule_type计算的K线数量，实际生成bars * 每根K线分钟数 根1分钟K线
+    :param rule_type: 周期
+    :param volatility: 每分钟收益率的标准差
+    :param seed: 随机种子，相同参数生成的数据完全相同
+    :param start: 开始时间
+    :return: 1分钟K线数据
+    '''
+    rng = np.random.default_rng(seed)
+    minutes = int(pd.to_timedelta(rule_type) / pd.Timedelta('1min'))
+    n = bars * minutes
+    close = 100 * np.exp(np.cumsum(rng.normal(0, volatility, n)))
+    open_ = np.r_[100, close[:-1]]
+    spread = np.abs(rng.normal(0, volatility, n)) * close
+    volume = rng.lognormal(3, 1, n)
+    df = pd.DataFrame({
+        'candle_begin_time': pd.date_range(start, periods=n, freq='1min'),
+        'symbol': bench_symbol.replace('-', ''),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': volume,
+        'quote_volume': volume * close,
+        'trade_num': rng.integers(1, 500, n),
+        'taker_buy_base_asset_volume': volume / 2,
+        'taker_buy_quote_asset_volume': volume * close / 2,
+    })
+    df['avg_price'] = df['quote_volume'] / df['volume']
+    return df
+
+
+def make_period_data(bars, rule_type='1H', volatility=0.002, seed=0, offsets=1, kline_pct=True, start='2021-01-01'):
+    '''
+    生成周期模拟K线，格式与1_kline_data保存的数据一致(head_column)
+    :param bars: 每个offset的K线数量
+    :param rule_type: 周期
+    :param volatility: 每分钟收益率的标准差
+    :param seed: 随机种子
+    :param offsets: offset数量，第k个offset的K线起点向后平移 k * 周期 / offsets
+    :param kline_pct: True时kline_pct为K线内每分钟的涨跌幅列表，False时与1_kline_data的1H数据一样只包含该K线的涨跌幅
+    :param start: 开始时间
+    :return: 周期K线数据，按candle_begin_time排序
+    '''
+    minute_df = make_minute_data(bars + 1, rule_type, volatility, seed, start)
+    minutes = int(pd.to_timedelta(rule_type) / pd.Timedelta('1min'))
+    minute_pct = minute_df['close'].pct_change().fillna(0).values
+    df_list = []
+    for offset in range(offsets):
+        shift = offset * minutes // offsets
+        m = minute_df.iloc[shift: shift + bars * minutes]
+        group = np.arange(len(m)) // minutes
+
+        def agg(col, how):
+            return getattr(m[col].groupby(group), how)().values
+
+        period_df = pd.DataFrame({
+            'candle_begin_time': m['candle_begin_time'].values[::minutes],
+            'open': agg('open', 'first'), 'high': agg('high', 'max'), 'low': agg('low', 'min'), 'close': agg('close', 'last'),
+            'volume': agg('volume', 'sum'), 'quote_volume': agg('quote_volume', 'sum'), 'trade_num': agg('trade_num', 'sum'),
+            'taker_buy_base_asset_volume': agg('taker_buy_base_asset_volume', 'sum'),
+            'taker_buy_quote_asset_volume': agg('taker_buy_quote_asset_volume', 'sum'),
+        })
+        period_df['offset'] = offset
+        if kline_pct:
+            period_df['kline_pct'] = [list(x) for x in minute_pct[shift: shift + bars * minutes].reshape(bars, minutes)]
+        else:
+            period_df['kline_pct'] = period_df['close'].pct_change().apply(lambda x: [x])
+        df_list.append(period_df)
+    df = pd.concat(df_list, ignore_index=True)
+    df.sort_values(by=['candle_begin_time', 'offset'], inplace=True)
+    df.reset_index(inplace=True, drop=True)
+    return df[head_column]
+
+
+# ===== 计时
+def time_it(func, setup=None, repeat=5):
+    '''
+    重复执行func并计时，setup的返回值作为func的参数，setup本身不计入耗时
+    :return: 计时结果，包含最小值、中位数以及每次的耗时
+    '''
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start_time = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start_time)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat, 'times': times}
+
+
+def factor_names():
+    '''
+    factors目录下的所有策略
+    '''
+    return sorted(os.path.basename(p)[:-3] for p in glob.glob(os.path.join(root_path, 'factors', '*.py')) if not p.endswith('__init__.py'))
+
+
+def bench_functions(args):
+    '''
+    对各个核心函数单独计时
+    '''
+    results = {}
+    df = make_period_data(args.bars, args.rule_type, args.volatility, args.seed, args.offsets, args.kline_pct)
+    df = df[df['offset'] == 0].reset_index(drop=True)
+    min_amount = 0.001
+
+    # === 数据处理
+    minute_df = make_minute_data(args.bars, args.rule_type, args.volatility, args.seed)
+    results['transfer_to_period_data'] = time_it(lambda d: transfer_to_period_data(d, args.rule_type), lambda: (minute_df.copy(),), args.repeat)
+
+    # === 各个策略的signal，使用signal函数的默认参数
+    for signal_name in factor_names():
+        cls = importlib.import_module(f'factors.{signal_name}')
+        para = inspect.signature(cls.signal).parameters['para'].default
+        try:
+            results[f'signal.{signal_name}'] = time_it(lambda d: cls.signal(d, para=para, proportion=proportion, leverage_rate=leverage_rate), lambda: (df.copy(),), args.repeat)
+        except Exception as e:
+            print(f'{signal_name}计时失败：{e}')
+
+    # === 以sma的结果作为后续函数的输入
+    cls = importlib.import_module('factors.sma')
+    signal_df = cls.signal(df.copy(), para=[args.sma_para], proportion=proportion, leverage_rate=leverage_rate)
+    results['process_stop_loss_close'] = time_it(lambda d: process_stop_loss_close(d, proportion, leverage_rate), lambda: (signal_df.copy(),), args.repeat)
+    results['position_for_future'] = time_it(position_for_future, lambda: (signal_df.copy(),), args.repeat)
+    pos_df = position_for_future(signal_df.copy())
+    equity_kwargs = dict(slippage=slippage, c_rate=c_rate, leverage_rate=leverage_rate, min_amount=min_amount, min_margin_ratio=min_margin_ratio)
+    results['cal_equity_curve'] = time_it(lambda d: cal_equity_curve(d, **equity_kwargs), lambda: (pos_df.copy(),), args.repeat)
+    equity_df = cal_equity_curve(pos_df.copy(), **equity_kwargs)
+    results['transfer_equity_curve_to_trade'] = time_it(transfer_equity_curve_to_trade, lambda: (equity_df.copy(),), args.repeat)
+    trade = transfer_equity_curve_to_trade(equity_df.copy())
+    results['strategy_evaluate'] = time_it(lambda d, t: strategy_evaluate(d, t, args.rule_type), lambda: (equity_df.copy(), trade.copy()), args.repeat)
+    return results
+
+
+def write_sweep_inputs(tmp_path, df, rule_type, symbol=bench_symbol, min_amount=0.001):
+    '''
+    在tmp_path下写入参数遍历需要的K线数据(pickle_data/<rule_type>/<symbol>.pkl)和基准结果(data/output/para/基准&...csv)，
+    目录结构与项目目录一致，3_fastover和fastover_worker的data_path、root_path指向tmp_path后即可遍历
+    '''
+    os.makedirs(os.path.join(tmp_path, 'pickle_data', rule_type), exist_ok=True)
+    df.to_feather(os.path.join(tmp_path, 'pickle_data', rule_type, symbol + '.pkl'))
+    base_df = df.copy()
+    base_df['pos'] = 1
+    base_df = cal_equity_curve(base_df, slippage=slippage, c_rate=c_rate, leverage_rate=leverage_rate, min_amount=min_amount, min_margin_ratio=min_margin_ratio)
+    base, _ = strategy_evaluate(base_df, transfer_equity_curve_to_trade(base_df), rule_type)
+    os.makedirs(os.path.join(tmp_path, 'data/output/para'), exist_ok=True)
+    pd.DataFrame([{'币种': symbol, '累积净值': base.loc['累积净值', 0], '年化收益': base.loc['年化收益', 0],
+                   '最大回撤': base.loc['最大回撤', 0], '年化收益/回撤比': base.loc['年化收益/回撤比', 0]}]).to_csv(
+        os.path.join(tmp_path, f'data/output/para/基准&{leverage_rate}&{rule_type}.csv'), index=False, encoding='gbk')
+
+
+def bench_playblack(args):
+    '''
+    在临时目录中用模拟数据跑一次小规模的参数遍历(3_fastover.run_playblack)，计算端到端的耗时
+    '''
+    fastover = importlib.import_module('3_fastover')
+    cls = importlib.import_module(f'factors.{args.factor}')
+    tmp_path = tempfile.mkdtemp(prefix='cta_benchmark_')
+    old = {'data_path': fastover.data_path, 'root_path': fastover.root_path, 'min_amount': getattr(fastover, 'min_amount', None)}
+    old_db_path, old_para_list = store.result_db_path, cls.para_list
+    try:
+        # === 准备数据和基准结果
+        df = make_period_data(args.bars, args.rule_type, args.volatility, args.seed, 1, args.kline_pct)
+        write_sweep_inputs(tmp_path, df, args.rule_type)
+
+        # === 指向临时目录，只遍历前n个参数
+        fastover.data_path = os.path.join(tmp_path, 'pickle_data')
+        fastover.root_path = tmp_path
+        fastover.min_amount = 0.001
+        store.result_db_path = os.path.join(tmp_path, 'para_result.db')
+        cls.para_list = lambda: old_para_list()[:args.n_para]
+        start, end = str(df['candle_begin_time'].iloc[0]), str(df['candle_begin_time'].iloc[-1])
+        with redirect_stdout(io.StringIO()):
+            result = time_it(lambda: fastover.run_playblack(args.factor, bench_symbol, args.rule_type, start, end), repeat=args.e2e_repeat)
+        return {f'run_playblack.{args.factor}': result}
+    finally:
+        for k, v in old.items():
+            setattr(fastover, k, v)
+        store.result_db_path, cls.para_list = old_db_path, old_para_list
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+# ===== 基准文件
+def benchmark_file(name):
+    '''
+    基准名称对应的json文件，传入的是路径时直接使用
+    '''
+    if name.endswith('.json') or os.path.sep in name:
+        return name
+    return os.path.join(benchmark_path, f'{name}.json')
+
+
+def run(args):
+    warnings.filterwarnings('ignore')
+    results = bench_functions(args)
+    if not args.skip_e2e:
+        results.update(bench_playblack(args))
+    report = {
+        'name': args.name,
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                        'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count()},
+        'config': {k: v for k, v in vars(args).items() if k not in ('func', 'compare')},
+        'results': results,
+    }
+    path = benchmark_file(args.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(pd.DataFrame({k: {'min': v['min'], 'median': v['median']} for k, v in results.items()}).T.to_string(float_format=lambda x: f'{x:.4f}'))
+    print('基准已保存：', path)
+    if args.compare:
+        return compare_files(args.compare, path, args.threshold)
+    return 0
+
+
+def compare_files(base_name, new_name, threshold=0.2):
+    '''
+    对比两个基准文件，以每项的最小耗时计算变化比例
+    :param threshold: 耗时增加超过该比例时标记为变慢
+    :return: 有变慢的项目时返回1，否则返回0，可作为命令的退出码
+    '''
+    with open(benchmark_file(base_name), encoding='utf-8') as f:
+        base = json.load(f)
+    with open(benchmark_file(new_name), encoding='utf-8') as f:
+        new = json.load(f)
+    if base.get('config', {}).get('bars') != new.get('config', {}).get('bars'):
+        print('注意：两次运行的K线数量不同，耗时不能直接对比')
+    rows = []
+    for name in sorted(set(base['results']) | set(new['results'])):
+        b = base['results'].get(name, {}).get('min', np.nan)
+        n = new['results'].get(name, {}).get('min', np.nan)
+        ratio = n / b if b else np.nan
+        if np.isnan(ratio):
+            flag = '缺失'
+        elif ratio > 1 + threshold:
+            flag = '变慢'
+        elif ratio < 1 - threshold:
+            flag = '变快'
+        else:
+            flag = ''
+        rows.append({'name': name, 'base': b, 'new': n, 'ratio': ratio, 'flag': flag})
+    df = pd.DataFrame(rows)
+    print(f"{base['name']} -> {new['name']}")
+    print(df.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+    slow = df[df['flag'] == '变慢']
+    if not slow.empty:
+        print(f'有{len(slow)}项变慢超过{threshold:.0%}：', ', '.join(slow['name']))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='crypto_cta 核心函数性能基准')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='运行基准并保存为json')
+    p.add_argument('--name', default='latest', help='基准名称，保存为data/output/benchmark/<name>.json')
+    p.add_argument('--bars', type=int, default=10000, help='模拟K线数量')
+    p.add_argument('--rule-type', dest='rule_type', default='1H', help='K线周期')
+    p.add_argument('--volatility', type=float, default=0.002, help='每分钟收益率的标准差')
+    p.add_argument('--offsets', type=int, default=1, help='offset数量')
+    p.add_argument('--no-kline-pct', dest='kline_pct', action='store_false', help='kline_pct只包含该K线的涨跌幅')
+    p.add_argument('--seed', type=int, default=0, help='随机种子')
+    p.add_argument('--repeat', type=int, default=5, help='单个函数的重复次数')
+    p.add_argument('--sma-para', dest='sma_para', type=int, default=180, help='后续函数输入数据使用的sma参数')
+    p.add_argument('--factor', default='sma', help='端到端遍历使用的策略')
+    p.add_argument('--n-para', dest='n_para', type=int, default=8, help='端到端遍历的参数数量')
+    p.add_argument('--e2e-repeat', dest='e2e_repeat', type=int, default=1, help='端到端遍历的重复次数')
+    p.add_argument('--skip-e2e', dest='skip_e2e', action='store_true', help='不运行端到端遍历')
+    p.add_argument('--compare', default=None, help='运行后与该基准对比')
+    p.add_argument('--threshold', type=float, default=0.2, help='变慢的判定比例')
+    p.set_defaults(func=run)
+
+    p = sub.add_parser('compare', help='对比两个基准文件')
+    p.add_argument('base', help='作为对比基础的基准名称或json路径')
+    p.add_argument('new', help='新的基准名称或json路径')
+    p.add_argument('--threshold', type=float, default=0.2, help='变慢的判定比例')
+    p.set_defaults(func=lambda a: compare_files(a.base, a.new, a.threshold))
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
@@ -32,8 +32,46 @@ drop_days = 10  # 币种刚刚上线10天内不交易
 per_eva = 'a'       # y表示按年分区间遍历，m表示按月分区间遍历，w表示按周分区间遍历, a表示全部遍历
 # 删除模式
 del_mode = True
+# 遍历结果保存到SQLite结果库(data/output/para/para_result.db)，False时按原方式追加到csv文件
+use_result_store = True
 # 是否绘制参数覆盖总资金曲线
 cover_curve = False
+# 是否保存每个参数的资金曲线文件，覆盖曲线直接在内存中汇总，不依赖这些文件
+save_para_equity = False
+# 是否记录各阶段耗时(读取数据、signal、持仓、资金曲线、逐笔交易、策略评价、结果输出)，汇总结果保存在data/output/profile
+profile_mode = False
+# 参数遍历的计算方式：pool为本机进程池；queue为任务队列，3_fastover.py只写入任务，由任意机器上运行的fastover_worker.py领取计算
+# queue模式的结果只写入结果库，必须同时设置use_result_store = True，否则3_fastover.py、fastover_worker.py和4_strategy_evaluate.py启动时报错
+sweep_backend = 'pool'
+queue_chunk_size = 20  # 任务队列模式下每个任务包含的参数数量
+queue_lease_seconds = 600  # 任务租约时长(秒)，worker超过该时间没有续约，任务会被重新领取
+# 结果库(即任务队列)是否放在多台机器共享的网络存储上：False为本地磁盘，使用WAL日志模式，只支持单机多进程；
+# True时使用回滚日志(DELETE)，共享存储需正确实现文件锁(如启用了锁的NFSv4、SMB)，sshfs、网盘同步目录等不支持
+# 修改后需在没有worker运行时启动一次，日志模式才会切换
+result_db_shared = False
+
+# 轮动配置
+para_equity = False  # 轮动读取的子资金曲线：True为3_fastover.py保存的para_equity_curve(需开启save_para_equity)，False为2_fast_backview.py保存的equity_curve
+rotation_hold = 24  # 调仓间隔(K线数量)
+rotation_lookback = 168  # 打分的回看周期数
+rotation_top_k = 1  # 每次持有的子策略数量
+rotation_rule = 'return'  # 打分方式：return为区间收益，sharpe为区间均值/标准差
+
+# 参数稳健性评价的邻域半径(参数网格上的格子数)，4_strategy_evaluate.py按邻域平滑后的指标和各回测区间的一致性给参数排名
+robust_radius = 1
+
+# 图表中K线和每条曲线的最大点数，超过时K线按相邻K线合并、曲线用LTTB抽样(保留买卖点和最大回撤起止点)，None为不抽样
+pic_max_points = None
+# 图表html的保存方式：inline为每个文件内嵌完整的plotly.js，可以单独发送；
+# shared为同一目录下的图表共用一个plotly.min.js，单独复制图表时需连同plotly.min.js一起复制，plotly>=6时数据还会以二进制数组保存
+pic_html_mode = 'inline'
+# 是否绘制资金曲线图
+is_pic = True
+# 资金曲线csv和图表的生成方式：inline为计算进程中直接生成；deferred为计算进程只保存二进制中间结果(data/output/artifact)，
+# 计算全部完成后由报告进程池生成，也可以用report_worker.py在后台或按需生成
+report_mode = 'deferred'
+report_processes = 2  # 报告进程数量
+keep_artifacts = False  # 生成报告后是否保留中间结果，False时写入.done标记后删除对应的.pkl
 
 # 最小下单量
 min_amount_df = pd.read_csv(os.path.join(root_path, '最小下单量.csv'), encoding='utf-8')
@@ -0,0 +1,105 @@
+'''
+图表抽样
+长周期的资金曲线和K线直接写入html会生成很大的文件，浏览器渲染缓慢。
+折线用LTTB(Largest-Triangle-Three-Buckets)抽样，K线按相邻固定根数合并，抽样时保留指定的点(买卖点、最大回撤起止点等)。
+'''
+import numpy as np
+import pandas as pd
+
+
+def _to_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb_index(y, n_out, x=None):
+    '''
+    LTTB抽样，返回保留的行号
+    把中间的点平均分成n_out-2个桶，每个桶保留与上一个保留点、下一个桶均值构成的三角形面积最大的点，首尾两点始终保留
+    :param y: 曲线数值
+    :param n_out: 保留的点数
+    :param x: 横轴数值或时间，默认为行号
+    :return: 升序的行号数组
+    '''
+    y = _to_float(y)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else _to_float(x)
+
+    every = (n - 2) / (n_out - 2)
+    edges = (np.arange(n_out - 1) * every).astype(np.int64) + 1  # 每个桶的起始行号
+    edges = np.append(edges, n - 1)
+    index = np.empty(n_out, dtype=np.int64)
+    index[0], index[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) - 1 else n
+        with np.errstate(invalid='ignore'):
+            avg_x = x[end:next_end].mean()
+            avg_y = np.nanmean(y[end:next_end]) if np.isfinite(y[end:next_end]).any() else y[a]
+            area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1)))
+        index[i + 1] = a
+    return index
+
+
+def extreme_index(y):
+    '''
+    曲线的最高点、最低点，以及最大回撤开始(前高)和结束(最低)的行号
+    '''
+    y = _to_float(y)
+    if len(y) == 0 or np.isnan(y).all():
+        return np.array([], dtype=np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        drawdown = y / np.fmax.accumulate(y) - 1
+    trough = np.nanargmin(drawdown) if np.isfinite(drawdown).any() else 0
+    peak = np.nanargmax(y[:trough + 1])
+    return np.array([np.nanargmax(y), np.nanargmin(y), peak, trough], dtype=np.int64)
+
+
+def downsample_index(lines, max_points, x=None, keep=None):
+    '''
+    多条曲线共用横轴时的抽样行号：各曲线LTTB抽样结果、极值和最大回撤起止点以及keep的并集
+    :param lines: 曲线列表，长度相同
+    :param max_points: 每条曲线的目标点数，None或数据不超过该数量时不抽样
+    :param x: 横轴数值或时间
+    :param keep: 必须保留的行号
+    :return: 升序的行号数组
+    '''
+    n = len(lines[0]) if len(lines) else 0
+    if not max_points or n <= max_points:
+        return np.arange(n)
+    index = [lttb_index(y, max_points, x) for y in lines] + [extreme_index(y) for y in lines]
+    if keep is not None:
+        keep = np.asarray(keep, dtype=np.int64)
+        index.append(keep[(keep >= 0) & (keep < n)])
+    return np.unique(np.concatenate(index))
+
+
+def ohlc_buckets(df, max_points, time_col='candle_begin_time', sum_cols=('volume', 'quote_volume')):
+    '''
+    K线按相邻的固定根数合并为不超过max_points根：开盘取第一根，最高取最大，最低取最小，收盘取最后一根，成交量求和
+    :param df: 按时间排序的K线
+    :return: 合并后的K线，时间为每组第一根K线的时间；不需要合并时返回原df
+    '''
+    n = len(df)
+    if not max_points or n <= max_points:
+        return df
+    size = int(np.ceil(n / max_points))
+    starts = np.arange(0, n, size)
+    ends = np.append(starts[1:], n) - 1
+    result = pd.DataFrame({
+        time_col: df[time_col].values[starts],
+        'open': df['open'].values[starts],
+        'high': np.maximum.reduceat(df['high'].values, starts),
+        'low': np.minimum.reduceat(df['low'].values, starts),
+        'close': df['close'].values[ends],
+    })
+    for col in sum_cols:
+        if col in df.columns:
+            result[col] = np.add.reduceat(df[col].fillna(0).values, starts)
+    return result
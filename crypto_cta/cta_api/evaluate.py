@@ -1,11 +1,76 @@
 import os
 import ast
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import plotly
 import plotly.graph_objs as go
-from plotly.offline import plot
 from plotly.subplots import make_subplots
-from config import root_path
+import html
+from config import root_path, pic_html_mode
+from cta_api.downsample import downsample_index, ohlc_buckets
+
+# plotly>=6才会把numpy数组以二进制(base64类型数组)写入html，5.x中仍写为JSON数组
+plotly_typed_arrays = int(plotly.__version__.split('.')[0]) >= 6
+
+
+def compact_figure(fig):
+    """
+    时间转为毫秒数并把对应坐标轴设为时间轴；plotly>=6时把轨迹中的数组转为numpy数组，以二进制(base64类型数组)写入html
+    """
+    date_axes = set()
+    for trace in fig.data:
+        for attr in ('x', 'y', 'open', 'high', 'low', 'close', 'z'):
+            if attr not in trace or trace[attr] is None:
+                continue
+            values = np.asarray(trace[attr])
+            if values.dtype.kind == 'M':
+                trace[attr] = values.astype('datetime64[ms]').astype(np.int64).astype(float)
+                if attr in ('x', 'y'):
+                    axis = trace[attr + 'axis'] if attr + 'axis' in trace and trace[attr + 'axis'] else attr
+                    date_axes.add(axis.replace(attr, attr + 'axis', 1))
+            elif plotly_typed_arrays and values.dtype.kind in 'iufb':
+                trace[attr] = values.astype(float)
+    for axis in date_axes:
+        fig.layout[axis].type = 'date'
+    return fig
+
+
+def write_figure(fig, path, mode=pic_html_mode):
+    """
+    保存图表html
+    :param mode: inline为每个文件内嵌完整的plotly.js；shared为同一目录下的图表共用一个plotly.min.js，
+                 数据以二进制数组保存(需要plotly>=6，5.x中只共用plotly.min.js)
+    """
+    if mode == 'shared':
+        compact_figure(fig)
+        fig.write_html(path, include_plotlyjs='directory', auto_open=False)
+    else:
+        fig.write_html(path, include_plotlyjs=True, auto_open=False)
+
+
+def write_chart_index(directory, title=None):
+    """
+    生成目录下所有图表的索引页index.html，按修改时间倒序
+    :return: 索引页路径
+    """
+    files = [f for f in os.listdir(directory) if f.endswith('.html') and f != 'index.html']
+    files.sort(key=lambda f: os.path.getmtime(os.path.join(directory, f)), reverse=True)
+    rows = []
+    for f in files:
+        stat = os.stat(os.path.join(directory, f))
+        rows.append('<tr><td><a href="%s" target="_blank">%s</a></td><td>%s</td><td>%.1f KB</td></tr>' % (
+            html.escape(f, quote=True), html.escape(f[:-5]), pd.Timestamp(stat.st_mtime, unit='s').strftime('%Y-%m-%d %H:%M:%S'), stat.st_size / 1024))
+    title = html.escape(title or os.path.basename(os.path.abspath(directory)))
+    content = ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>%s</title>'
+               '<style>body{font-family:sans-serif;margin:20px}td,th{padding:4px 12px;text-align:left}tr:nth-child(even){background:#f4f4f4}</style>'
+               '</head><body><h2>%s</h2><p>共%d个图表</p><table><tr><th>图表</th><th>生成时间</th><th>大小</th></tr>%s</table></body></html>'
+               % (title, title, len(files), ''.join(rows)))
+    path = os.path.join(directory, 'index.html')
+    with open(path, 'w', encoding='utf8') as f:
+        f.write(content)
+    return path
+
 
 
 def draw_chart_mat(df, draw_chart_list, pic_size=[9, 9], dpi=72, font_size=20, noise_pct=0.05, path=root_path+'/pic.pdf'):
@@ -44,7 +109,56 @@ def draw_chart_mat(df, draw_chart_list, pic_size=[9, 9], dpi=72, font_size=20, n
     plt.savefig(path)
 
 
-def draw_equity_curve_mat(df, rtn, trade, title, path='./pic.html', show=True):
+def trade_mark_points(df, trade):
+    """
+    计算每笔交易开仓、平仓的标记位置，开仓标在最高价上方，平仓标在最低价上方
+    一次searchsorted定位所有交易时间，不再逐笔在整列中查找
+    :param df: 包含candle_begin_time、high、low列的df，按时间排序
+    :param trade: 每笔交易，index为开仓时间，包含end_bar、signal列
+    :return: DataFrame，列为x、y、text，按开仓、平仓交替排列
+    """
+    times = df['candle_begin_time'].values
+    high = df['high'].values
+    low = df['low'].values
+    buy_time = trade.index.values.astype(times.dtype)
+    sell_time = trade['end_bar'].values.astype(times.dtype)
+
+    def locate(t):
+        idx = np.searchsorted(times, t)
+        idx = np.minimum(idx, len(times) - 1)
+        return idx, times[idx] == t  # 找不到对应K线的时间不标记
+
+    buy_idx, buy_ok = locate(buy_time)
+    sell_idx, sell_ok = locate(sell_time)
+    buy_text = np.where(trade['signal'].values == -1, '开空', '开多')
+    # 开仓、平仓交替排列，与逐笔标记时的顺序一致
+    marks = pd.DataFrame({
+        'x': np.stack([buy_time, sell_time], axis=1).ravel(),
+        'y': np.stack([high[buy_idx], low[sell_idx]], axis=1).ravel() * 1.05,
+        'text': np.stack([buy_text, np.full(len(trade), '平仓')], axis=1).ravel(),
+    })
+    return marks[np.stack([buy_ok, sell_ok], axis=1).ravel()].reset_index(drop=True)
+
+
+def trade_annotations(marks):
+    """
+    买卖点转为带箭头的标注
+    """
+    return [dict(x=x, y=y, showarrow=True, text=text, arrowside='end', arrowhead=7)
+            for x, y, text in zip(marks['x'], marks['y'], marks['text'])]
+
+
+def trade_marker_trace(marks):
+    """
+    买卖点合并为一条散点轨迹，开多、开空、平仓用不同的形状和颜色
+    """
+    symbol = np.select([marks['text'] == '开多', marks['text'] == '开空'], ['triangle-up', 'triangle-down'], 'x')
+    color = np.select([marks['text'] == '开多', marks['text'] == '开空'], ['red', 'green'], 'gray')
+    return go.Scatter(x=marks['x'], y=marks['y'], mode='markers', name='买卖点', hovertext=marks['text'], hoverinfo='x+text',
+                      marker=dict(symbol=symbol, color=color, size=8))
+
+
+def draw_equity_curve_mat(df, rtn, trade, title, path='./pic.html', show=True, max_annotations=200):
     """
     绘制附带K线的资金曲线
     :param df: 包含资金曲线列的df
@@ -52,33 +166,12 @@ def draw_equity_curve_mat(df, rtn, trade, title, path='./pic.html', show=True):
     :param title: 表名
     :param path: 保存路径
     :param show: 是否展示图片
+    :param max_annotations: 买卖点数量超过该值时不再逐个标注，改为一条散点轨迹
     :return:
     """
-    g = trade.copy()
-    # 买卖点
-    mark_point_list = []
-    for i in g.index:
-        buy_time = i
-        sell_time = g.loc[i, 'end_bar']
-        # 标记买卖点，在最高价上方标记
-        y = df.loc[df['candle_begin_time'] == buy_time, 'high'].iloc[0] * 1.05
-        mark_point_list.append({
-            'x': buy_time,
-            'y': y,
-            'showarrow': True,
-            'text': '开空' if g.loc[i, 'signal'] == -1 else '开多',
-            'arrowside': 'end',
-            'arrowhead': 7
-        })
-        y = df.loc[df['candle_begin_time'] == sell_time, 'low'].iloc[0] * 1.05
-        mark_point_list.append({
-            'x': sell_time,
-            'y': y,
-            'showarrow': True,
-            'text': '平仓',
-            'arrowside': 'end',
-            'arrowhead': 7
-        })
+    # 买卖点：数量不多时用箭头标注，过多时合并为一条散点轨迹，避免生成大量标注
+    marks = trade_mark_points(df, trade)
+    mark_point_list = trade_annotations(marks) if len(marks) <= max_annotations else []
     trace1 = go.Candlestick(
         x=df['candle_begin_time'],
         open=df['open'],  # 字段数据必须是元组、列表、numpy数组、或者pandas的Series数据
@@ -107,18 +200,21 @@ def draw_equity_curve_mat(df, rtn, trade, title, path='./pic.html', show=True):
             )
         ]
     )
-    fig = go.Figure(data=[trace1, trace2], layout=layout)
+    data = [trace1, trace2]
+    if len(marks) > max_annotations:
+        data.append(trade_marker_trace(marks))
+    fig = go.Figure(data=data, layout=layout)
 
     fig.update_layout(template='none',width=1500,height=800,annotations=mark_point_list, title=title)
 
-    plot(figure_or_data=fig, filename=path, auto_open=False)
+    write_figure(fig, path)
     # 打开图片的html文件，需要判断系统的类型
     if show:
         res = os.system('start ' + path)
         if res != 0:
             os.system('open ' + path)
 
-def draw_equity_curve_mat_V1(df, rtn, trade, title, path='./pic.html', show=True):
+def draw_equity_curve_mat_V1(df, rtn, trade, title, path='./pic.html', show=True, max_annotations=200, max_points=None):
     """
     绘制附带K线的资金曲线
     :param df: 包含资金曲线列的df
@@ -126,36 +222,22 @@ def draw_equity_curve_mat_V1(df, rtn, trade, title, path='./pic.html', show=True
     :param title: 表名
     :param path: 保存路径
     :param show: 是否展示图片
+    :param max_annotations: 买卖点数量超过该值时不再逐个标注，改为一条散点轨迹
+    :param max_points: K线和资金曲线的最大点数，超过时K线按相邻K线合并、资金曲线用LTTB抽样，None为不抽样
     :return:
     """
     values = [[value] for value in rtn.T.iloc[:, 0].tolist()]
 
-    g = trade.copy()
-    # 买卖点
-    mark_point_list = []
-    for i in g.index:
-        buy_time = i
-        sell_time = g.loc[i, 'end_bar']
-        # 标记买卖点，在最高价上方标记
-        y = df.loc[df['candle_begin_time'] == buy_time, 'high'].iloc[0] * 1.05
-        mark_point_list.append({
-            'x': buy_time,
-            'y': y,
-            'showarrow': True,
-            'text': '开空' if g.loc[i, 'signal'] == -1 else '开多',
-            'arrowside': 'end',
-            'arrowhead': 7
-        })
-        y = df.loc[df['candle_begin_time'] == sell_time, 'low'].iloc[0] * 1.05
-        mark_point_list.append({
-            'x': sell_time,
-            'y': y,
-            'showarrow': True,
-            'text': '平仓',
-            'arrowside': 'end',
-            'arrowhead': 7
-        })
-    
+    # 买卖点：数量不多时用箭头标注，过多时合并为一条散点轨迹，避免生成大量标注
+    marks = trade_mark_points(df, trade)
+    mark_point_list = trade_annotations(marks) if len(marks) <= max_annotations else []
+
+    # 抽样：资金曲线始终保留买卖点所在K线和最大回撤起止点，买卖点本身不抽样
+    candle_df = ohlc_buckets(df, max_points)
+    times = df['candle_begin_time'].values
+    keep = np.searchsorted(times, marks['x'].values.astype(times.dtype))
+    line_df = df.iloc[downsample_index([df['equity_curve'].values], max_points, x=times, keep=keep)]
+
     # 创建一个带有子图的图形
     fig = make_subplots(
         rows=3, cols=1, 
@@ -168,23 +250,23 @@ def draw_equity_curve_mat_V1(df, rtn, trade, title, path='./pic.html', show=True
     )
 
     trace1 = go.Candlestick(
-        x=df['candle_begin_time'],
-        open=df['open'],
-        high=df['high'],
-        low=df['low'],
-        close=df['close'],
+        x=candle_df['candle_begin_time'],
+        open=candle_df['open'],
+        high=candle_df['high'],
+        low=candle_df['low'],
+        close=candle_df['close'],
     )
 
     trace2 = go.Scatter(
-        x=df['candle_begin_time'], 
-        y=df['equity_curve'], 
+        x=line_df['candle_begin_time'], 
+        y=line_df['equity_curve'], 
         name='资金曲线', 
         line=dict(color='#4682B4'),
     )
 
     trace3 = go.Bar(
-        x=df['candle_begin_time'],
-        y=df['volume'],
+        x=candle_df['candle_begin_time'],
+        y=candle_df['volume'],
         name='成交量',
         marker=dict(color='rgba(158,202,225,0.5)')
     )
@@ -204,6 +286,8 @@ def draw_equity_curve_mat_V1(df, rtn, trade, title, path='./pic.html', show=True
     fig.add_trace(trace1, secondary_y=False, row=2, col=1)
     fig.add_trace(trace2, secondary_y=True, row=2, col=1)
     fig.add_trace(trace3, row=3, col=1)
+    if len(marks) > max_annotations:
+        fig.add_trace(trade_marker_trace(marks), secondary_y=False, row=2, col=1)
 
     fig.update_layout(
         template='none',
@@ -233,7 +317,7 @@ def draw_equity_curve_mat_V1(df, rtn, trade, title, path='./pic.html', show=True
         ]
     )
 
-    fig.write_html(path, auto_open=False)
+    write_figure(fig, path)
 
     # 打开图片的html文件，需要判断系统的类型
     if show:
@@ -260,7 +344,7 @@ def draw_pearson_curve(df, title, path='./pic.html', show=True):
 
     fig.update_layout(title=title)
 
-    plot(figure_or_data=fig, filename=path, auto_open=False)
+    write_figure(fig, path)
     # 打开图片的html文件，需要判断系统的类型
     if show:
         res = os.system('start ' + path)
@@ -324,7 +408,7 @@ def draw_equity_parameters_plateau(df: pd.DataFrame, draw_chart_list, show=True,
         paper_bgcolor='white'
     )
 
-    fig.write_html(path)
+    write_figure(fig, path)
 
     # 打开HTML文件
     if show:
@@ -386,8 +470,7 @@ def draw_thermodynamic_diagram(df, draw_chart_list, show=True, path='./pic.pdf')
 
     fig.update_layout(margin=dict(t=100, r=150, b=100, l=100), autosize=True)
 
-    # plot(figure_or_data=fig, filename=path, auto_open=False)
-    fig.write_html(path)
+    write_figure(fig, path)
 
     # 打开图片的html文件，需要判断系统的类型
     if show:
@@ -454,7 +537,7 @@ def draw_shift_parameters_plateau(df: pd.DataFrame, draw_chart_list, show=True,
         paper_bgcolor='white'
     )
 
-    fig.write_html(path)
+    write_figure(fig, path)
 
     # 打开HTML文件
     if show:
@@ -463,7 +546,7 @@ def draw_shift_parameters_plateau(df: pd.DataFrame, draw_chart_list, show=True,
             os.system('open ' + path)
 
 def draw_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None, pic_size=[1500, 800], chg=False,
-                             title=None, path=root_path + '/data/pic.html', show=True):
+                             title=None, path=root_path + '/data/pic.html', show=True, max_points=None):
     """
     绘制策略曲线
     :param df: 包含净值数据的df
@@ -475,9 +558,13 @@ def draw_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None, pic_
     :param title: 标题
     :param path: 图片路径
     :param show: 是否打开图片
+    :param max_points: 每条曲线的最大点数，超过时用LTTB抽样并保留最高点、最低点和最大回撤起止点，None为不抽样
     :return:
     """
     draw_df = df.copy()
+    if chg:
+        for key in data_dict:
+            draw_df[data_dict[key]] = (draw_df[data_dict[key]] + 1).fillna(1).cumprod()
 
     # 设置时间序列
     if date_col:
@@ -485,11 +572,15 @@ def draw_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None, pic_
     else:
         time_data = draw_df.index
 
+    # 抽样，所有曲线共用抽样后的时间
+    lines = [draw_df[col].values for col in list(data_dict.values()) + list((right_axis or {}).values())]
+    index = downsample_index(lines, max_points, x=np.asarray(time_data))
+    draw_df = draw_df.iloc[index]
+    time_data = draw_df[date_col] if date_col else draw_df.index
+
     # 绘制左轴数据
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     for key in data_dict:
-        if chg:
-            draw_df[data_dict[key]] = (draw_df[data_dict[key]] + 1).fillna(1).cumprod()
         fig.add_trace(go.Scatter(x=time_data, y=draw_df[data_dict[key]], name=key, ))
 
     # 绘制右轴数据
@@ -523,7 +614,7 @@ def draw_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None, pic_
                          args=[{"yaxis.type": "log"}]),
                 ])],
     )
-    plot(figure_or_data=fig, filename=path, auto_open=False)
+    write_figure(fig, path)
 
     fig.update_yaxes(
         showspikes=True, spikemode='across', spikesnap='cursor', spikedash='solid', spikethickness=1,  # 峰线
@@ -539,8 +630,22 @@ def draw_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None, pic_
             os.system('open ' + path)
 
 def draw_shift_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None, pic_size=[1500, 800], chg=False,
-                                   title=None, path='pic.html', show=True):
+                                   title=None, path='pic.html', show=True, max_points=None):
     draw_df = df.copy()
+    draw_df['equity_name'] = draw_df['equity_name'].astype(str)
+    if chg:
+        for key in data_dict:
+            draw_df[data_dict[key]] = (draw_df[data_dict[key]] + 1).fillna(1).cumprod()
+
+    # 抽样：保留每段持仓的首尾两点，抽样后分段不变
+    names = draw_df['equity_name'].values
+    change = np.flatnonzero(names[1:] != names[:-1]) + 1
+    keep = np.concatenate([change - 1, change])
+    time_values = draw_df[date_col].values if date_col else draw_df.index.values
+    lines = [draw_df[col].values for col in list(data_dict.values()) + list((right_axis or {}).values())]
+    draw_df = draw_df.iloc[downsample_index(lines, max_points, x=time_values, keep=keep)]
+    if date_col:
+        draw_df.reset_index(drop=True, inplace=True)  # 分段按行号切片
 
     # 设置时间序列
     if date_col:
@@ -555,25 +660,17 @@ def draw_shift_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None
     colors = ['blue', 'red', 'green', 'orange', 'purple', 'brown']
     
     # 获取所有唯一的 equity_name
-    draw_df['equity_name'] = draw_df['equity_name'].astype(str)
     unique_equity_names = draw_df['equity_name'].unique()
     
     # 创建一个字典，将每个 equity_name 映射到一个颜色
     color_map = {name: colors[i % len(colors)] for i, name in enumerate(unique_equity_names)}
 
     # 绘制左轴数据
+    # 分段绘制，equity_name变化处为新的一段
+    names = draw_df['equity_name'].values
+    bounds = np.concatenate([[0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(draw_df)]])
+    segments = list(zip(bounds[:-1], bounds[1:]))
     for key in data_dict:
-        if chg:
-            draw_df[data_dict[key]] = (draw_df[data_dict[key]] + 1).fillna(1).cumprod()
-
-        # 分段绘制
-        segments = []
-        start_idx = 0
-        for i in range(1, len(draw_df)):
-            if draw_df['equity_name'].iloc[i] != draw_df['equity_name'].iloc[start_idx]:
-                segments.append((start_idx, i))
-                start_idx = i
-        segments.append((start_idx, len(draw_df)))
 
         for start, end in segments:
             equity_name = draw_df['equity_name'].iloc[start]
@@ -625,7 +722,7 @@ def draw_shift_equity_curve_plotly(df, data_dict, date_col=None, right_axis=None
     )
 
     # 绘制图形
-    plot(figure_or_data=fig, filename=path, auto_open=False)
+    write_figure(fig, path)
 
     # 更新轴
     fig.update_yaxes(showspikes=True, spikemode='across', spikesnap='cursor', spikedash='solid', spikethickness=1)
@@ -14,15 +14,20 @@ def read_csv(path):
         df = pd.DataFrame()
     return df
 
+def equity_path(equity_name, para_equity=para_equity):
+    '''
+    轮动子资金曲线的路径
+    :param para_equity: True为3_fastover.py保存的para_equity_curve，False为2_fast_backview.py保存的equity_curve，默认使用config中的设置
+    '''
+    if para_equity:
+        return os.path.join(root_path,f'data/output/para_equity_curve/{equity_name}.csv')
+    return os.path.join(root_path,f'data/output/equity_curve/{equity_name}.csv')
+
 def shift_read(equity_name):
     '''
     读取轮动子资金曲线，并进行一些预处理
     '''
-    if para_equity:
-        path = os.path.join(root_path,f'data/output/para_equity_curve/{equity_name}.csv')
-    else:
-        path = os.path.join(root_path,f'data/output/equity_curve/{equity_name}.csv')
-    df = pd.read_csv(path,encoding='gbk',parse_dates=['candle_begin_time'])
+    df = pd.read_csv(equity_path(equity_name),encoding='gbk',parse_dates=['candle_begin_time'])
     # 解析字符串并转换为 NumPy 数组
     df['kline_pct'] = df['kline_pct'].apply(lambda x: np.fromstring(x.strip('[]'), sep=' '))
     # 删除无用列
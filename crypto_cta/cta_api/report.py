@@ -0,0 +1,126 @@
+'''
+报告生成
+计算进程只把资金曲线、逐笔交易和评价指标保存为二进制中间结果(data/output/artifact/*.pkl)，
+资金曲线csv和图表由报告进程统一生成，计算过程不再等待文件写入和绘图。
+'''
+import os
+import glob
+from functools import partial
+from multiprocessing import Pool
+import pandas as pd
+from config import root_path, is_pic, pic_max_points, keep_artifacts
+from cta_api.evaluate import draw_equity_curve_mat_V1
+
+artifact_path = os.path.join(root_path, 'data/output/artifact')
+equity_columns = ['candle_begin_time', 'open', 'high', 'low', 'close', 'volume', 'signal', 'pos', 'quote_volume', 'kline_pct', 'equity_curve']
+
+
+def artifact_name(signal_name, symbol, rule_type, para):
+    '''
+    中间结果、资金曲线csv共用的文件名：策略&币种&周期&参数
+    '''
+    return '%s&%s&%s&%s' % (signal_name, symbol.split('-')[0], rule_type, str(para))
+
+
+def write_equity_csv(df, name):
+    '''
+    保存资金曲线csv，列名与轮动读取的格式一致
+    :param name: 文件名，策略&币种&周期&参数
+    '''
+    df_output = df[['candle_begin_time', 'open', 'high', 'low', 'close', 'signal', 'pos', 'quote_volume', 'kline_pct', 'equity_curve']]  # 筛选一下需要的列，避免把所有的列都存在内存中，避免加大内存的压力
+    df_output = df_output.rename(columns={'median': 'line_median', 'upper': 'line_upper', 'lower': 'line_lower', 'quote_volume': 'b_bar_quote_volume', 'equity_curve': 'r_line_equity_curve'})  # 对指定列名重命名，方便我们看数据是容易理解
+    equity_path = os.path.join(root_path, 'data/output/equity_curve')
+    if os.path.exists(equity_path) == False:
+        os.makedirs(equity_path)
+    path = os.path.join(equity_path, '%s.csv' % name)
+    df_output.reset_index(drop=True).to_csv(path, index=False, encoding='gbk')  # 以GBK编码并且删除index保存csv文件
+    return path
+
+
+def draw_report(df, rtn, trade, title, max_points=pic_max_points):
+    '''
+    绘制资金曲线图
+    '''
+    pic_path = os.path.join(root_path, 'data/output/pic')
+    if os.path.exists(pic_path) == False:
+        os.makedirs(pic_path)
+    path = os.path.join(pic_path, f'{title}.html')
+    draw_equity_curve_mat_V1(df, rtn.T, trade, title, path=path, show=False, max_points=max_points)  # 调用函数绘制资金曲线，需要传入带有资金曲线的df、每笔交易数据以及图片的标题
+    return path
+
+
+def save_artifact(name, df, trade=None, rtn=None, title=None):
+    '''
+    计算进程保存中间结果，先写临时文件再改名，报告进程不会读到写了一半的文件
+    :param name: 文件名，策略&币种&周期&参数
+    :param df: 带资金曲线的df
+    :param trade: 每笔交易，不绘图时可以为None
+    :param rtn: 策略评价指标
+    :param title: 图表标题
+    :return: 中间结果路径
+    '''
+    if os.path.exists(artifact_path) == False:
+        os.makedirs(artifact_path, exist_ok=True)
+    path = os.path.join(artifact_path, name + '.pkl')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    artifact = {'equity': df[[c for c in equity_columns if c in df.columns]].reset_index(drop=True), 'trade': trade, 'rtn': rtn, 'title': title}
+    pd.to_pickle(artifact, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def render_artifact(path, csv=True, pic=is_pic, max_points=pic_max_points, keep=keep_artifacts):
+    '''
+    由一个中间结果生成资金曲线csv和图表，完成后写入.done标记
+    :param keep: 是否保留中间结果，False时写入.done标记后删除.pkl
+    :return: 生成的文件列表
+    '''
+    artifact = pd.read_pickle(path)
+    name = os.path.basename(path)[:-len('.pkl')]
+    outputs = []
+    if csv:
+        outputs.append(write_equity_csv(artifact['equity'], name))
+    trade = artifact['trade']
+    if pic and trade is not None and not trade.empty:
+        outputs.append(draw_report(artifact['equity'], artifact['rtn'], trade, artifact['title'] or name, max_points))
+    with open(path[:-len('.pkl')] + '.done', 'w') as f:
+        f.write('\n'.join(outputs))
+    if not keep:
+        os.remove(path)
+    return outputs
+
+
+def pending_artifacts(names=None):
+    '''
+    还没有生成报告，或报告生成后又重新计算过的中间结果
+    :param names: 只检查这些名称，None为全部
+    '''
+    if names is None:
+        paths = glob.glob(os.path.join(artifact_path, '*.pkl'))
+    else:
+        paths = [os.path.join(artifact_path, name + '.pkl') for name in names]
+    pending = []
+    for path in sorted(paths):
+        done = path[:-len('.pkl')] + '.done'
+        if os.path.exists(path) and (not os.path.exists(done) or os.path.getmtime(done) < os.path.getmtime(path)):
+            pending.append(path)
+    return pending
+
+
+def render_reports(names=None, processes=1, csv=True, pic=is_pic, max_points=pic_max_points, keep=keep_artifacts):
+    '''
+    生成待处理的报告
+    :param names: 只处理这些中间结果，None为目录中全部待处理的中间结果
+    :param processes: 报告进程数量
+    :param keep: 是否保留中间结果
+    :return: 处理的中间结果数量
+    '''
+    paths = pending_artifacts(names)
+    render = partial(render_artifact, csv=csv, pic=pic, max_points=max_points, keep=keep)
+    if processes > 1 and len(paths) > 1:
+        with Pool(min(processes, len(paths))) as pool:
+            pool.map(render, paths)
+    else:
+        for path in paths:
+            render(path)
+    return len(paths)
@@ -0,0 +1,218 @@
+'''
+参数遍历结果库
+遍历结果以数值类型保存在SQLite中，并在策略、币种、周期、回测区间以及常用指标上建立索引
+结果库默认使用WAL日志模式，多个进程可以同时读取，但WAL依赖同一台机器上的共享内存，不能用于网络文件系统；
+结果库(任务队列)放在多台机器共享的存储上时需在config.py中设置result_db_shared = True，改用回滚日志(DELETE)
+'''
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from config import root_path, result_db_shared
+
+# 默认结果库路径
+result_db_path = os.path.join(root_path, 'data/output/para/para_result.db')
+# 日志模式：WAL只支持单机，多台机器通过网络存储共享结果库时使用DELETE
+journal_mode = 'DELETE' if result_db_shared else 'WAL'
+
+# 结果表字段：(结果中的列名, 数据库字段名, 类型)，pct表示百分比字符串，保存时转为小数
+result_fields = [
+    ('累积净值', 'equity', 'num'),
+    ('年化收益', 'annual_return', 'num'),
+    ('最大回撤', 'max_drawdown', 'pct'),
+    ('最大回撤开始时间', 'drawdown_start', 'text'),
+    ('最大回撤结束时间', 'drawdown_end', 'text'),
+    ('年化收益/回撤比', 'return_drawdown_ratio', 'num'),
+    ('盈利笔数', 'win_num', 'num'),
+    ('亏损笔数', 'loss_num', 'num'),
+    ('胜率', 'win_rate', 'pct'),
+    ('每笔交易平均盈亏', 'avg_change', 'pct'),
+    ('盈亏收益比', 'profit_loss_ratio', 'num'),
+    ('单笔最大盈利', 'max_profit', 'pct'),
+    ('单笔最大亏损', 'max_loss', 'pct'),
+    ('单笔最长持有时间', 'max_hold_time', 'text'),
+    ('单笔最短持有时间', 'min_hold_time', 'text'),
+    ('平均持仓周期', 'mean_hold_time', 'text'),
+    ('最大连续盈利笔数', 'max_win_streak', 'num'),
+    ('最大连续亏损笔数', 'max_loss_streak', 'num'),
+    ('月化收益', 'monthly_return', 'num'),
+    ('币种原始累积净值', 'base_equity', 'num'),
+    ('币种原始年化收益', 'base_annual_return', 'num'),
+    ('币种原始最大回撤', 'base_max_drawdown', 'pct'),
+    ('币种原始年化收益/回撤比', 'base_return_drawdown_ratio', 'num'),
+    ('等效参数', 'alias', 'text'),  # 持仓与之相同、已计算过的参数，结果直接复用自该参数
+]
+# 建立索引的指标，按这些指标取前N名时直接走索引：指定回测区间时用(键, 回测区间, 指标)索引，全部区间时用(键, 指标)索引
+index_metrics = ['return_drawdown_ratio', 'annual_return', 'equity', 'max_drawdown']
+
+key_columns = ['signal', 'symbol', 'leverage', 'rule_type']
+_column_of = {name: column for name, column, _ in result_fields}
+_name_of = {column: name for name, column, _ in result_fields}
+
+
+def connect(path=None):
+    '''
+    打开结果库，不存在时自动建表和索引
+    :param path: 结果库路径，默认为result_db_path
+    :return: sqlite3连接
+    '''
+    path = path or result_db_path
+    if os.path.exists(os.path.dirname(path)) == False:
+        os.makedirs(os.path.dirname(path))
+    conn = sqlite3.connect(path, timeout=60)
+    # WAL允许多个进程同时读取，写入互不阻塞读；DELETE依赖文件锁，可用于支持文件锁的网络存储
+    # 切换日志模式需要没有其他连接，其他进程仍在使用时保持原来的模式
+    conn.execute(f'PRAGMA journal_mode={journal_mode}')
+    columns = ', '.join(f'{column} {"TEXT" if kind == "text" else "REAL"}' for _, column, kind in result_fields)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS para_result (signal TEXT, symbol TEXT, leverage REAL, rule_type TEXT, period TEXT, para TEXT, {columns})')
+    # 旧版本建立的结果库补上新增的字段
+    exist_columns = [row[1] for row in conn.execute('PRAGMA table_info(para_result)')]
+    for _, column, kind in result_fields:
+        if column not in exist_columns:
+            conn.execute(f'ALTER TABLE para_result ADD COLUMN {column} {"TEXT" if kind == "text" else "REAL"}')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_para_result_key ON para_result (signal, symbol, leverage, rule_type, period)')
+    for column in index_metrics:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_para_result_{column} ON para_result (signal, symbol, leverage, rule_type, period, {column})')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_para_result_all_{column} ON para_result (signal, symbol, leverage, rule_type, {column})')
+    return conn
+
+
+def _to_number(series, kind):
+    '''
+    将结果列转为数值，百分比字符串转为小数
+    '''
+    if kind == 'pct' and series.dtype == object:
+        return pd.to_numeric(series.astype(str).str.rstrip('%'), errors='coerce') / 100
+    return pd.to_numeric(series, errors='coerce')
+
+
+def append_results(df, signal_name, symbol, leverage, rule_type, path=None, conn=None):
+    '''
+    追加一批遍历结果
+    :param df: run_playblack整理后的遍历结果，列名与csv结果一致，需包含para和回测区间
+    :param signal_name: 策略名称
+    :param symbol: 币种名称
+    :param leverage: 杠杆倍数
+    :param rule_type: 回测时间周期
+    :param path: 结果库路径
+    :param conn: 已打开的连接，传入时在调用方的事务中写入，不提交也不关闭
+    :return: 写入的行数
+    '''
+    if df.empty:
+        return 0
+    rows = pd.DataFrame({'signal': signal_name, 'symbol': symbol, 'leverage': float(leverage), 'rule_type': rule_type,
+                         'period': df['回测区间'].astype(str).values, 'para': df['para'].astype(str).values})
+    for name, column, kind in result_fields:
+        if name not in df.columns:
+            rows[column] = None
+        elif kind == 'text':
+            rows[column] = df[name].astype(object).values
+        else:
+            rows[column] = _to_number(df[name], kind).values
+    rows = rows.astype(object).where(rows.notnull(), None)  # NaN保存为NULL
+    sql = f'INSERT INTO para_result ({", ".join(rows.columns)}) VALUES ({", ".join("?" * rows.shape[1])})'
+    if conn is not None:
+        conn.executemany(sql, rows.itertuples(index=False, name=None))
+        return len(rows)
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany(sql, rows.itertuples(index=False, name=None))
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def delete_results(signal_name, symbol, leverage, rule_type, path=None):
+    '''
+    删除指定策略、币种、杠杆、周期的全部遍历结果，对应删除模式
+    :return: 删除的行数
+    '''
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.execute('DELETE FROM para_result WHERE signal=? AND symbol=? AND leverage=? AND rule_type=?',
+                               (signal_name, symbol, float(leverage), rule_type))
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def _where(signal_name, symbol, leverage, rule_type, period):
+    sql = 'signal=? AND symbol=? AND leverage=? AND rule_type=?'
+    args = [signal_name, symbol, float(leverage), rule_type]
+    if period is not None:
+        sql += ' AND period=?'
+        args.append(period)
+    return sql, args
+
+
+def _to_frame(cursor):
+    '''
+    将查询结果转为DataFrame，列名还原为csv结果中的中文列名
+    '''
+    columns = [d[0] for d in cursor.description]
+    df = pd.DataFrame(cursor.fetchall(), columns=columns)
+    for _, column, kind in result_fields:
+        if column in df.columns and kind != 'text':
+            df[column] = df[column].astype(float)
+    return df.rename(columns=dict(_name_of, period='回测区间'))
+
+
+def load_results(signal_name, symbol, leverage, rule_type, period=None, path=None):
+    '''
+    读取遍历结果，指标均为数值(百分比已转为小数)
+    :param period: 回测区间，None表示全部区间
+    :return: 与csv结果列名一致的DataFrame
+    '''
+    where, args = _where(signal_name, symbol, leverage, rule_type, period)
+    columns = ', '.join(['para'] + [column for _, column, _ in result_fields] + ['period'])
+    conn = connect(path)
+    try:
+        return _to_frame(conn.execute(f'SELECT {columns} FROM para_result WHERE {where} ORDER BY rowid', args))
+    finally:
+        conn.close()
+
+
+def query_top(signal_name, symbol, leverage, rule_type, metric='年化收益/回撤比', n=10, period=None, ascending=False, path=None):
+    '''
+    按指标取排名前N的参数
+    :param metric: 排序指标，可以是中文列名或数据库字段名
+    :param n: 返回的数量
+    :param period: 回测区间，None表示全部区间
+    :param ascending: 是否升序
+    :return: 排名前N的遍历结果
+    '''
+    column = _column_of.get(metric, metric)
+    if column not in _name_of:
+        raise ValueError(f'未知的指标: {metric}')
+    where, args = _where(signal_name, symbol, leverage, rule_type, period)
+    columns = ', '.join(['para'] + [c for _, c, _ in result_fields] + ['period'])
+    order = 'ASC' if ascending else 'DESC'
+    conn = connect(path)
+    try:
+        cur = conn.execute(f'SELECT {columns} FROM para_result WHERE {where} AND {column} IS NOT NULL '
+                           f'ORDER BY {column} {order} LIMIT ?', args + [int(n)])
+        return _to_frame(cur)
+    finally:
+        conn.close()
+
+
+def query_plateau(signal_name, symbol, leverage, rule_type, metric='累积净值', path=None):
+    '''
+    取参数平原数据：每个回测区间下所有参数的指标值，只读取需要的列
+    :param metric: 指标，可以是中文列名或数据库字段名，多个指标时传入列表
+    :return: 包含para、回测区间以及指标列的DataFrame，按回测区间排列
+    '''
+    columns = []
+    for m in ([metric] if isinstance(metric, str) else metric):
+        column = _column_of.get(m, m)
+        if column not in _name_of:
+            raise ValueError(f'未知的指标: {m}')
+        columns.append(column)
+    where, args = _where(signal_name, symbol, leverage, rule_type, None)
+    conn = connect(path)
+    try:
+        return _to_frame(conn.execute(f'SELECT para, period, {", ".join(columns)} FROM para_result WHERE {where} ORDER BY period, rowid', args))
+    finally:
+        conn.close()
@@ -0,0 +1,136 @@
+'''
+参数稳健性评价
+把遍历结果按参数放到N维网格上，对每个参数计算邻域平滑后的指标、邻域内的波动，以及在各回测区间之间的一致性，
+按稳健得分排序，用于代替肉眼观察参数平原和热力图来选择参数。只依赖numpy和pandas。
+'''
+import warnings
+import numpy as np
+import pandas as pd
+
+
+def para_grid(df, metric, para_col='para', window_col='回测区间'):
+    '''
+    把遍历结果放到参数网格上
+    :param df: 遍历结果，para列为'[20, 2]'形式的字符串、列表，或单参数策略的数值
+    :param metric: 指标列名
+    :param window_col: 回测区间列名，不存在时视为只有一个区间
+    :return: axes 每个维度的参数取值，windows 回测区间，grid 形状为(区间数量, 各维参数数量...)的数组，没有结果的格子为空值
+    '''
+    if len(df) and isinstance(df[para_col].iloc[0], str):
+        # 字符串形式的参数直接按逗号拆分，比逐行literal_eval快很多
+        paras = df[para_col].str.strip('[]() ').str.split(',', expand=True).astype(float).values
+    else:
+        # 单参数策略的参数是数值(CSV读回时为int64列)，按一列的网格处理
+        paras = np.array([np.atleast_1d(p) for p in df[para_col]], dtype=float).reshape(len(df), -1)
+    if window_col in df.columns:
+        windows, window_idx = np.unique(df[window_col].astype(str).values, return_inverse=True)
+    else:
+        windows, window_idx = np.array(['全部']), np.zeros(len(df), dtype=np.int64)
+
+    axes, index = [], [window_idx]
+    for d in range(paras.shape[1]):
+        values, idx = np.unique(paras[:, d], return_inverse=True)
+        axes.append(values)
+        index.append(idx)
+    shape = (len(windows),) + tuple(len(a) for a in axes)
+
+    # 同一格子有多条结果时取均值
+    values = df[metric].astype(float).values
+    values = np.where(np.isfinite(values), values, np.nan)
+    flat = np.ravel_multi_index(index, shape)
+    ok = ~np.isnan(values)
+    total = np.bincount(flat[ok], weights=values[ok], minlength=int(np.prod(shape)))
+    count = np.bincount(flat[ok], minlength=int(np.prod(shape)))
+    with np.errstate(invalid='ignore'):
+        grid = (total / count).reshape(shape)
+    return axes, windows, grid
+
+
+def box_sum(x, radius, axes):
+    '''
+    在指定的维度上做边长为2*radius+1的滑动窗口求和(可分离的N维均匀卷积)，边界处窗口截断
+    :param radius: 每个维度的半径，与axes一一对应
+    '''
+    for axis, r in zip(axes, radius):
+        if r <= 0:
+            continue
+        n = x.shape[axis]
+        c = np.cumsum(x, axis=axis)
+        c = np.concatenate([np.zeros_like(np.take(c, [0], axis=axis)), c], axis=axis)
+        hi = np.minimum(np.arange(n) + r + 1, n)
+        lo = np.maximum(np.arange(n) - r, 0)
+        x = np.take(c, hi, axis=axis) - np.take(c, lo, axis=axis)
+    return x
+
+
+def neighbor_stats(grid, radius=1):
+    '''
+    计算每个格子邻域(包含自身)的均值、标准差和有效格子数量，空值不参与计算
+    :param grid: para_grid返回的网格，第0维为回测区间，不做平滑
+    :param radius: 邻域半径，整数或每个参数维度一个
+    :return: mean, std, count，形状与grid相同
+    '''
+    dims = tuple(range(1, grid.ndim))
+    if np.isscalar(radius):
+        radius = (radius,) * len(dims)
+    valid = ~np.isnan(grid)
+    x = np.where(valid, grid, 0)
+    count = box_sum(valid.astype(float), radius, dims)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = box_sum(x, radius, dims) / count
+        var = box_sum(x ** 2, radius, dims) / count - mean ** 2
+    std = np.sqrt(np.maximum(var, 0))
+    return mean, std, count
+
+
+def robustness_score(df, metric='年化收益/回撤比', radius=1, penalty=1, para_col='para', window_col='回测区间'):
+    '''
+    计算每个参数的稳健性指标并排序
+    :param df: 遍历结果
+    :param metric: 用于评价的指标，越大越好
+    :param radius: 邻域半径(参数网格上的格子数)
+    :param penalty: 稳健得分中邻域标准差的权重
+    :return: DataFrame，每行为一个参数：
+        指标 各区间指标均值；邻域均值 各区间邻域平滑指标的均值；邻域标准差 各区间邻域内指标标准差的均值；
+        区间数量；区间胜率 邻域均值大于0的区间占比；区间排名 各区间内邻域均值的分位排名(1为最好)的均值；区间排名标准差；
+        稳健得分 各区间(邻域均值 - penalty * 邻域标准差)的均值，按稳健得分降序排列
+    '''
+    axes, windows, grid = para_grid(df, metric, para_col, window_col)
+    mean, std, count = neighbor_stats(grid, radius)
+    has = ~np.isnan(grid)  # 只评价有遍历结果的参数
+    mean = np.where(has, mean, np.nan)
+    std = np.where(has, std, np.nan)
+    score = mean - penalty * std
+
+    # 每个区间内按邻域均值计算分位排名，排名第一为1，最后为0
+    flat = mean.reshape(len(windows), -1)
+    order = np.argsort(np.where(np.isnan(flat), np.inf, -flat), axis=1, kind='stable')
+    position = np.empty_like(order)
+    np.put_along_axis(position, order, np.arange(flat.shape[1])[None, :], axis=1)
+    n_valid = (~np.isnan(flat)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rank = np.where(np.isnan(flat), np.nan, 1 - position / np.maximum(n_valid - 1, 1)).reshape(mean.shape)
+
+    # ===== 汇总各区间，只保留至少在一个区间有结果的参数
+    exist = has.any(axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        window_count = has.sum(axis=0)
+        columns = {
+            '指标': np.nanmean(grid, axis=0),
+            '邻域均值': np.nanmean(mean, axis=0),
+            '邻域标准差': np.nanmean(std, axis=0),
+            '区间数量': window_count,
+            '区间胜率': (mean > 0).sum(axis=0) / window_count,
+            '区间排名': np.nanmean(rank, axis=0),
+            '区间排名标准差': np.nanstd(rank, axis=0),
+            '稳健得分': np.nanmean(score, axis=0),
+        }
+    grid_index = np.nonzero(exist)
+    para_values = np.stack([a[i] for a, i in zip(axes, grid_index)], axis=1)
+    result = pd.DataFrame({'para': [str([int(v) if float(v).is_integer() else float(v) for v in row]) for row in para_values]})
+    for k, v in columns.items():
+        result[k] = v[grid_index]
+    result.sort_values('稳健得分', ascending=False, inplace=True)
+    result.reset_index(drop=True, inplace=True)
+    return result
@@ -0,0 +1,166 @@
+'''
+轮动回测
+把多个子策略的资金曲线对齐为一个二维的每周期涨跌幅矩阵(K线数量 × 子策略数量)，
+每隔固定周期按过去一段时间的表现对所有子策略打分，选出排名靠前的子策略等权持有，
+输出组合资金曲线、每次调仓的权重与换手率，以及每个子策略的收益贡献。
+'''
+import numpy as np
+import pandas as pd
+from config import para_equity
+from cta_api.reader import equity_path
+
+
+def load_returns(equity_names, para_equity=para_equity):
+    '''
+    读取子策略资金曲线，对齐为每周期涨跌幅矩阵
+    只读取时间和资金曲线两列，不解析kline_pct
+    :param equity_names: 子资金曲线名称列表，如['sma&BTC&1H&[180]', ...]
+    :param para_equity: 是否读取para_equity_curve目录，默认使用config中的para_equity
+    :return: times 所有子策略时间的并集，returns 涨跌幅矩阵，子策略上线前、结束后为空值，中间缺失的周期涨跌幅为0
+    '''
+    curves = []
+    for name in equity_names:
+        df = pd.read_csv(equity_path(name, para_equity), encoding='gbk', usecols=['candle_begin_time', 'r_line_equity_curve'], parse_dates=['candle_begin_time'])
+        df.drop_duplicates('candle_begin_time', keep='last', inplace=True)
+        curves.append((df['candle_begin_time'].values, df['r_line_equity_curve'].values.astype(float)))
+    times = np.unique(np.concatenate([t for t, _ in curves])) if curves else np.array([], dtype='datetime64[ns]')
+
+    n = len(times)
+    returns = np.full((n, len(curves)), np.nan)
+    first = np.zeros(len(curves), dtype=np.int64)
+    last = np.full(len(curves), -1, dtype=np.int64)
+    for j, (t, equity) in enumerate(curves):
+        if len(t) == 0:
+            continue
+        idx = np.searchsorted(times, t)
+        pct = np.empty(len(equity))
+        pct[0] = 0
+        pct[1:] = equity[1:] / equity[:-1] - 1
+        returns[idx, j] = pct
+        first[j], last[j] = idx.min(), idx.max()
+    # 子策略存续期内缺失的周期视为资金曲线不变
+    rows = np.arange(n)[:, None]
+    alive = (rows >= first) & (rows <= last)
+    returns[alive & np.isnan(returns)] = 0
+    return pd.DatetimeIndex(times), returns
+
+
+def rotation_score(returns, lookback, score='return'):
+    '''
+    计算每根K线收盘时各子策略过去lookback个周期的得分，窗口内有空值的子策略得分为空
+    :param returns: 涨跌幅矩阵
+    :param lookback: 回看周期数
+    :param score: return为区间收益，sharpe为区间均值/标准差
+    :return: 得分矩阵，与returns形状相同，前lookback行为空
+    '''
+    n = len(returns)
+    invalid = np.isnan(returns)
+    r = np.where(invalid, 0, returns)
+
+    def window_sum(x):
+        # 用累加和的差得到滚动窗口的和
+        c = np.zeros((n + 1, x.shape[1]))
+        np.cumsum(x, axis=0, out=c[1:])
+        out = np.full(x.shape, np.nan)
+        out[lookback:] = c[lookback + 1:] - c[1:n - lookback + 1]
+        return out
+
+    if score == 'return':
+        result = np.expm1(window_sum(np.log1p(r)))
+    elif score == 'sharpe':
+        mean = window_sum(r) / lookback
+        var = window_sum(r ** 2) / lookback - mean ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = mean / np.sqrt(np.maximum(var, 0))
+        result[~np.isfinite(result)] = np.nan
+    else:
+        raise ValueError(f'未知的得分方式：{score}')
+    result[window_sum(invalid.astype(float)) > 0] = np.nan
+    return result
+
+
+def rotate(times, returns, names, hold=24, lookback=168, top_k=1, score='return', ascending=False, min_score=None, c_rate=0):
+    '''
+    轮动回测
+    第t根K线收盘时用截止到t的数据打分，从t+1根K线开始持有选中的子策略，持有期间权重随净值漂移，下次调仓时重新等权
+    :param times: 时间，load_returns的返回值
+    :param returns: 涨跌幅矩阵，load_returns的返回值
+    :param names: 子策略名称，与returns的列对应
+    :param hold: 调仓间隔(K线数量)
+    :param lookback: 打分的回看周期数
+    :param top_k: 每次持有的子策略数量
+    :param score: 得分方式，见rotation_score
+    :param ascending: False选得分最高的，True选得分最低的(反转)
+    :param min_score: 得分需要超过该值才会入选，没有子策略入选时空仓
+    :param c_rate: 调仓手续费率，按权重变化绝对值之和收取
+    :return:
+        equity 组合资金曲线，列与shift_evaluate、draw_shift_equity_curve_plotly一致：candle_begin_time、shift_pct、shift_equity、equity_name；
+        weights 每次调仓的目标权重，index为调仓时间，另含换手率turnover；
+        attribution 每个子策略的入选次数、持有周期数和收益贡献(每周期贡献之和)
+    '''
+    names = list(names)
+    n, m = returns.shape
+    top_k = min(top_k, m)
+    rebalance = np.arange(lookback, n - 1, hold)  # 调仓K线
+    if len(rebalance) == 0:
+        raise ValueError('数据长度不足以进行一次调仓')
+
+    # ===== 每次调仓的目标权重
+    s = rotation_score(returns, lookback, score)[rebalance]
+    if ascending:
+        s = -s
+    s = np.where(np.isnan(s), -np.inf, s)
+    chosen = np.argsort(-s, axis=1, kind='stable')[:, :top_k]
+    chosen_score = np.take_along_axis(s, chosen, axis=1)
+    selected = np.isfinite(chosen_score)
+    if min_score is not None:
+        selected &= (-chosen_score if ascending else chosen_score) > min_score
+    target = np.zeros((len(rebalance), m))
+    count = selected.sum(axis=1, keepdims=True)
+    np.put_along_axis(target, chosen, np.where(selected, 1 / np.maximum(count, 1), 0), axis=1)
+
+    # ===== 持有期间的净值
+    # 每根K线所属的持仓段，段k为rebalance[k]之后到下一次调仓(含)，第一次调仓之前空仓
+    seg = np.searchsorted(rebalance, np.arange(n), side='left') - 1
+    held = seg >= 0
+    growth = np.cumprod(1 + np.nan_to_num(returns), axis=0)  # 各子策略的累计净值
+    # 段内组合净值 = sum(目标权重 * 子策略净值 / 调仓时的子策略净值)
+    scaled = target / growth[rebalance]
+    bar_weight = np.zeros((n, m))
+    bar_weight[held] = scaled[seg[held]]
+    value = np.where(held, (bar_weight * growth).sum(axis=1), 1)
+    prev_growth = np.vstack([growth[:1], growth[:-1]])
+    prev_value = np.where(held, (bar_weight * prev_growth).sum(axis=1), 1)
+    cash = prev_value == 0  # 空仓的持仓段
+    value[cash] = 1
+    prev_value[cash] = 1
+
+    # ===== 换手和手续费：调仓前的权重为上一段漂移后的权重
+    end = np.append(rebalance[1:], n - 1)  # 每段的最后一根K线
+    drift = np.zeros_like(target)
+    drift[1:] = scaled[:-1] * growth[end[:-1]]
+    drift_total = drift.sum(axis=1, keepdims=True)
+    drift = np.divide(drift, drift_total, out=np.zeros_like(drift), where=drift_total > 0)
+    turnover = np.abs(target - drift).sum(axis=1)
+    cost = turnover * c_rate
+
+    # ===== 组合资金曲线
+    pct = value / prev_value - 1
+    first_bar = rebalance + 1  # 每段的第一根K线扣除调仓手续费
+    pct[first_bar] = (1 + pct[first_bar]) * (1 - cost) - 1
+    pct[~held] = 0
+    equity = pd.DataFrame({'candle_begin_time': times, 'shift_pct': pct})
+    equity['shift_equity'] = np.cumprod(1 + pct)
+    labels = np.array(['+'.join(names[j] for j in row[ok]) or '空仓' for row, ok in zip(chosen, selected)] + ['空仓'], dtype=object)
+    equity['equity_name'] = labels[seg]
+
+    weights = pd.DataFrame(target, index=pd.DatetimeIndex(times[rebalance], name='candle_begin_time'), columns=names)
+    weights['turnover'] = turnover
+
+    # ===== 收益贡献：每根K线各子策略贡献 = 期初权重 * 子策略涨跌幅，各子策略之和等于组合涨跌幅(不含手续费)
+    contribution = bar_weight * (growth - prev_growth) / prev_value[:, None]
+    attribution = pd.DataFrame({'入选次数': (target > 0).sum(axis=0),
+                                '持有周期数': (bar_weight > 0).sum(axis=0),
+                                '收益贡献': contribution.sum(axis=0)}, index=pd.Index(names, name='equity_name'))
+    attribution.sort_values('收益贡献', ascending=False, inplace=True)
+    return equity, weights, attribution
@@ -55,6 +55,121 @@ def transfer_equity_curve_to_trade(equity_curve):
     return trade
 
 
+# 回撤分析
+def drawdown_analysis(equity, times=None):
+    """
+    一次遍历计算回撤，替代expanding().max()加排序的写法
+    :param equity: 资金曲线，Series或数组
+    :param times: 与资金曲线对应的时间，默认使用equity的index
+    :return: dict
+        max_drawdown: 最大回撤，负数
+        peak_time: 最大回撤开始时间，即最大回撤之前的最高点
+        trough_time: 最大回撤结束时间，即最大回撤的最低点
+        recovery_time: 资金曲线重新回到该最高点的时间，尚未修复时为None
+        running_max: 每个时点之前资金曲线的最高点，即原来的max2here
+        drawdown: 每个时点的回撤，即原来的dd2here
+        episodes: 每一段回撤，包含start(最高点)、trough(最低点)、end(修复时间，未修复为NaT)、drawdown(该段最大回撤)、
+                  decline_bars(最高点到最低点的K线数)、recovery_bars(最低点到修复的K线数，未修复为NaN)、duration(持续时间)、recovered(是否已修复)
+    """
+    values = np.asarray(equity, dtype=float)
+    if times is None:
+        times = equity.index if isinstance(equity, pd.Series) else np.arange(len(values))
+    times = pd.Index(times)
+    n = len(values)
+    idx = np.arange(n)
+
+    # 当前时点之前的最高点，以及最近一次处于最高点的位置
+    running_max = np.maximum.accumulate(values)
+    drawdown = values / running_max - 1
+    at_high = values >= running_max
+    peak_idx = np.maximum.accumulate(np.where(at_high, idx, 0))
+
+    # 最大回撤：最低点为回撤最小的位置，最高点为最低点之前最近一次创新高的位置，修复为最低点之后第一次回到最高点的位置
+    trough = int(np.argmin(drawdown))
+    peak = int(peak_idx[trough])
+    recovered = np.flatnonzero(at_high[trough + 1:])
+    recovery = trough + 1 + int(recovered[0]) if len(recovered) else None
+
+    # 每一段回撤：连续处于最高点之下的区间
+    under = ~at_high
+    start_flag = under & np.r_[True, ~under[:-1]]
+    starts = np.flatnonzero(start_flag)
+    ends = np.flatnonzero(under & np.r_[~under[1:], True])  # 每段最后一根处于回撤中的K线
+    if len(starts):
+        seg_min = np.minimum.reduceat(drawdown, starts)
+        # 每段中第一次达到该段最大回撤的位置
+        seg_id = np.cumsum(start_flag) - 1
+        hit = np.flatnonzero(under & (drawdown == seg_min[seg_id]))
+        troughs = hit[np.r_[True, seg_id[hit][1:] != seg_id[hit][:-1]]]
+        peaks = starts - 1
+        is_recovered = ends + 1 < n
+        recoveries = np.where(is_recovered, ends + 1, n - 1)
+        episodes = pd.DataFrame({
+            'start': times[peaks],
+            'trough': times[troughs],
+            'end': pd.Series(times[recoveries]).where(is_recovered).values,
+            'drawdown': seg_min,
+            'decline_bars': troughs - peaks,
+            'recovery_bars': np.where(is_recovered, recoveries - troughs, np.nan),
+            'duration': times[recoveries] - times[peaks],
+            'recovered': is_recovered,
+        })
+    else:
+        episodes = pd.DataFrame(columns=['start', 'trough', 'end', 'drawdown', 'decline_bars', 'recovery_bars', 'duration', 'recovered'])
+
+    return {
+        'max_drawdown': drawdown[trough],
+        'peak_time': times[peak],
+        'trough_time': times[trough],
+        'recovery_time': times[recovery] if recovery is not None else None,
+        'running_max': running_max,
+        'drawdown': drawdown,
+        'episodes': episodes,
+    }
+
+
+# 按自然月、自然年计算复利收益
+def period_return(times, returns, freq='M'):
+    """
+    按年或月计算每个周期的复利收益，与resample(rule='M'/'A').apply(lambda x: (1 + x).prod() - 1)的结果一致，
+    将时间转为整数的年、月编码后，对log(1 + 收益)用np.add.reduceat分段求和，不需要对每个周期调用一次python函数
+    :param times: 时间，需按时间先后排列
+    :param returns: 每根K线的收益，空值视为0
+    :param freq: M表示按月，A表示按年
+    :return: Series，index为每个周期的最后一天(与resample的标签一致)，数据中间没有K线的周期收益为0
+    """
+    times = pd.DatetimeIndex(times)
+    if len(times) == 0:
+        return pd.Series([], index=pd.DatetimeIndex([]), dtype=float)
+    # 1970年起的月份数或年份数
+    codes = times.values.astype('datetime64[M]' if freq == 'M' else 'datetime64[Y]').astype(np.int64)
+    log_return = np.log1p(np.nan_to_num(np.asarray(returns, dtype=float)))
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    period = np.zeros(codes[-1] - codes[0] + 1)
+    period[codes[starts] - codes[0]] = np.expm1(np.add.reduceat(log_return, starts))
+
+    # 每个周期的最后一天，即下一个周期第一天的前一天
+    unit = 'datetime64[M]' if freq == 'M' else 'datetime64[Y]'
+    index = (np.arange(codes[0] + 1, codes[-1] + 2).astype(unit).astype('datetime64[D]') - np.timedelta64(1, 'D')).astype('datetime64[ns]')
+    return pd.Series(period, index=pd.DatetimeIndex(index, name=times.name))
+
+
+def month_return_table(month_return):
+    """
+    将period_return按月计算的收益直接整理为年 × 月的二维表
+    :param month_return: period_return(freq='M')的结果
+    :return: DataFrame，index为年份，columns为月份，没有数据的月份为空值
+    """
+    if month_return.empty:
+        return pd.DataFrame()
+    first, last = month_return.index[0], month_return.index[-1]
+    # 前后补齐到整年，再按12个月一行排列
+    values = np.r_[np.full(first.month - 1, np.nan), month_return.values, np.full(12 - last.month, np.nan)]
+    table = pd.DataFrame(values.reshape(-1, 12), index=pd.Index(range(first.year, last.year + 1), name='year'),
+                         columns=pd.Index(range(1, 13), name='month'))
+    return table.dropna(axis=1, how='all')
+
+
 # 计算策略评价指标
 def strategy_evaluate(equity_curve, trade, rule_type):
     """
@@ -88,19 +203,9 @@ def strategy_evaluate(equity_curve, trade, rule_type):
     results.loc[0, '年化收益'] = str(round(annual_return, 2))
 
     # ===计算最大回撤，最大回撤的含义：《如何通过3行代码计算最大回撤》https://mp.weixin.qq.com/s/Dwt4lkKR_PEnWRprLlvPVw
-    # 计算当日之前的资金曲线的最高点
-    equity_curve['max2here'] = equity_curve['equity_curve'].expanding().max()
-    # 计算到历史最高值到当日的跌幅，drowdwon
-    equity_curve['dd2here'] = equity_curve['equity_curve'] / equity_curve['max2here'] - 1
-    # 计算最大回撤，以及最大回撤结束时间
-    end_date, max_draw_down = tuple(equity_curve.sort_values(by=['dd2here']).iloc[0][['candle_begin_time', 'dd2here']])
-    # 计算最大回撤开始时间
-    start_date = \
-        equity_curve[equity_curve['candle_begin_time'] <= end_date].sort_values(by='equity_curve',
-                                                                                ascending=False).iloc[0][
-            'candle_begin_time']
-    # 将无关的变量删除
-    equity_curve.drop(['max2here', 'dd2here'], axis=1, inplace=True)
+    # 计算最大回撤，以及最大回撤开始、结束时间
+    dd = drawdown_analysis(equity_curve['equity_curve'], equity_curve['candle_begin_time'])
+    max_draw_down, start_date, end_date = dd['max_drawdown'], dd['peak_time'], dd['trough_time']
     results.loc[0, '最大回撤'] = format(max_draw_down, '.2%')
     results.loc[0, '最大回撤开始时间'] = str(start_date)
     results.loc[0, '最大回撤结束时间'] = str(end_date)
@@ -148,7 +253,7 @@ def strategy_evaluate(equity_curve, trade, rule_type):
 
     # ===每月收益率
     equity_curve.set_index('candle_begin_time', inplace=True)
-    monthly_return = equity_curve[['equity_change']].resample(rule='M').apply(lambda x: (1 + x).prod() - 1)
+    monthly_return = period_return(equity_curve.index, equity_curve['equity_change'], 'M').to_frame('equity_change')
 
     # ===平均月化收益
     monthly_return_mean = (total_return ** (30 / time_difference_in_days)) - 1
@@ -170,12 +275,11 @@ def return_drawdown_ratio(equity_curve):
             equity_curve['candle_begin_time'].iloc[-1] - equity_curve['candle_begin_time'].iloc[0]) * 365) - 1
 
     # ===计算最大回撤，最大回撤的含义：《如何通过3行代码计算最大回撤》https://mp.weixin.qq.com/s/Dwt4lkKR_PEnWRprLlvPVw
-    # 计算当日之前的资金曲线的最高点
-    equity_curve['max2here'] = equity_curve['equity_curve'].expanding().max()
-    # 计算到历史最高值到当日的跌幅，drowdwon
-    equity_curve['dd2here'] = equity_curve['equity_curve'] / equity_curve['max2here'] - 1
-    # 计算最大回撤，以及最大回撤结束时间
-    end_date, max_draw_down = tuple(equity_curve.sort_values(by=['dd2here']).iloc[0][['candle_begin_time', 'dd2here']])
+    dd = drawdown_analysis(equity_curve['equity_curve'], equity_curve['candle_begin_time'])
+    # 保留当日之前的资金曲线最高点和到当日的跌幅
+    equity_curve['max2here'] = dd['running_max']
+    equity_curve['dd2here'] = dd['drawdown']
+    max_draw_down = dd['max_drawdown']
 
     # ===年化收益/回撤比
     sharpe = annual_return / abs(max_draw_down)
@@ -211,16 +315,12 @@ def shift_evaluate(equity, net_col='shift_equity', pct_col='shift_pct'):
     results.loc[0, '年化收益'] = str(round(annual_return, 2))
 
     # ===计算回撤
-    # 计算当日之前的资金曲线的最高点
-    equity['max2here'] = equity[net_col].expanding().max()
-    # 计算到历史最高值到当日的跌幅，drowdwon
-    equity['dd2here'] = equity[net_col] / equity['max2here'] - 1
-    # 计算最大回撤，以及最大回撤结束时间
-    end_date, max_draw_down = tuple(equity.sort_values(by=['dd2here']).iloc[0][['candle_begin_time', 'dd2here']])
-    # 计算最大回撤开始时间
-    start_date = equity[equity['candle_begin_time'] <= end_date].sort_values(by=net_col, ascending=False).iloc[0]['candle_begin_time']
-    # 将无关的变量删除
-    # temp.drop(['max2here', 'dd2here'], axis=1, inplace=True)
+    dd = drawdown_analysis(equity[net_col], equity['candle_begin_time'])
+    # 当日之前的资金曲线的最高点，以及到历史最高值到当日的跌幅
+    equity['max2here'] = dd['running_max']
+    equity['dd2here'] = dd['drawdown']
+    # 最大回撤，以及最大回撤开始、结束时间
+    max_draw_down, start_date, end_date = dd['max_drawdown'], dd['peak_time'], dd['trough_time']
     results.loc[0, '最大回撤'] = num_to_pct(max_draw_down)
     results.loc[0, '最大回撤开始时间'] = str(start_date)
     results.loc[0, '最大回撤结束时间'] = str(end_date)
@@ -247,10 +347,8 @@ def shift_evaluate(equity, net_col='shift_equity', pct_col='shift_pct'):
     results.loc[0, '收益率标准差'] = num_to_pct(equity[pct_col].std())
 
     # ===每年、每月收益率
-    temp = equity.copy()
-    temp.set_index('candle_begin_time', inplace=True)
-    year_return = temp[[pct_col]].resample(rule='A').apply(lambda x: (1 + x).prod() - 1)
-    month_return = temp[[pct_col]].resample(rule='M').apply(lambda x: (1 + x).prod() - 1)
+    year_return = period_return(equity['candle_begin_time'], equity[pct_col], 'A').to_frame(pct_col)
+    month_return = period_return(equity['candle_begin_time'], equity[pct_col], 'M')
 
     def num2pct(x):
         if str(x) != 'nan':
@@ -261,12 +359,7 @@ def shift_evaluate(equity, net_col='shift_equity', pct_col='shift_pct'):
     year_return['涨跌幅'] = year_return[pct_col].apply(num2pct)
 
     # 对每月收益进行处理，做成二维表
-    month_return.reset_index(inplace=True)
-    month_return['year'] = month_return['candle_begin_time'].dt.year
-    month_return['month'] = month_return['candle_begin_time'].dt.month
-    month_return.set_index(['year', 'month'], inplace=True)
-    del month_return['candle_begin_time']
-    month_return_all = month_return[pct_col].unstack()
+    month_return_all = month_return_table(month_return)
     month_return_all.loc['mean'] = month_return_all.mean(axis=0)
     month_return_all = month_return_all.apply(lambda x: x.apply(num2pct))
 
@@ -277,4 +370,95 @@ def shift_substg_evaluate(equity, net_col='shift_equity', pct_col='shift_pct'):
     计算每个
     '''
 
-    return
\ No newline at end of file
+    return
+
+
+# ===== 批量评价 =========
+def _max_streak(flag):
+    """
+    按列计算布尔矩阵中连续为True的最大长度
+    """
+    flag = np.asfortranarray(flag)
+    count = np.cumsum(flag, axis=0)
+    # 每次中断时的累计值，之后的累计值减去它就是当前连续的长度
+    reset = np.maximum.accumulate(np.where(flag, 0, count), axis=0)
+    return (count - reset).max(axis=0) if len(flag) else np.zeros(flag.shape[1], dtype=np.int64)
+
+
+def evaluate_matrix(times, equity_2d, names=None, periods_per_year=None, chunk_size=512):
+    """
+    批量计算多条资金曲线的评价指标，每一列为一条资金曲线，按列分块计算，可以直接传入np.memmap或np.load(..., mmap_mode='r')的矩阵，
+    每次只有chunk_size列读入内存。资金曲线中的空值视为该曲线在这些时间没有数据(例如上线较晚的币种)
+    :param times: 资金曲线对应的时间，长度与equity_2d的行数相同
+    :param equity_2d: 资金曲线矩阵，形状为(K线数量, 曲线数量)
+    :param names: 每条曲线的名称，作为结果的index，默认为列序号
+    :param periods_per_year: 每年的K线数量，用于年化波动率、夏普、索提诺，默认根据times的间隔推算
+    :param chunk_size: 每次计算的列数
+    :return: DataFrame，每行为一条曲线，包含
+        final_equity 最终净值(相对第一个有效值)、annual_return 年化收益、max_drawdown 最大回撤(负数)、
+        return_drawdown_ratio 年化收益/回撤比、volatility 年化波动率、sharpe 夏普比率、sortino 索提诺比率、
+        var_95 单周期95%VaR、cvar_95 单周期95%CVaR、win_rate 盈利周期占比、max_win_streak / max_loss_streak 最大连续盈利/亏损周期数
+    """
+    times = pd.DatetimeIndex(times)
+    n, m = equity_2d.shape
+    if names is None:
+        names = np.arange(m)
+    if periods_per_year is None:
+        step = np.median(np.diff(times.values).astype('timedelta64[s]').astype(float)) if n > 1 else np.nan
+        periods_per_year = 365 * 24 * 60 * 60 / step
+
+    columns = ['final_equity', 'annual_return', 'max_drawdown', 'return_drawdown_ratio', 'volatility', 'sharpe', 'sortino',
+               'var_95', 'cvar_95', 'win_rate', 'max_win_streak', 'max_loss_streak']
+    result = {c: np.full(m, np.nan) for c in columns}
+    time_values = times.values
+    for left in range(0, m, chunk_size):
+        right = min(left + chunk_size, m)
+        # 转为按列存储，沿时间方向的累计计算是连续内存访问
+        equity = np.asfortranarray(equity_2d[:, left:right], dtype=float)
+        valid = ~np.isnan(equity)
+        has_data = valid.any(axis=0)
+        cols = np.arange(equity.shape[1])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # === 收益：首个有效值到最后一个有效值，与strategy_evaluate一样按整天数年化
+            first = valid.argmax(axis=0)
+            last = n - 1 - valid[::-1].argmax(axis=0)
+            total_return = equity[last, cols] / equity[first, cols]
+            days = ((time_values[last] - time_values[first]) / np.timedelta64(1, 'D')).astype(np.int64)
+            annual_return = total_return ** (365 / days) - 1
+
+            # === 最大回撤
+            running_max = np.fmax.accumulate(equity, axis=0)
+            max_drawdown = np.nanmin(equity / running_max - 1, axis=0) if n else np.full(len(cols), np.nan)
+
+            # === 每周期收益
+            pct = equity[1:] / equity[:-1] - 1
+            pct_valid = ~np.isnan(pct)
+            count = pct_valid.sum(axis=0)
+            mean = np.nanmean(pct, axis=0)
+            std = np.nanstd(pct, axis=0, ddof=1)
+            downside = np.sqrt(np.nansum(np.minimum(pct, 0) ** 2, axis=0) / count)
+            # nanquantile逐列计算，很慢，没有空值时直接用quantile
+            var_95 = np.quantile(pct, 0.05, axis=0) if pct_valid.all() else np.nanquantile(pct, 0.05, axis=0)
+            cvar_95 = np.nanmean(np.where(pct <= var_95, pct, np.nan), axis=0)
+
+            result['final_equity'][left:right] = total_return
+            result['annual_return'][left:right] = annual_return
+            result['max_drawdown'][left:right] = max_drawdown
+            result['return_drawdown_ratio'][left:right] = annual_return / np.abs(max_drawdown)
+            result['volatility'][left:right] = std * np.sqrt(periods_per_year)
+            result['sharpe'][left:right] = mean * periods_per_year / (std * np.sqrt(periods_per_year))
+            result['sortino'][left:right] = mean * periods_per_year / (downside * np.sqrt(periods_per_year))
+            result['var_95'][left:right] = var_95
+            result['cvar_95'][left:right] = cvar_95
+            result['win_rate'][left:right] = (pct > 0).sum(axis=0) / count
+            result['max_win_streak'][left:right] = _max_streak(pct > 0)
+            result['max_loss_streak'][left:right] = _max_streak(pct < 0)
+
+        # 没有任何数据的曲线，指标全部为空
+        for c in columns:
+            result[c][left:right][~has_data] = np.nan
+
+    df = pd.DataFrame(result, index=pd.Index(names, name='name'), columns=columns)
+    df[['max_win_streak', 'max_loss_streak']] = df[['max_win_streak', 'max_loss_streak']].astype('Int64')
+    return df
@@ -1,5 +1,12 @@
+import os
+import json
 import time
+import inspect
+from glob import glob
+from contextlib import contextmanager
 from functools import wraps
+import pandas as pd
+from config import root_path, profile_mode
 
 def get_list_dimension(lst):
     '''
@@ -23,4 +30,109 @@ def timing_decorator(func):
         duration = end_time - start_time  # 计算运行时间
         print(f"函数'{func.__name__}'花费了{duration:.4f}秒完成.")
         return result
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+# ===== 分阶段耗时统计
+# 开启config中的profile_mode后，按任务记录各阶段的耗时和调用次数
+# 每个任务结束时追加写入data/output/profile下以进程号命名的jsonl文件，由主进程汇总所有进程的记录
+profile_path = os.path.join(root_path, 'data/output/profile')
+_stage_records = {}  # 当前任务各阶段的[累计耗时, 调用次数]
+
+
+@contextmanager
+def stage_timer(stage):
+    '''
+    记录一个阶段的耗时，未开启profile_mode时不做任何记录
+    :param stage: 阶段名称
+    '''
+    if not profile_mode:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = _stage_records.setdefault(stage, [0.0, 0])
+        record[0] += time.perf_counter() - start_time
+        record[1] += 1
+
+
+def flush_profile(factor, task):
+    '''
+    结束一个任务，将该任务各阶段的耗时写入当前进程的记录文件
+    :param factor: 策略名称，汇总时按策略分组
+    :param task: 任务描述，如币种、周期、参数
+    '''
+    if not profile_mode or not _stage_records:
+        return
+    os.makedirs(profile_path, exist_ok=True)
+    line = json.dumps({'pid': os.getpid(), 'factor': factor, 'task': str(task), 'stages': _stage_records}, ensure_ascii=False)
+    with open(os.path.join(profile_path, f'{os.getpid()}.jsonl'), 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+    _stage_records.clear()
+
+
+def profile_task(func):
+    '''
+    按任务统计耗时的装饰器：函数每执行一次记为一个任务，结束时写入该任务各阶段的耗时
+    策略名称取自signal_name参数，没有该参数时使用函数名；任务描述为除DataFrame以外的参数
+    '''
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profile_mode:
+                arguments = signature.bind_partial(*args, **kwargs).arguments
+                task = {k: v for k, v in arguments.items() if not isinstance(v, pd.DataFrame)}
+                flush_profile(arguments.get('signal_name', func.__name__), task)
+    return wrapper
+
+
+def reset_profile():
+    '''
+    清除尚未汇总的记录，避免上一次中断运行的记录混入本次统计
+    '''
+    if not profile_mode:
+        return
+    _stage_records.clear()
+    for file in glob(os.path.join(profile_path, '*.jsonl')):
+        os.remove(file)
+
+
+def report_profile(title):
+    '''
+    汇总所有进程的阶段耗时，输出汇总表，并保存为data/output/profile下的csv和json文件
+    :param title: 输出文件名
+    :return: 汇总表，每行为一个策略的一个阶段，没有记录时返回None
+    '''
+    if not profile_mode:
+        return None
+    rows = []
+    for file in glob(os.path.join(profile_path, '*.jsonl')):
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                for stage, (seconds, count) in record['stages'].items():
+                    rows.append((record['factor'], stage, record['pid'], record['task'], seconds, count))
+        os.remove(file)
+    if not rows:
+        return None
+
+    df = pd.DataFrame(rows, columns=['factor', 'stage', 'pid', 'task', 'seconds', 'count'])
+    summary = df.groupby(['factor', 'stage'], sort=False).agg(total_seconds=('seconds', 'sum'), calls=('count', 'sum'),
+                                                              tasks=('task', 'nunique'), workers=('pid', 'nunique'),
+                                                              max_task_seconds=('seconds', 'max')).reset_index()
+    summary['mean_task_seconds'] = summary['total_seconds'] / summary['tasks']
+    summary['share'] = summary['total_seconds'] / summary.groupby('factor')['total_seconds'].transform('sum')
+    print(f'===== 分阶段耗时：{title}')
+    print(summary.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+
+    summary.to_csv(os.path.join(profile_path, f'{title}.csv'), index=False, encoding='gbk')
+    with open(os.path.join(profile_path, f'{title}.json'), 'w', encoding='utf-8') as f:
+        json.dump({'title': title, 'summary': summary.to_dict(orient='records'),
+                   'tasks': df.to_dict(orient='records')}, f, ensure_ascii=False, indent=2)
+    return summary
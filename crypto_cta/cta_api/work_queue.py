@@ -0,0 +1,222 @@
+'''
+参数遍历任务队列
+协调进程把(策略, 币种, 周期, 回测区间, 一组参数)作为任务写入SQLite队列，任意台机器上的worker从队列领取任务，
+领取时获得一段时间的租约，计算过程中定时续约，完成时在同一个事务中写入遍历结果并标记任务完成。
+租约过期(worker退出或机器宕机)的任务会重新回到待领取状态。
+队列与结果库共用一个SQLite文件，支持的部署方式：
+  单机多进程：默认的WAL日志模式，数据库放在本地磁盘上
+  多台机器：数据库放在所有机器都能访问、且正确实现文件锁的共享存储上(如启用了锁的NFSv4、SMB)，
+          config.py中设置result_db_shared = True使用回滚日志(DELETE)，WAL不能用于网络文件系统；
+          没有可靠文件锁的存储(sshfs、网盘同步目录等)不支持，各机器的时钟需基本一致
+'''
+import json
+import time
+import uuid
+import pandas as pd
+from cta_api import result_store as store
+
+# 任务状态
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def check_backend(sweep_backend, use_result_store):
+    '''
+    检查遍历配置：任务队列模式的结果只写入结果库，不写csv，必须同时开启use_result_store，
+    否则4_strategy_evaluate.py会去读取从未写入的csv文件
+    '''
+    if sweep_backend == 'queue' and not use_result_store:
+        raise ValueError("sweep_backend = 'queue' 时遍历结果只写入结果库，需要在config.py中设置 use_result_store = True")
+
+
+def connect(path=None):
+    '''
+    打开队列(即结果库)，不存在时自动建表
+    :param path: 结果库路径，默认为result_store.result_db_path
+    :return: sqlite3连接
+    '''
+    conn = store.connect(path)
+    conn.execute('CREATE TABLE IF NOT EXISTS sweep_job (id INTEGER PRIMARY KEY AUTOINCREMENT, sweep TEXT, signal TEXT, symbol TEXT, '
+                 'leverage REAL, rule_type TEXT, period_start TEXT, period_end TEXT, paras TEXT, status TEXT, worker TEXT, token TEXT, '
+                 'lease_until REAL, attempts INTEGER DEFAULT 0, error TEXT, created REAL, finished REAL)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sweep_job_status ON sweep_job (status, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sweep_job_sweep ON sweep_job (sweep, status)')
+    return conn
+
+
+def enqueue(sweep, signal_name, symbol, leverage, rule_type, start, end, para_list, chunk_size=20, path=None):
+    '''
+    将一个回测区间的参数按chunk_size分组写入队列
+    :param sweep: 本次遍历的标识，用于等待和统计
+    :param start: 回测开始时间，保存为字符串，与run_playblack中回测区间的写法一致
+    :param end: 回测结束时间
+    :param para_list: 参数列表，相邻的参数放在同一个任务中，便于复用持仓相同的结果
+    :param chunk_size: 每个任务包含的参数数量
+    :return: 写入的任务数量
+    '''
+    now = time.time()
+    rows = []
+    for i in range(0, len(para_list), chunk_size):
+        paras = json.dumps(list(para_list[i: i + chunk_size]), default=lambda x: x.item())  # numpy数值转为python数值
+        rows.append((sweep, signal_name, symbol, float(leverage), rule_type, str(start), str(end), paras, PENDING, now))
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany('INSERT INTO sweep_job (sweep, signal, symbol, leverage, rule_type, period_start, period_end, paras, status, created) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def requeue_expired(conn):
+    '''
+    将租约已过期的任务重新放回待领取状态
+    :return: 放回的任务数量
+    '''
+    cur = conn.execute('UPDATE sweep_job SET status=?, worker=NULL, token=NULL WHERE status=? AND lease_until<?', (PENDING, LEASED, time.time()))
+    return cur.rowcount
+
+
+def lease(worker, lease_seconds=600, path=None):
+    '''
+    领取一个待计算的任务
+    :param worker: worker名称，记录在任务中便于排查
+    :param lease_seconds: 租约时长，超过该时间没有续约的任务会被其他worker重新领取
+    :return: 任务信息dict，paras已解析为参数列表，token用于续约和提交；没有可领取的任务时返回None
+    '''
+    token = uuid.uuid4().hex
+    conn = connect(path)
+    try:
+        with conn:
+            requeue_expired(conn)
+            # 单条UPDATE语句在SQLite中是原子的，多个worker同时领取时只有一个能拿到同一个任务
+            cur = conn.execute('UPDATE sweep_job SET status=?, worker=?, token=?, lease_until=?, attempts=attempts+1 '
+                               'WHERE id=(SELECT id FROM sweep_job WHERE status=? ORDER BY id LIMIT 1)',
+                               (LEASED, worker, token, time.time() + lease_seconds, PENDING))
+            if cur.rowcount == 0:
+                return None
+        cur = conn.execute('SELECT id, sweep, signal, symbol, leverage, rule_type, period_start, period_end, paras, attempts FROM sweep_job WHERE token=?', (token,))
+        columns = [d[0] for d in cur.description]
+        job = dict(zip(columns, cur.fetchone()))
+        job['paras'] = json.loads(job['paras'])
+        job['token'] = token
+        return job
+    finally:
+        conn.close()
+
+
+def heartbeat(job, lease_seconds=600, path=None):
+    '''
+    续约
+    :return: 是否仍持有该任务，租约已过期并被其他worker领取时返回False
+    '''
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.execute('UPDATE sweep_job SET lease_until=? WHERE id=? AND token=? AND status=?',
+                               (time.time() + lease_seconds, job['id'], job['token'], LEASED))
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def complete(job, result_df, path=None):
+    '''
+    提交任务：在同一个事务中写入遍历结果并标记完成，租约已失效时不写入，避免重复结果
+    :param job: lease返回的任务
+    :param result_df: 整理后的遍历结果，格式与result_store.append_results一致
+    :return: 是否提交成功
+    '''
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.execute('UPDATE sweep_job SET status=?, finished=?, error=NULL WHERE id=? AND token=? AND status=?',
+                               (DONE, time.time(), job['id'], job['token'], LEASED))
+            if cur.rowcount == 0:
+                return False
+            store.append_results(result_df, job['signal'], job['symbol'], job['leverage'], job['rule_type'], conn=conn)
+        return True
+    finally:
+        conn.close()
+
+
+def fail(job, error, max_attempts=3, path=None):
+    '''
+    任务计算出错，未超过最大尝试次数时放回队列，否则标记为失败
+    '''
+    status = FAILED if job['attempts'] >= max_attempts else PENDING
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute('UPDATE sweep_job SET status=?, error=?, worker=NULL, token=NULL WHERE id=? AND token=?',
+                         (status, str(error), job['id'], job['token']))
+    finally:
+        conn.close()
+
+
+def delete_jobs(signal_name, symbol, leverage, rule_type, path=None):
+    '''
+    删除指定策略、币种、杠杆、周期的全部任务，对应删除模式
+    :return: 删除的任务数量
+    '''
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.execute('DELETE FROM sweep_job WHERE signal=? AND symbol=? AND leverage=? AND rule_type=?',
+                               (signal_name, symbol, float(leverage), rule_type))
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def sweep_status(sweep=None, path=None):
+    '''
+    统计各状态的任务数量
+    :param sweep: 遍历标识，None表示全部任务
+    :return: {状态: 数量}
+    '''
+    conn = connect(path)
+    try:
+        with conn:
+            requeue_expired(conn)
+        sql, args = 'SELECT status, COUNT(*) FROM sweep_job', []
+        if sweep is not None:
+            sql, args = sql + ' WHERE sweep=?', [sweep]
+        counts = dict(conn.execute(sql + ' GROUP BY status', args).fetchall())
+        return {s: counts.get(s, 0) for s in (PENDING, LEASED, DONE, FAILED)}
+    finally:
+        conn.close()
+
+
+def wait_sweep(sweep, poll=10, path=None):
+    '''
+    等待一次遍历的全部任务完成，定时输出进度
+    :return: 最终各状态的任务数量
+    '''
+    last = None
+    while True:
+        status = sweep_status(sweep, path)
+        if status != last:
+            print(pd.Timestamp.now().strftime('%H:%M:%S'), '任务进度：', status)
+            last = status
+        if status[PENDING] == 0 and status[LEASED] == 0:
+            return status
+        time.sleep(poll)
+
+
+def failed_jobs(sweep=None, path=None):
+    '''
+    查看失败的任务及错误信息
+    '''
+    conn = connect(path)
+    try:
+        sql, args = 'SELECT id, sweep, signal, symbol, rule_type, period_start, period_end, paras, attempts, error FROM sweep_job WHERE status=?', [FAILED]
+        if sweep is not None:
+            sql, args = sql + ' AND sweep=?', args + [sweep]
+        cur = conn.execute(sql, args)
+        return pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+    finally:
+        conn.close()
@@ -0,0 +1,114 @@
+'''
+参数遍历任务队列的worker
+从任务队列(结果库中的sweep_job表)领取3_fastover.py写入的任务，计算后把结果写入结果库。
+可以在任意台共享同一个项目目录(数据和结果库)的机器上运行任意多个(多台机器时需设置result_db_shared = True)，计算过程中定时续约，
+进程退出或机器宕机后，租约过期的任务会被其他worker重新领取。
+
+用法：
+    python fastover_worker.py                   # 启动一个worker，队列为空后继续等待新任务
+    python fastover_worker.py -n 4 --exit-idle  # 本机启动4个worker，所有任务完成后退出
+'''
+import os
+import time
+import socket
+import argparse
+import threading
+import traceback
+import importlib
+from multiprocessing import Process, cpu_count
+import pandas as pd
+from config import *
+from cta_api import work_queue as wq
+
+fastover = importlib.import_module('3_fastover')
+
+
+def keep_lease(job, stop, lease_seconds):
+    '''
+    计算期间每隔三分之一租约时长续约一次，直到stop被设置或租约已被其他worker领取
+    '''
+    while not stop.wait(lease_seconds / 3):
+        if not wq.heartbeat(job, lease_seconds):
+            print(f"任务{job['id']}的租约已失效")
+            return
+
+
+def run_job(job, data_cache):
+    '''
+    计算一个任务中的所有参数，返回整理后的遍历结果
+    :param data_cache: 已读取的K线数据，{(周期, 币种): df}，同一个worker领取的任务大多是同一个币种，避免重复读取
+    '''
+    if job['leverage'] != float(leverage_rate):
+        raise ValueError(f"任务杠杆{job['leverage']}与本机config中的杠杆{leverage_rate}不一致")
+    key = (job['rule_type'], job['symbol'])
+    if key not in data_cache:
+        data_cache.clear()
+        data_cache[key] = pd.read_feather(os.path.join(data_path, job['rule_type'], job['symbol'] + '.pkl'))
+    df = data_cache[key]
+    min_amount = min_amount_dict[job['symbol']]
+    df_list = [fastover.calculate_by_one_loop(para, df=df, signal_name=job['signal'], symbol=job['symbol'], rule_type=job['rule_type'],
+                                              min_amount=min_amount, start=job['period_start'], end=job['period_end'])
+               for para in job['paras']]
+    para_curve_df = pd.concat(df_list, ignore_index=True)
+    return fastover.merge_base_result(para_curve_df, job['symbol'], job['rule_type'], job['period_start'], job['period_end'])
+
+
+def run_worker(exit_idle=False, poll=10, lease_seconds=queue_lease_seconds, max_attempts=3):
+    '''
+    循环领取并计算任务
+    :param exit_idle: 队列中没有待计算和计算中的任务时是否退出
+    :param poll: 没有可领取的任务时的等待时间(秒)
+    :param lease_seconds: 租约时长(秒)
+    :param max_attempts: 单个任务的最大尝试次数，超过后标记为失败
+    '''
+    worker = f'{socket.gethostname()}-{os.getpid()}'
+    data_cache = {}
+    print('worker启动：', worker)
+    while True:
+        job = wq.lease(worker, lease_seconds)
+        if job is None:
+            status = wq.sweep_status()
+            if exit_idle and status[wq.PENDING] == 0 and status[wq.LEASED] == 0:
+                print('没有待计算的任务，worker退出：', worker)
+                return
+            time.sleep(poll)
+            continue
+
+        print(worker, '领取任务：', job['id'], job['signal'], job['symbol'], job['rule_type'], job['period_start'], job['period_end'], '参数数量：', len(job['paras']))
+        stop = threading.Event()
+        lease_thread = threading.Thread(target=keep_lease, args=(job, stop, lease_seconds), daemon=True)
+        lease_thread.start()
+        try:
+            fastover._signal_cache.clear()
+            fastover._curve_cache.clear()
+            result_df = run_job(job, data_cache)
+            if not wq.complete(job, result_df):
+                print(f"任务{job['id']}的租约已失效，结果未写入")
+        except Exception:
+            print(f"任务{job['id']}计算出错")
+            traceback.print_exc()
+            wq.fail(job, traceback.format_exc(), max_attempts)
+        finally:
+            stop.set()
+            lease_thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='参数遍历任务队列worker')
+    parser.add_argument('-n', '--processes', type=int, default=1, help=f'本机启动的worker数量，本机CPU核数为{cpu_count()}')
+    parser.add_argument('--exit-idle', dest='exit_idle', action='store_true', help='队列中的任务全部完成后退出')
+    parser.add_argument('--poll', type=float, default=10, help='没有任务时的等待时间(秒)')
+    parser.add_argument('--lease', type=float, default=queue_lease_seconds, help='租约时长(秒)')
+    parser.add_argument('--max-attempts', dest='max_attempts', type=int, default=3, help='单个任务的最大尝试次数')
+    args = parser.parse_args()
+    wq.check_backend(sweep_backend, use_result_store)
+
+    kwargs = dict(exit_idle=args.exit_idle, poll=args.poll, lease_seconds=args.lease, max_attempts=args.max_attempts)
+    if args.processes == 1:
+        run_worker(**kwargs)
+    else:
+        workers = [Process(target=run_worker, kwargs=kwargs) for _ in range(args.processes)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
@@ -0,0 +1,37 @@
+'''
+报告worker
+读取计算进程保存的中间结果(data/output/artifact)，生成资金曲线csv和图表。
+可以在计算进行中在后台运行(--watch)，新的中间结果写入后即生成报告，也可以在计算完成后按需运行。
+
+用法：
+    python report_worker.py                    # 生成所有待处理的报告后退出
+    python report_worker.py -n 4 --watch       # 4个进程，持续检查新的中间结果
+    python report_worker.py --no-pic           # 只生成资金曲线csv
+'''
+import os
+import time
+import argparse
+from config import *
+from cta_api.report import render_reports
+from cta_api.evaluate import write_chart_index
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='报告worker')
+    parser.add_argument('-n', '--processes', type=int, default=report_processes, help='报告进程数量')
+    parser.add_argument('--watch', action='store_true', help='持续检查新的中间结果，不退出')
+    parser.add_argument('--poll', type=float, default=10, help='--watch时的检查间隔(秒)')
+    parser.add_argument('--no-csv', dest='csv', action='store_false', help='不生成资金曲线csv')
+    parser.add_argument('--no-pic', dest='pic', action='store_false', default=is_pic, help='不绘制资金曲线图')
+    parser.add_argument('--max-points', dest='max_points', type=int, default=pic_max_points, help='图表最大点数')
+    parser.add_argument('--keep', action='store_true', default=keep_artifacts, help='生成报告后保留中间结果')
+    args = parser.parse_args()
+
+    while True:
+        num = render_reports(processes=args.processes, csv=args.csv, pic=args.pic, max_points=args.max_points, keep=args.keep)
+        if num:
+            print(pd.Timestamp.now().strftime('%H:%M:%S'), '生成报告数量：', num)
+            if args.pic and os.path.exists(os.path.join(root_path, 'data/output/pic')):
+                write_chart_index(os.path.join(root_path, 'data/output/pic'), '资金曲线')
+        if not args.watch:
+            break
+        time.sleep(args.poll)
@@ -0,0 +1,48 @@
+'''
+参数稳健性评价的检查：para列为单参数的数值、字符串和列表时得到相同的网格和排名
+运行方式：python test_robustness.py
+'''
+import numpy as np
+import pandas as pd
+
+from cta_api.robustness import para_grid, robustness_score
+
+
+def make_results(para):
+    return pd.DataFrame({'para': para, '年化收益/回撤比': [0.5, 1.0, 2.0, 1.5],
+                         '回测区间': ['2021', '2021', '2021', '2021']})
+
+
+def test_one_dimension_para_types():
+    grids, scores = [], []
+    for para in ([2, 4, 6, 8], ['2', '4', '6', '8'], ['[2]', '[4]', '[6]', '[8]'], [[2], [4], [6], [8]]):
+        df = make_results(para)
+        axes, windows, grid = para_grid(df, '年化收益/回撤比')
+        assert len(axes) == 1 and list(axes[0]) == [2, 4, 6, 8]
+        grids.append(grid)
+        scores.append(robustness_score(df, radius=1))
+    for grid, score in zip(grids[1:], scores[1:]):
+        assert np.allclose(grid, grids[0], equal_nan=True)
+        pd.testing.assert_frame_equal(score, scores[0])
+
+
+def test_csv_int_para():
+    # use_result_store = False 时para列从CSV读回为int64
+    df = make_results(pd.Series([2, 4, 6, 8], dtype='int64'))
+    score = robustness_score(df, radius=1)
+    assert score['para'].tolist() == ['[8]', '[6]', '[4]', '[2]']
+
+
+def test_two_dimension_para_types():
+    str_df = make_results(['[10, 1]', '[10, 2]', '[20, 1]', '[20, 2]'])
+    list_df = make_results([[10, 1], [10, 2], [20, 1], [20, 2]])
+    axes, windows, grid = para_grid(str_df, '年化收益/回撤比')
+    assert grid.shape == (1, 2, 2)
+    pd.testing.assert_frame_equal(robustness_score(str_df), robustness_score(list_df))
+
+
+if __name__ == '__main__':
+    test_one_dimension_para_types()
+    test_csv_int_para()
+    test_two_dimension_para_types()
+    print('参数稳健性检查通过')
@@ -0,0 +1,93 @@
+'''
+参数遍历任务队列的检查：在临时目录中用模拟数据写入任务，本机启动多个fastover_worker进程领取计算，
+检查每个任务只完成一次、每个参数的结果只写入一次，以及租约过期的任务被其他worker重新领取
+运行方式：python test_work_queue.py
+'''
+import io
+import os
+import shutil
+import tempfile
+import importlib
+import multiprocessing
+from contextlib import redirect_stdout
+from config import leverage_rate
+from cta_api import result_store as store
+from cta_api import work_queue as wq
+from benchmark import bench_symbol, make_period_data, write_sweep_inputs
+
+signal_name = 'sma'
+rule_type = '1H'
+
+
+def worker_process(tmp_path, journal_mode, lease_seconds):
+    '''
+    worker进程：与fastover_worker.py相同的领取循环，数据、基准结果和结果库指向临时目录
+    '''
+    fw = importlib.import_module('fastover_worker')
+    fw.data_path = os.path.join(tmp_path, 'pickle_data')
+    fw.min_amount_dict = {bench_symbol: 0.001}
+    fw.fastover.root_path = tmp_path
+    store.result_db_path = os.path.join(tmp_path, 'para_result.db')
+    store.journal_mode = journal_mode
+    with redirect_stdout(io.StringIO()):
+        fw.run_worker(exit_idle=True, poll=0.2, lease_seconds=lease_seconds)
+
+
+def run_queue(journal_mode, workers=3, n_para=16, chunk_size=2):
+    tmp_path = tempfile.mkdtemp(prefix='cta_queue_test_')
+    old_db_path, old_journal_mode = store.result_db_path, store.journal_mode
+    try:
+        store.result_db_path = os.path.join(tmp_path, 'para_result.db')
+        store.journal_mode = journal_mode
+        df = make_period_data(1500, rule_type, kline_pct=False)
+        write_sweep_inputs(tmp_path, df, rule_type)
+        start, end = str(df['candle_begin_time'].iloc[0]), str(df['candle_begin_time'].iloc[-1])
+        paras = list(range(2, 2 + 2 * n_para, 2))
+        job_num = wq.enqueue('test', signal_name, bench_symbol, leverage_rate, rule_type, start, end, paras, chunk_size=chunk_size)
+
+        # 模拟领取任务后宕机的worker：租约1秒，之后不再续约
+        crashed = wq.lease('crashed-worker', lease_seconds=1)
+
+        ctx = multiprocessing.get_context('spawn')
+        processes = [ctx.Process(target=worker_process, args=(tmp_path, journal_mode, 60)) for _ in range(workers)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join(300)
+        assert all(p.exitcode == 0 for p in processes), [p.exitcode for p in processes]
+
+        # 每个任务都完成了，且只完成一次
+        assert wq.sweep_status('test') == {wq.PENDING: 0, wq.LEASED: 0, wq.DONE: job_num, wq.FAILED: 0}
+        conn = wq.connect()
+        try:
+            status, worker, attempts = conn.execute('SELECT status, worker, attempts FROM sweep_job WHERE id=?', (crashed['id'],)).fetchone()
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0].upper() == journal_mode
+        finally:
+            conn.close()
+        # 租约过期的任务由其他worker重新领取
+        assert status == wq.DONE and worker != 'crashed-worker' and attempts == 2
+
+        # 每个参数的结果只写入一次，宕机的worker恢复后提交的结果不会写入
+        result = store.load_results(signal_name, bench_symbol, leverage_rate, rule_type)
+        assert not wq.complete(crashed, result)
+        result = store.load_results(signal_name, bench_symbol, leverage_rate, rule_type)
+        assert sorted(result['para']) == sorted(str(p) for p in paras), result['para'].tolist()
+    finally:
+        store.result_db_path, store.journal_mode = old_db_path, old_journal_mode
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def test_queue_local():
+    # 单机：WAL日志模式
+    run_queue('WAL')
+
+
+def test_queue_shared_storage():
+    # 多台机器共享存储时使用的回滚日志
+    run_queue('DELETE')
+
+
+if __name__ == '__main__':
+    test_queue_local()
+    test_queue_shared_storage()
+    print('任务队列检查通过')